@@ -0,0 +1,68 @@
+"""Archiving departed travel options: rows moved per second, by chunk size.
+
+Loads ``--departures`` departed options with ``--bookings`` bookings each,
+and archives them with archive_departed at each of ``--chunk-sizes``,
+reloading them before every run.
+
+    python -m benchmarks.archive --departures 5000 --bookings 10
+"""
+import argparse
+
+from benchmarks.common import setup_django, bench_user, Timer, report
+
+PREFIX = 'BENCH-ARCHIVE-'
+
+
+def load_rows(departures, bookings_per_departure):
+    from datetime import timedelta
+    from django.utils import timezone
+    from booking_app.models import (
+        ArchivedBooking, ArchivedTravelOption, Booking, Route, TravelOption)
+
+    ArchivedBooking.objects.filter(travel_option__travel_id__startswith=PREFIX).delete()
+    ArchivedTravelOption.objects.filter(travel_id__startswith=PREFIX).delete()
+    TravelOption.objects.filter(travel_id__startswith=PREFIX).delete()
+    user = bench_user()
+    route = Route.objects.for_names('Pune', 'Goa')
+    start = timezone.now() - timedelta(days=400)
+    options = TravelOption.objects.bulk_create([
+        TravelOption(
+            travel_id=f"{PREFIX}{i}", travel_type='bus', source='Pune', destination='Goa',
+            route=route, departure_datetime=start + timedelta(minutes=i),
+            arrival_datetime=start + timedelta(minutes=i, hours=8),
+            price=700, available_seats=40)
+        for i in range(departures)], batch_size=5000)
+    batch = []
+    for option in options:
+        for j in range(bookings_per_departure):
+            batch.append(Booking(
+                booking_id=f"{PREFIX}{option.pk}-{j}", user=user, travel_option=option,
+                number_of_seats=1, total_price=700))
+        if len(batch) >= 5000:
+            Booking.objects.bulk_create(batch)
+            batch = []
+    Booking.objects.bulk_create(batch)
+    return start + timedelta(minutes=departures)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--departures', type=int, default=5000)
+    parser.add_argument('--bookings', type=int, default=10)
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from booking_app.archive import archive_departed
+
+    for chunk_size in args.chunk_sizes:
+        cutoff = load_rows(args.departures, args.bookings)
+        with Timer() as timer:
+            options, bookings = archive_departed(cutoff, chunk_size)
+        report('archive', chunk_size=chunk_size, travel_options=options, bookings=bookings,
+               seconds=round(timer.elapsed, 3),
+               rows_per_second=round((options + bookings) / timer.elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Concurrent read requests through the WSGI (sync views) and ASGI (async views) stacks
+
+Every database statement is delayed by --latency-ms to stand in for a slow
+or remote database. The WSGI run pushes all requests at a pool of
+--wsgi-threads threads (the request slots gunicorn would have); the ASGI run
+hands them all to the event loop at once. Each mode runs in its own process
+because ASYNC_VIEWS is read when the URLconf is imported.
+
+    python -m benchmarks.asgi_vs_wsgi --concurrency 500 --latency-ms 20
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BASE_DIR, setup_django, hot_travel_option, report
+
+
+def slow_database(latency):
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+
+
+def run_wsgi(path, concurrency, threads):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+    url_path, _, query = path.partition('?')
+
+    def request(start):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': url_path, 'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+            'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+        }
+        statuses = []
+        body = b''.join(handler(environ, lambda status, headers: statuses.append(status)))
+        return statuses[0].startswith('200') and bool(body), time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(request, [start] * concurrency))
+    return results, time.perf_counter() - start
+
+
+def run_asgi(path, concurrency):
+    from django.core.handlers.asgi import ASGIHandler
+
+    handler = ASGIHandler()
+    url_path, _, query = path.partition('?')
+
+    async def request(start):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': url_path, 'root_path': '',
+            'query_string': query.encode(), 'headers': [(b'host', b'localhost')],
+            'server': ('localhost', 80), 'client': ('127.0.0.1', 50000),
+        }
+        messages = []
+        requested, finished = False, asyncio.Event()
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body'):
+                finished.set()
+
+        await handler(scope, receive, send)
+        ok = messages[0]['status'] == 200 and any(m.get('body') for m in messages[1:])
+        return ok, time.perf_counter() - start
+
+    async def run():
+        start = time.perf_counter()
+        results = await asyncio.gather(*(request(start) for _ in range(concurrency)))
+        return results, time.perf_counter() - start
+
+    return asyncio.run(run())
+
+
+def child(args):
+    setup_django()
+    hot_travel_option('BENCHASGI', seats=100)
+    slow_database(args.latency_ms / 1000)
+
+    if args.mode == 'asgi':
+        results, elapsed = run_asgi(args.path, args.concurrency)
+    else:
+        results, elapsed = run_wsgi(args.path, args.concurrency, args.wsgi_threads)
+
+    latencies = sorted(latency for _, latency in results)
+    report(
+        f'asgi_vs_wsgi.{args.mode}',
+        path=args.path,
+        concurrency=args.concurrency,
+        latency_ms=args.latency_ms,
+        threads=args.wsgi_threads if args.mode == 'wsgi' else None,
+        errors=sum(1 for ok, _ in results if not ok),
+        requests_per_s=round(len(results) / elapsed, 1),
+        p50_ms=round(statistics.median(latencies) * 1000, 1),
+        p99_ms=round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+        max_ms=round(latencies[-1] * 1000, 1),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--wsgi-threads', type=int, default=8)
+    parser.add_argument('--path', default='/travel/?source=Mumbai&destination=Delhi')
+    parser.add_argument('--mode', choices=['wsgi', 'asgi'])
+    args = parser.parse_args()
+
+    if args.mode:
+        return child(args)
+    for mode in ('wsgi', 'asgi'):
+        env = dict(os.environ, ASYNC_VIEWS='1' if mode == 'asgi' else '0',
+                   SEARCH_CACHE_ENABLED='0')
+        subprocess.run([sys.executable, '-m', 'benchmarks.asgi_vs_wsgi', '--mode', mode,
+                        *sys.argv[1:]], env=env, cwd=BASE_DIR, check=True)
+
+
+if __name__ == '__main__':
+    main()
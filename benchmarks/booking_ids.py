@@ -0,0 +1,77 @@
+"""Throughput and uniqueness check for booking id generation.
+
+Issues ids from several threads and several processes (each process gets
+its own worker id, like gunicorn workers) and reports ids/sec plus any
+duplicates found.
+
+    python -m benchmarks.booking_ids --count 200000 --processes 4
+"""
+import argparse
+import multiprocessing
+import sys
+import threading
+
+from benchmarks.common import setup_django, Timer, report
+
+
+def issue_ids(count, worker_id=None):
+    from booking_app.ids import IdGenerator
+
+    generator = IdGenerator(worker_id=worker_id)
+    return [generator.next_id(prefix='BK') for _ in range(count)]
+
+
+def process_worker(args):
+    setup_django()
+    count, worker_id = args
+    return issue_ids(count, worker_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from booking_app.ids import IdGenerator
+
+    with Timer() as timer:
+        ids = issue_ids(args.count)
+    report('booking_ids_single_thread', ids=len(ids), duplicates=len(ids) - len(set(ids)),
+           ids_per_sec=round(len(ids) / timer.elapsed))
+
+    generator = IdGenerator()
+    per_thread = args.count // args.threads
+    batches = [[] for _ in range(args.threads)]
+
+    def run(batch):
+        batch.extend(generator.next_id(prefix='BK') for _ in range(per_thread))
+
+    threads = [threading.Thread(target=run, args=(batch,)) for batch in batches]
+    with Timer() as timer:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    ids = [booking_id for batch in batches for booking_id in batch]
+    report('booking_ids_threads', threads=args.threads, ids=len(ids),
+           duplicates=len(ids) - len(set(ids)),
+           ids_per_sec=round(len(ids) / timer.elapsed))
+
+    per_process = args.count // args.processes
+    with Timer() as timer:
+        with multiprocessing.Pool(args.processes) as pool:
+            batches = pool.map(
+                process_worker, [(per_process, worker_id) for worker_id in range(args.processes)])
+    ids = [booking_id for batch in batches for booking_id in batch]
+    duplicates = len(ids) - len(set(ids))
+    report('booking_ids_processes', processes=args.processes, ids=len(ids),
+           duplicates=duplicates, ids_per_sec=round(len(ids) / timer.elapsed),
+           sample=ids[0])
+    return 1 if duplicates else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
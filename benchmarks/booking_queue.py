@@ -0,0 +1,128 @@
+"""Hot-sale throughput: direct seat reservation vs the booking queue.
+
+Client processes fire bookings at one departure, either straight through
+``reserve_seats`` (every request updates the seat counter) or through
+``enqueue_booking`` with ``manage.py process_booking_queue`` running as a
+separate worker process that confirms them in batches. Reports how long
+clients waited per request and how fast bookings were resolved, and checks
+that no seat was sold twice.
+
+    python -m benchmarks.booking_queue --clients 8 --requests 200 --seats 1000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import BASE_DIR, setup_django, bench_user, hot_travel_option, Timer, report
+
+TRAVEL_ID = 'BENCH-QUEUE-1'
+
+
+def client(mode, travel_option_id, requests, max_seats_per_booking, results):
+    setup_django()
+    from django.db import connections, DatabaseError
+    from booking_app.models import TravelOption
+    from booking_app.services import enqueue_booking, reserve_seats, SoldOut
+
+    connections.close_all()
+    book = enqueue_booking if mode == 'queued' else reserve_seats
+    user = bench_user()
+    latencies, errors = [], 0
+    for _ in range(requests):
+        # A fresh row per request, as the view loads it.
+        travel_option = TravelOption.objects.get(pk=travel_option_id)
+        start = time.perf_counter()
+        try:
+            book(user, travel_option, random.randint(1, max_seats_per_booking))
+        except SoldOut:
+            pass
+        except DatabaseError:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    connections.close_all()
+    results.put((latencies, errors))
+
+
+def run(mode, args):
+    from django.db import connections
+    from django.db.models import Count, Sum
+    from booking_app.models import Booking
+
+    travel_option = hot_travel_option(TRAVEL_ID, args.seats, queue_bookings=mode == 'queued')
+    connections.close_all()
+
+    worker = None
+    if mode == 'queued':
+        worker = subprocess.Popen(
+            [sys.executable, 'manage.py', 'process_booking_queue',
+             '--interval', '0.01', '--batch-size', str(args.batch_size)],
+            cwd=BASE_DIR, env=os.environ.copy(), stdout=subprocess.DEVNULL)
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=client,
+            args=(mode, travel_option.pk, args.requests, args.max_seats_per_booking, results))
+        for _ in range(args.clients)
+    ]
+    with Timer() as timer:
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        bookings = Booking.objects.filter(travel_option=travel_option)
+        while bookings.filter(status='pending').exists():
+            if worker.poll() is not None:
+                raise SystemExit('process_booking_queue exited early')
+            time.sleep(0.01)
+    if worker is not None:
+        worker.terminate()
+        worker.wait()
+
+    travel_option.refresh_from_db()
+    counts = dict(bookings.values_list('status').annotate(n=Count('id')).order_by())
+    seats_sold = bookings.filter(status='confirmed').aggregate(
+        total=Sum('number_of_seats'))['total'] or 0
+    latencies = sorted(latency for timings, _ in outcomes for latency in timings)
+    resolved = counts.get('confirmed', 0) + counts.get('rejected', 0)
+    report(
+        f'booking_queue.{mode}',
+        clients=args.clients,
+        requests=len(latencies),
+        confirmed=counts.get('confirmed', 0),
+        rejected=counts.get('rejected', 0),
+        seats_left=travel_option.available_seats,
+        oversold=seats_sold + travel_option.available_seats - args.seats,
+        errors=sum(errors for _, errors in outcomes),
+        seconds=round(timer.elapsed, 3),
+        requests_per_sec=round(len(latencies) / timer.elapsed, 1),
+        bookings_resolved_per_sec=round(resolved / timer.elapsed, 1),
+        p50_ms=round(statistics.median(latencies) * 1000, 2),
+        p99_ms=round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="Bookings per client.")
+    parser.add_argument('--seats', type=int, default=1000)
+    parser.add_argument('--max-seats-per-booking', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--mode', choices=['direct', 'queued', 'both'], default='both')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    bench_user()
+    for mode in (['direct', 'queued'] if args.mode == 'both' else [args.mode]):
+        run(mode, args)
+
+
+if __name__ == '__main__':
+    main()
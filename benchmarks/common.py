@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    """Make the project importable and configure Django for a benchmark script"""
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+
+    import django
+    django.setup()
+
+
+def bench_user(username='bench_user'):
+    """Return the user that benchmark bookings are made for"""
+    from django.contrib.auth.models import User
+
+    user, _ = User.objects.get_or_create(
+        username=username, defaults={'email': f'{username}@example.com'})
+    return user
+
+
+def hot_travel_option(travel_id, seats, **fields):
+    """Create (or reset) a single departure used as the contention target"""
+    from datetime import timedelta
+    from django.utils import timezone
+    from booking_app.models import TravelOption
+
+    TravelOption.objects.filter(travel_id=travel_id).delete()
+    departure = timezone.now() + timedelta(days=7)
+    defaults = {
+        'travel_type': 'train',
+        'source': 'Mumbai',
+        'destination': 'Delhi',
+        'departure_datetime': departure,
+        'arrival_datetime': departure + timedelta(hours=16),
+        'price': 1500,
+        'available_seats': seats,
+    }
+    defaults.update(fields)
+    return TravelOption.objects.create(travel_id=travel_id, **defaults)
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def report(name, **results):
+    """Print one benchmark result as a JSON line so runs can be diffed"""
+    print(json.dumps({'benchmark': name, **results}, default=str))
@@ -0,0 +1,63 @@
+"""Compare two benchmarks.load result files, action by action.
+
+Prints p50, p99 and throughput for both runs with the change in percent,
+and exits with status 1 if any action got slower (p50 or p99 up) or
+slower to serve (requests/s down) by more than --threshold percent, or
+made errors where the base run made none.
+
+    python -m benchmarks.compare base.json new.json --threshold 10
+"""
+import argparse
+import json
+
+METRICS = [('p50_ms', 1), ('p99_ms', 1), ('requests_per_s', -1)]
+
+
+def change(base, new):
+    return (new - base) / base * 100 if base else 0.0
+
+
+def compare(base, new, threshold):
+    """(table lines, regressions) for two load results."""
+    lines = [f"{'action':<16}" + ''.join(f'{name:>28}' for name, _ in METRICS) + f"{'errors':>10}"]
+    regressions = []
+    for action, old in base['actions'].items():
+        current = new['actions'].get(action)
+        if current is None:
+            continue
+        cells = []
+        for name, worse in METRICS:
+            delta = change(old[name], current[name])
+            cells.append(f'{old[name]:>9} -> {current[name]:>9} {delta:+6.1f}%')
+            if delta * worse > threshold:
+                regressions.append(f'{action} {name} {delta:+.1f}%')
+        if current['errors'] and not old['errors']:
+            regressions.append(f"{action} {current['errors']} errors")
+        lines.append(f'{action:<16}' + ''.join(f'{cell:>28}' for cell in cells)
+                     + f"{old['errors']:>4} -> {current['errors']}")
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10)
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    for key in ('tier', 'users', 'seed'):
+        if base.get(key) != new.get(key):
+            print(f'warning: {key} differs ({base.get(key)} vs {new.get(key)})')
+    lines, regressions = compare(base, new, args.threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print('Regressions: ' + '; '.join(regressions))
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Per-request cost of opening a connection vs checking one out of the pool.
+
+Each simulated request runs one indexed query and then closes its
+connection, as Django does at the end of a request with CONN_MAX_AGE=0.
+SQLite stands in for MySQL; --connect-ms adds the TCP + auth handshake a
+real MySQL connect costs (about 1-5ms on a LAN, more with TLS).
+
+    python -m benchmarks.connection_pool --connect-ms 3 --threads 8
+"""
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+
+from benchmarks.common import setup_django, report
+
+
+def simulate_handshake(connect_ms):
+    from django.db.backends.sqlite3 import base
+
+    connect = base.Database.connect
+
+    def slow_connect(*args, **kwargs):
+        time.sleep(connect_ms / 1000)
+        return connect(*args, **kwargs)
+
+    base.Database.connect = slow_connect
+
+
+def run(wrapper_for, threads, requests):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        conn = wrapper_for()
+        timings = []
+        for i in range(requests):
+            start = time.perf_counter()
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT value FROM bench WHERE id = %s', [i % 1000])
+                cursor.fetchone()
+            conn.close()
+            timings.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(timings)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests_per_s': round(len(latencies) / elapsed),
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connect-ms', type=float, default=3)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--pool-size', type=int, default=8)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db.utils import ConnectionHandler
+
+    directory = tempfile.TemporaryDirectory()
+    name = f'{directory.name}/bench.sqlite3'
+    handler = ConnectionHandler({
+        'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name},
+        'pooled': {'ENGINE': 'booking_app.backends.sqlite3', 'NAME': name,
+                   'POOL': {'MAX_SIZE': args.pool_size}},
+    })
+    with handler['default'].cursor() as cursor:
+        cursor.execute('CREATE TABLE bench (id integer primary key, value text)')
+        cursor.executemany('INSERT INTO bench VALUES (%s, %s)',
+                           [(i, f'row {i}') for i in range(1000)])
+    handler['default'].close()
+    simulate_handshake(args.connect_ms)
+
+    for alias in ('default', 'pooled'):
+        # Django connections are per thread, so each worker gets its own wrapper.
+        results = run(lambda: handler.create_connection(alias), args.threads, args.requests)
+        extra = {}
+        if alias == 'pooled':
+            extra = handler['pooled'].pool.stats()
+        report(f"connection_pool.{'pooled' if alias == 'pooled' else 'connect_per_request'}",
+               connect_ms=args.connect_ms, threads=args.threads, **results, **extra)
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    main()
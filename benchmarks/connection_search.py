@@ -0,0 +1,86 @@
+"""Connection search latency on a large in-memory timetable.
+
+Builds a ConnectionIndex straight from generated rows (``--departures``
+over ``--cities`` cities and 30 days, no database needed), then times
+earliest-arrival searches with up to two changes between random city
+pairs, and the incremental seat update and move the index applies from
+``updated_at``.
+
+    python -m benchmarks.connection_search --departures 1000000
+"""
+import argparse
+import random
+import statistics
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.common import setup_django, Timer, report
+
+TYPES = ['bus', 'train', 'flight']
+
+
+def generate(departures, cities, seed):
+    rng = random.Random(seed)
+    start = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    for pk in range(1, departures + 1):
+        origin = rng.randrange(cities)
+        destination = (origin + rng.randrange(1, cities)) % cities
+        departure = start + timedelta(minutes=rng.randrange(30 * 24 * 60))
+        travel_type = rng.choice(TYPES)
+        duration = {'bus': 300, 'train': 480, 'flight': 120}[travel_type]
+        yield (pk, origin, destination, departure,
+               departure + timedelta(minutes=rng.randrange(duration // 2, duration * 2)),
+               rng.randrange(0, 60), travel_type)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--departures', type=int, default=1_000_000)
+    parser.add_argument('--cities', type=int, default=500)
+    parser.add_argument('--searches', type=int, default=200)
+    parser.add_argument('--max-changes', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from booking_app.journeys import ConnectionIndex, KINDS
+
+    with Timer() as build:
+        index = ConnectionIndex(generate(args.departures, args.cities, args.seed))
+
+    layovers = [0] * len(KINDS)
+    for code, minutes in {'flight': 60, 'train': 15, 'bus': 15}.items():
+        layovers[KINDS[code]] = minutes * 60
+    rng = random.Random(args.seed + 1)
+    first = index.departures[0]
+    timings, found, legs = [], 0, []
+    for _ in range(args.searches):
+        origin, destination = rng.sample(range(args.cities), 2)
+        earliest = first + rng.randrange(25 * 24 * 3600)
+        with Timer() as timer:
+            result = index.journeys([origin], [destination], earliest, args.max_changes,
+                                    layovers, limit=1)
+        timings.append(timer.elapsed * 1000)
+        if result:
+            found += 1
+            legs.append(len(result[0]))
+    timings.sort()
+
+    rows = list(generate(1000, args.cities, args.seed))
+    with Timer() as seats:
+        index.update([row[:5] + (row[5] + 1,) + row[6:] for row in rows])
+    with Timer() as moves:
+        index.update([row[:3] + (row[3] + timedelta(hours=1), row[4] + timedelta(hours=1))
+                      + row[5:] for row in rows[:100]])
+
+    report('connection_search', departures=len(index), cities=args.cities,
+           max_changes=args.max_changes, build_s=round(build.elapsed, 2),
+           searches=args.searches, found=found,
+           mean_legs=round(statistics.mean(legs), 2) if legs else None,
+           p50_ms=round(statistics.median(timings), 2),
+           p99_ms=round(timings[int(len(timings) * 0.99) - 1], 2),
+           seat_update_us=round(seats.elapsed / 1000 * 1e6, 1),
+           move_ms=round(moves.elapsed / 100 * 1000, 3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Seeded benchmark dataset: travel options, bookings and users at a scale tier.
+
+The same --seed, --tier and --start always write the same rows, so runs on
+different machines or branches load identical data. Tiers give the number of
+travel options and of bookings (one user per 100 bookings). Departures fall
+in the --days days after --start (today by default) so searches find them.
+Rows are written with batched INSERTs; --reset first removes an earlier
+dataset (travel ids starting with LOAD-).
+
+    python -m benchmarks.dataset --tier 10k --seed 1 --reset
+
+Every user's password is "loadtest"; see benchmarks/load.py.
+"""
+import argparse
+import random
+from datetime import datetime, time as day_start, timedelta, timezone as tz
+from decimal import Decimal
+
+from benchmarks.common import setup_django, Timer, report
+
+TIERS = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+PREFIX = 'LOAD-'
+PASSWORD = 'loadtest'
+BATCH_SIZE = 20_000
+CITIES = [
+    'Mumbai', 'Delhi', 'Bangalore', 'Chennai', 'Kolkata', 'Hyderabad',
+    'Pune', 'Ahmedabad', 'Jaipur', 'Lucknow', 'Kochi', 'Goa',
+    'Chandigarh', 'Bhopal', 'Indore', 'Nagpur', 'Surat', 'Varanasi',
+    'Patna', 'Bhubaneswar', 'Thiruvananthapuram', 'Guwahati', 'Amritsar',
+]
+TRAVEL_TYPES = [('flight', 2500, 1, 3), ('train', 800, 6, 20), ('bus', 450, 5, 14)]
+
+
+def user_count(rows):
+    return max(rows // 100, 100)
+
+
+def username(index):
+    return f'load{index:07d}'
+
+
+def travel_id(index):
+    return f'{PREFIX}{index:08d}'
+
+
+def booking_id(index):
+    return f'{PREFIX}B{index:09d}'
+
+
+def travel_option_rows(rng, count, start, days, routes):
+    """(travel_id, travel_type, source, destination, departure, arrival, price, seats, route_id)"""
+    for i in range(count):
+        source, destination, route_id = routes[rng.randrange(len(routes))]
+        travel_type, base_price, min_hours, max_hours = TRAVEL_TYPES[rng.randrange(3)]
+        departure = start + timedelta(minutes=rng.randrange(days * 24 * 60 // 5) * 5)
+        arrival = departure + timedelta(minutes=rng.randint(min_hours * 60, max_hours * 60))
+        price = (Decimal(base_price * rng.randint(80, 160)) / 100).quantize(Decimal('0.01'))
+        yield (travel_id(i), travel_type, source, destination, departure, arrival, str(price),
+               rng.randint(40, 400), route_id)
+
+
+def booking_rows(rng, count, options, users, start):
+    """(booking_id, user_id, travel_option_id, seats, total_price, booking_date, status)"""
+    option_ids, prices = options
+    for i in range(count):
+        option = rng.randrange(len(option_ids))
+        seats = rng.choice((1, 1, 1, 2, 2, 3, 4))
+        status = 'cancelled' if rng.random() < 0.1 else 'confirmed'
+        booked = start - timedelta(seconds=rng.randrange(180 * 24 * 3600))
+        yield (booking_id(i), users[rng.randrange(len(users))], option_ids[option], seats,
+               str(prices[option] * seats), booked, status)
+
+
+def insert(connection, table, columns, rows, datetime_columns=()):
+    """Write ``rows`` in BATCH_SIZE batches, one transaction per batch.
+
+    Datetimes are written as naive UTC text, which SQLite and MySQL both
+    read back as Django does with USE_TZ; connection.ops'
+    per-value adaptation would double the load time.
+    """
+    from django.db import transaction
+
+    sql = (f"INSERT INTO {connection.ops.quote_name(table)} "
+           f"({', '.join(connection.ops.quote_name(c) for c in columns)}) "
+           f"VALUES ({', '.join(['%s'] * len(columns))})")
+    positions = [columns.index(column) for column in datetime_columns]
+    batch = []
+    for row in rows:
+        row = list(row)
+        for position in positions:
+            row[position] = row[position].astimezone(tz.utc).replace(tzinfo=None).isoformat(' ')
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+
+
+def reset():
+    from django.contrib.auth.models import User
+    from django.db.models import Q
+    from booking_app.models import Booking, TravelOption
+
+    # Including the bookings the load driver made through the app.
+    Booking.objects.filter(
+        Q(travel_option__travel_id__startswith=PREFIX) | Q(user__email__endswith='@load.test')
+    )._raw_delete(Booking.objects.db)
+    TravelOption.objects.filter(
+        travel_id__startswith=PREFIX)._raw_delete(TravelOption.objects.db)
+    User.objects.filter(email__endswith='@load.test').delete()
+
+
+def generate(tier, seed, start, days=60):
+    """Write the dataset for ``tier``; returns (users, travel options, bookings)."""
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from booking_app.fare_calendar import rebuild_fare_calendar
+    from booking_app.models import Booking, Route, TravelOption
+
+    rng = random.Random(seed)
+    rows = TIERS[tier]
+    users = user_count(rows)
+    now = datetime.now(tz.utc)
+
+    # Hashing is slow by design; every user shares one hash.
+    password = make_password(PASSWORD, salt=f'loadtest{seed}')
+    insert(connection, User._meta.db_table,
+           ['username', 'email', 'password', 'first_name', 'last_name', 'is_staff',
+            'is_active', 'is_superuser', 'date_joined'],
+           ((username(i), f'{username(i)}@load.test', password, '', '', False, True, False,
+             now) for i in range(users)),
+           datetime_columns=['date_joined'])
+    user_ids = list(User.objects.filter(email__endswith='@load.test').order_by(
+        'username').values_list('id', flat=True))
+
+    routes = [(source, destination, Route.objects.for_names(source, destination).pk)
+              for source in CITIES for destination in CITIES if source != destination]
+    insert(connection, TravelOption._meta.db_table,
+           ['travel_id', 'travel_type', 'source', 'destination', 'departure_datetime',
+            'arrival_datetime', 'price', 'available_seats', 'route_id', 'queue_bookings',
+            'seat_shards', 'seats_per_row', 'created_at', 'updated_at'],
+           (row + (False, 0, 0, now, now)
+            for row in travel_option_rows(rng, rows, start, days, routes)),
+           datetime_columns=['departure_datetime', 'arrival_datetime', 'created_at',
+                             'updated_at'])
+    options = TravelOption.objects.filter(travel_id__startswith=PREFIX).order_by('travel_id')
+    option_ids, prices = [], []
+    for pk, price in options.values_list('id', 'price').iterator(chunk_size=BATCH_SIZE):
+        option_ids.append(pk)
+        prices.append(price)
+
+    insert(connection, Booking._meta.db_table,
+           ['booking_id', 'user_id', 'travel_option_id', 'number_of_seats', 'total_price',
+            'booking_date', 'status', 'seat_numbers'],
+           (row + ('',)
+            for row in booking_rows(rng, rows, (option_ids, prices), user_ids, start)),
+           datetime_columns=['booking_date'])
+
+    rebuild_fare_calendar()
+    with connection.cursor() as cursor:
+        for model in (User, TravelOption, Booking):
+            table = connection.ops.quote_name(model._meta.db_table)
+            cursor.execute(f'ANALYZE {table}' if connection.vendor == 'sqlite'
+                           else f'ANALYZE TABLE {table}')
+    return len(user_ids), len(option_ids), rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tier', choices=TIERS, default='10k')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--start', type=datetime.fromisoformat,
+                        default=datetime.combine(datetime.now(tz.utc).date(), day_start()),
+                        help='first departure day, YYYY-MM-DD (default today, UTC)')
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--reset', action='store_true')
+    args = parser.parse_args(argv)
+    start = args.start.replace(tzinfo=tz.utc) + timedelta(days=1)
+
+    setup_django()
+    if args.reset:
+        reset()
+    with Timer() as timer:
+        users, options, bookings = generate(args.tier, args.seed, start, args.days)
+    report('dataset', tier=args.tier, seed=args.seed, start=args.start.date(), users=users,
+           travel_options=options, bookings=bookings, seconds=round(timer.elapsed, 1),
+           rows_per_second=round((users + options + bookings) / timer.elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Booking export: rows per second and peak Python memory, streamed vs loaded at once.
+
+Loads ``--bookings`` bookings for the benchmark user at each of ``--sizes``
+and exports them as CSV twice: through stream_bookings, one keyset chunk at
+a time, and by materialising the queryset and writing the whole file in
+memory. Peak memory is measured with tracemalloc.
+
+    python -m benchmarks.export --sizes 20000 200000
+"""
+import argparse
+import csv
+import io
+import tracemalloc
+
+from benchmarks.common import setup_django, bench_user, hot_travel_option, Timer, report
+
+PREFIX = 'BENCH-EXPORT-'
+
+
+def load_bookings(user, count):
+    from booking_app.models import Booking
+
+    Booking.objects.filter(booking_id__startswith=PREFIX).delete()
+    travel_option = hot_travel_option(f"{PREFIX}0", 40)
+    for start in range(0, count, 5000):
+        Booking.objects.bulk_create([
+            Booking(booking_id=f"{PREFIX}{i}", user=user, travel_option=travel_option,
+                    number_of_seats=1, total_price=700)
+            for i in range(start, min(start + 5000, count))])
+    return Booking.objects.filter(booking_id__startswith=PREFIX)
+
+
+def streamed(queryset):
+    from booking_app.exports import stream_bookings
+
+    size = 0
+    for chunk in stream_bookings([queryset], 'csv'):
+        size += len(chunk)
+    return size
+
+
+def loaded(queryset):
+    from booking_app.exports import BOOKING_COLUMNS
+
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow([column for column, _ in BOOKING_COLUMNS])
+    for booking in list(queryset.select_related('user', 'travel_option')):
+        option = booking.travel_option
+        writer.writerow([
+            booking.booking_id, booking.user.username, booking.status, booking.booking_date,
+            booking.number_of_seats, booking.seat_numbers, booking.total_price,
+            option.travel_id, option.travel_type, option.source, option.destination,
+            option.departure_datetime])
+    return len(out.getvalue())
+
+
+def measure(export, queryset):
+    tracemalloc.start()
+    with Timer() as timer:
+        size = export(queryset)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timer.elapsed, peak, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20000, 200000])
+    args = parser.parse_args(argv)
+
+    setup_django()
+    user = bench_user()
+    for count in args.sizes:
+        queryset = load_bookings(user, count)
+        for name, export in [('streamed', streamed), ('loaded', loaded)]:
+            seconds, peak, size = measure(export, queryset)
+            report('export', mode=name, bookings=count, seconds=round(seconds, 3),
+                   rows_per_second=round(count / seconds), peak_mib=round(peak / 2**20, 1),
+                   output_mib=round(size / 2**20, 1))
+
+
+if __name__ == '__main__':
+    main()
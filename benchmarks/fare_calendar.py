@@ -0,0 +1,93 @@
+"""30-day fare calendar for one route: GROUP BY over departures vs the FareDay table.
+
+Loads ``--per-day`` departures per day for 90 days on one route, then times
+the per-request aggregate the calendar would otherwise need against reading
+the precomputed FareDay rows, plus the incremental refresh a booking pays.
+
+    python -m benchmarks.fare_calendar --per-day 500
+"""
+import argparse
+import statistics
+
+from benchmarks.common import setup_django, Timer, report
+
+PREFIX = 'BENCH-FARE-'
+DAYS = 90
+
+
+def load_rows(per_day):
+    from datetime import timedelta
+    from django.utils import timezone
+    from booking_app.fare_calendar import rebuild_fare_calendar
+    from booking_app.models import TravelOption, Route
+
+    if TravelOption.objects.filter(travel_id__startswith=PREFIX).count() >= per_day * DAYS:
+        return
+    TravelOption.objects.filter(travel_id__startswith=PREFIX).delete()
+    route = Route.objects.for_names('Chennai', 'Bengaluru')
+    start = timezone.now() + timedelta(hours=1)
+    batch = []
+    for i in range(per_day * DAYS):
+        departure = start + timedelta(seconds=i * 86400 // per_day)
+        batch.append(TravelOption(
+            travel_id=f"{PREFIX}{i}", travel_type='bus', source='Chennai',
+            destination='Bengaluru', route=route, departure_datetime=departure,
+            arrival_datetime=departure + timedelta(hours=6),
+            price=400 + i % 300, available_seats=i % 40))
+        if len(batch) == 5000:
+            TravelOption.objects.bulk_create(batch)
+            batch = []
+    TravelOption.objects.bulk_create(batch)
+    # bulk_create skips the signals that keep the calendar current.
+    rebuild_fare_calendar()
+
+
+def median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            fn()
+        timings.append(timer.elapsed * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--per-day', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from datetime import timedelta
+    from django.db.models import Count, Min, Q, Sum
+    from django.db.models.functions import TruncDate
+    from django.utils import timezone
+    from booking_app.fare_calendar import fare_calendar, refresh_fare_days, day_key
+    from booking_app.models import TravelOption, Route
+
+    load_rows(args.per_day)
+    route = Route.objects.for_names('Chennai', 'Bengaluru')
+    criteria = {'route_ids': [route.pk], 'travel_type': None}
+    today = timezone.localdate()
+
+    def group_by():
+        start = timezone.now()
+        list(TravelOption.objects.filter(
+            route=route, departure_datetime__gte=start,
+            departure_datetime__lt=start + timedelta(days=30)
+        ).annotate(day=TruncDate('departure_datetime')).values('day').annotate(
+            min_price=Min('price', filter=Q(available_seats__gt=0)),
+            seats=Sum('available_seats'),
+            departures=Count('id', filter=Q(available_seats__gt=0))).order_by('day'))
+
+    option = TravelOption.objects.filter(travel_id__startswith=PREFIX).first()
+    key = day_key(*option.fare_key())
+
+    report('fare_calendar', departures=args.per_day * DAYS, days=30, today=today,
+           group_by_ms=median_ms(group_by, args.repeat),
+           fare_day_ms=median_ms(lambda: fare_calendar(criteria, 30), args.repeat),
+           refresh_one_day_ms=median_ms(lambda: refresh_fare_days([key]), args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Search response cost: rendered travel_list HTML vs the JSON API, cold, cached and 304.
+
+Times one search page through the full middleware stack with Django's test
+client, with the search cache disabled (cold) and enabled (warm), and a
+conditional GET that the API answers with 304 Not Modified.
+
+    python -m benchmarks.json_api --repeat 200
+"""
+import argparse
+import statistics
+
+from benchmarks.common import setup_django, hot_travel_option, Timer, report
+
+PREFIX = 'BENCH-API-'
+
+
+def median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            fn()
+        timings.append(timer.elapsed * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--departures', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+    from django.test import Client
+    from django.test.utils import override_settings
+    from django.utils import timezone
+    from booking_app.search_cache import search_cache
+
+    for i in range(args.departures):
+        hot_travel_option(
+            f"{PREFIX}{i}", 40, source='Jaipur', destination='Udaipur', travel_type='bus',
+            departure_datetime=timezone.now() + timezone.timedelta(days=1, minutes=i))
+    client = Client()
+    search = {'source': 'Jaipur', 'destination': 'Udaipur'}
+    api = {**search, 'limit': 8}
+
+    for cached in (False, True):
+        with override_settings(SEARCH_CACHE={**settings.SEARCH_CACHE, 'ENABLED': cached}):
+            search_cache.reset()
+            html = median_ms(lambda: client.get('/travel/', search), args.repeat)
+            json_ms = median_ms(lambda: client.get('/api/v1/travel/', api), args.repeat)
+            etag = client.get('/api/v1/travel/', api)['ETag']
+            not_modified = median_ms(
+                lambda: client.get('/api/v1/travel/', api, HTTP_IF_NONE_MATCH=etag),
+                args.repeat)
+        report('json_api', search_cache=cached, html_ms=html, json_ms=json_ms,
+               not_modified_ms=not_modified,
+               html_bytes=len(client.get('/travel/', search).content),
+               json_bytes=len(client.get('/api/v1/travel/', api).content))
+
+
+if __name__ == '__main__':
+    main()
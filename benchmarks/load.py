@@ -0,0 +1,217 @@
+"""Scripted user-mix load test against a running server, with p50/p99 and throughput.
+
+Each virtual user logs in as its own benchmarks.dataset user, then loops
+over a weighted mix of requests:
+- browse the home page;
+- search travel_list between dataset cities;
+- book one seat on a dataset departure;
+- open booking_list;
+- cancel a booking seen on that list.
+Every user's choices come from random.Random(seed + user), so the same
+seed replays the same script. Latencies from the first --warmup seconds
+are dropped. Results are printed as one JSON line and, with --output,
+written to a file for benchmarks.compare.
+
+Load a dataset first, then either point --url at a server that is already
+running (gunicorn, uvicorn, runserver; with THROTTLE_ENABLED=0) or let
+--serve start `manage.py runserver` on --url's port:
+
+    python -m benchmarks.dataset --tier 10k --seed 1 --reset
+    python -m benchmarks.load --serve --users 8 --duration 60 --output base.json
+"""
+import argparse
+import http.cookiejar
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from benchmarks.common import BASE_DIR, report
+from benchmarks.dataset import CITIES, PASSWORD, TIERS, travel_id, user_count, username
+
+MIX = {'home': 15, 'travel_list': 40, 'book_travel': 10, 'booking_list': 25,
+       'cancel_booking': 10}
+CANCEL_LINK = re.compile(r'/booking/([^/"]+)/cancel/')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class VirtualUser:
+    def __init__(self, index, args):
+        self.rng = random.Random(args.seed + index)
+        self.base_url = args.url.rstrip('/')
+        self.username = username(index % user_count(TIERS[args.tier]))
+        self.options = TIERS[args.tier]
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect())
+        self.cancellable = []
+
+    def csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def request(self, path, data=None):
+        """(status, body); redirects are returned, not followed."""
+        if data is not None:
+            data = urllib.parse.urlencode(
+                {**data, 'csrfmiddlewaretoken': self.csrf_token()}).encode()
+        request = urllib.request.Request(self.base_url + path, data=data,
+                                         headers={'Referer': self.base_url + path})
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def login(self):
+        self.request('/login/')
+        status, _ = self.request('/login/', {'username': self.username, 'password': PASSWORD})
+        return status
+
+    def step(self, action):
+        if action == 'home':
+            return self.request('/')[0]
+        if action == 'travel_list':
+            source, destination = self.rng.sample(CITIES, 2)
+            query = {'source': source}
+            if self.rng.random() < 0.7:
+                query['destination'] = destination
+            return self.request('/travel/?' + urllib.parse.urlencode(query))[0]
+        if action == 'book_travel':
+            option = travel_id(self.rng.randrange(self.options))
+            return self.request(f'/book/{option}/', {'number_of_seats': 1})[0]
+        if action == 'booking_list' or not self.cancellable:
+            status, body = self.request('/bookings/')
+            self.cancellable = CANCEL_LINK.findall(body.decode(errors='replace'))
+            return status
+        booking_id = self.cancellable.pop(self.rng.randrange(len(self.cancellable)))
+        return self.request(f'/booking/{booking_id}/cancel/', {})[0]
+
+    def run(self, until, think, samples):
+        actions, weights = zip(*MIX.items())
+        while time.monotonic() < until:
+            action = self.rng.choices(actions, weights)[0]
+            if action == 'cancel_booking' and not self.cancellable:
+                action = 'booking_list'
+            start = time.monotonic()
+            try:
+                status = self.step(action)
+            except OSError:
+                status = None
+            samples.append((start, action, status, time.monotonic() - start))
+            if think:
+                time.sleep(think)
+
+
+def percentile(latencies, q):
+    return latencies[max(int(len(latencies) * q + 0.5) - 1, 0)]
+
+
+def summarize(samples, seconds):
+    """Latency percentiles (ms), throughput and status counts per action and overall."""
+    by_action = defaultdict(list)
+    for _, action, status, latency in samples:
+        by_action[action].append((status, latency))
+        by_action['total'].append((status, latency))
+    results = {}
+    for action, rows in sorted(by_action.items()):
+        latencies = sorted(latency for _, latency in rows)
+        statuses = defaultdict(int)
+        for status, _ in rows:
+            statuses[str(status)] += 1
+        results[action] = {
+            'requests': len(rows),
+            'errors': sum(1 for status, _ in rows if status is None or status >= 400),
+            'requests_per_s': round(len(rows) / seconds, 1),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'statuses': dict(sorted(statuses.items())),
+        }
+    return results
+
+
+def serve(url):
+    """Start runserver on ``url``'s port and wait until it answers."""
+    port = urllib.parse.urlsplit(url).port or 80
+    env = dict(os.environ, THROTTLE_ENABLED='0')
+    server = subprocess.Popen(
+        [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload'],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).close()
+            return server
+        except urllib.error.HTTPError:
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f'Server at {url} did not start.')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--serve', action='store_true',
+                        help='start manage.py runserver for the run')
+    parser.add_argument('--tier', choices=TIERS, default='10k',
+                        help='the benchmarks.dataset tier that is loaded')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--think-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', default='')
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    server = serve(args.url) if args.serve else None
+    try:
+        users = [VirtualUser(index, args) for index in range(args.users)]
+        failed = [user.username for user in users if user.login() != 302]
+        if failed:
+            raise SystemExit(f"Login failed for {', '.join(failed)}; "
+                             f"load benchmarks.dataset --tier {args.tier} first.")
+        samples = []
+        started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        start = time.monotonic()
+        until = start + args.warmup + args.duration
+        threads = [threading.Thread(target=user.run, args=(until, args.think_ms / 1000, samples))
+                   for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    measured = [sample for sample in samples if sample[0] >= start + args.warmup]
+    results = {
+        'label': args.label, 'url': args.url, 'tier': args.tier, 'users': args.users,
+        'duration_s': args.duration, 'seed': args.seed, 'started_at': started_at,
+        'actions': summarize(measured, args.duration),
+    }
+    report('load', **results)
+    if args.output:
+        import json
+
+        with open(args.output, 'w') as f:
+            json.dump({'benchmark': 'load', **results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Page 1 vs page 10,000 latency: OFFSET/COUNT pagination against keyset cursors.
+
+Loads enough upcoming departures for the requested page depth (8 per page,
+like travel_list), then times both paginators on the first and the deep page.
+
+    python -m benchmarks.pagination --page 10000
+"""
+import argparse
+import statistics
+import sys
+
+from benchmarks.common import setup_django, Timer, report
+
+PER_PAGE = 8
+PREFIX = 'BENCH-PAGE-'
+
+
+def load_rows(count):
+    from datetime import timedelta
+    from django.utils import timezone
+    from booking_app.models import TravelOption, Route
+
+    existing = TravelOption.objects.filter(travel_id__startswith=PREFIX).count()
+    if existing >= count:
+        return
+    route = Route.objects.for_names('Pune', 'Goa')
+    start = timezone.now() + timedelta(days=1)
+    batch = []
+    for i in range(existing, count):
+        departure = start + timedelta(seconds=i * 30)
+        batch.append(TravelOption(
+            travel_id=f"{PREFIX}{i}", travel_type='bus', source='Pune', destination='Goa',
+            route=route, departure_datetime=departure,
+            arrival_datetime=departure + timedelta(hours=10),
+            price=700, available_seats=40))
+        if len(batch) == 5000:
+            TravelOption.objects.bulk_create(batch)
+            batch = []
+    TravelOption.objects.bulk_create(batch)
+
+
+def median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        with Timer() as timer:
+            fn()
+        timings.append(timer.elapsed * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--page', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.core.paginator import Paginator
+    from django.test import RequestFactory
+    from django.utils import timezone
+    from booking_app.models import TravelOption
+    from booking_app.utils import paginate_by_cursor, _encode_cursor
+
+    load_rows(args.page * PER_PAGE + PER_PAGE)
+    factory = RequestFactory()
+
+    def queryset():
+        return TravelOption.objects.filter(
+            departure_datetime__gte=timezone.now(), available_seats__gt=0
+        ).order_by('departure_datetime', 'id')
+
+    def offset_page(number):
+        paginator = Paginator(queryset(), PER_PAGE)
+        return list(paginator.page(number)), paginator.count
+
+    # The deep cursor is what a user would hold after paging forward
+    # (page - 1) times: the last row of the previous page.
+    boundary = queryset()[(args.page - 1) * PER_PAGE - 1]
+    deep_cursor = _encode_cursor(
+        boundary, [('departure_datetime', False), ('id', False)], 'next')
+
+    def cursor_page(cursor):
+        params = {'cursor': cursor} if cursor else {}
+        return list(paginate_by_cursor(
+            factory.get('/travel/', params), queryset(), PER_PAGE, ['departure_datetime', 'id']))
+
+    assert [o.pk for o in offset_page(args.page)[0]] == [o.pk for o in cursor_page(deep_cursor)]
+
+    report(
+        'pagination',
+        rows=queryset().count(),
+        page=args.page,
+        offset_page1_ms=median_ms(lambda: offset_page(1), args.repeat),
+        offset_deep_ms=median_ms(lambda: offset_page(args.page), args.repeat),
+        cursor_page1_ms=median_ms(lambda: cursor_page(None), args.repeat),
+        cursor_deep_ms=median_ms(lambda: cursor_page(deep_cursor), args.repeat),
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
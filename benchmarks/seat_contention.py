@@ -0,0 +1,100 @@
+"""Multi-process stress test for the atomic seat reservation path.
+
+Every worker process hammers the same departure through
+``booking_app.services.reserve_seats`` until it is sold out, then the parent
+checks that no seat was sold twice and reports bookings/sec.
+
+    python -m benchmarks.seat_contention --workers 8 --seats 2000
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+
+from benchmarks.common import setup_django, bench_user, hot_travel_option, Timer, report
+
+TRAVEL_ID = 'BENCH-HOT-1'
+
+
+def worker(travel_option_id, max_seats_per_booking, results):
+    setup_django()
+    from django.db import connections, DatabaseError
+    from booking_app.models import TravelOption
+    from booking_app.services import reserve_seats, SoldOut
+
+    connections.close_all()
+    user = bench_user()
+    travel_option = TravelOption.objects.get(pk=travel_option_id)
+    booked = sold_out = errors = 0
+
+    # Keep trying until the departure reports sold out a few times in a row
+    # so workers don't stop while a single seat is still left.
+    while sold_out < 5:
+        seats = random.randint(1, max_seats_per_booking)
+        try:
+            reserve_seats(user, travel_option, seats)
+            booked += 1
+            sold_out = 0
+        except SoldOut:
+            if seats == 1:
+                sold_out += 1
+        except DatabaseError:
+            errors += 1
+
+    connections.close_all()
+    results.put((booked, errors))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seats', type=int, default=2000)
+    parser.add_argument('--max-seats-per-booking', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.db import connections
+    from django.db.models import Sum
+    from booking_app.models import Booking
+
+    bench_user()
+    travel_option = hot_travel_option(TRAVEL_ID, args.seats)
+    connections.close_all()
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=worker,
+            args=(travel_option.pk, args.max_seats_per_booking, results))
+        for _ in range(args.workers)
+    ]
+    with Timer() as timer:
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    travel_option.refresh_from_db()
+    bookings = Booking.objects.filter(travel_option=travel_option)
+    seats_sold = bookings.aggregate(total=Sum('number_of_seats'))['total'] or 0
+    booking_count = bookings.count()
+    oversold = seats_sold + travel_option.available_seats - args.seats
+
+    report(
+        'seat_contention',
+        workers=args.workers,
+        capacity=args.seats,
+        bookings=booking_count,
+        seats_sold=seats_sold,
+        seats_left=travel_option.available_seats,
+        oversold=oversold,
+        errors=sum(errors for _, errors in outcomes),
+        seconds=round(timer.elapsed, 3),
+        bookings_per_sec=round(booking_count / timer.elapsed, 1),
+    )
+    return 1 if oversold or travel_option.available_seats < 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
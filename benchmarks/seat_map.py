@@ -0,0 +1,105 @@
+"""Seat allocation cost as departures grow: the bitset seat map against a per-seat scan.
+
+For each --capacities value a departure is filled with groups of 1 to
+--max-group seats (same random sequence for both), once with
+booking_app.seatmap.SeatMap and once with a list of per-seat flags
+scanned seat by seat, the way a table with one row per seat would be
+searched. Reports microseconds per allocation; the bitset's cost follows
+the number of 64-bit words in the map, the scan's the number of seats.
+
+Then --train seats are booked through ``reserve_seats`` on one departure
+with a seat map and one without, single process, to show what a seat map
+adds to a booking end to end.
+
+    python -m benchmarks.seat_map --capacities 100 1000 10000 --train 1200
+"""
+import argparse
+import random
+
+from benchmarks.common import setup_django, bench_user, hot_travel_option, Timer, report
+
+
+class SeatList:
+    """Per-seat flags, searched seat by seat for the first block in a row."""
+
+    def __init__(self, seats, seats_per_row):
+        self.taken = [False] * seats
+        self.seats_per_row = seats_per_row
+
+    def allocate(self, number_of_seats):
+        run = 0
+        for index, taken in enumerate(self.taken):
+            if index % self.seats_per_row == 0:
+                run = 0
+            run = 0 if taken else run + 1
+            if run == number_of_seats:
+                start = index - number_of_seats + 1
+                self.taken[start:index + 1] = [True] * number_of_seats
+                return list(range(start, index + 1))
+        free = [index for index, taken in enumerate(self.taken) if not taken]
+        if len(free) < number_of_seats:
+            return None
+        for index in free[:number_of_seats]:
+            self.taken[index] = True
+        return free[:number_of_seats]
+
+
+def fill(seat_map, groups):
+    allocations = 0
+    with Timer() as timer:
+        for group in groups:
+            if seat_map.allocate(group) is None:
+                break
+            allocations += 1
+    return allocations, timer.elapsed
+
+
+def book_out(user, travel_option, groups):
+    from booking_app.services import reserve_seats, SoldOut
+
+    bookings = 0
+    with Timer() as timer:
+        for group in groups:
+            try:
+                reserve_seats(user, travel_option, group)
+            except SoldOut:
+                break
+            bookings += 1
+    return bookings, timer.elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--capacities', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--seats-per-row', type=int, default=6)
+    parser.add_argument('--max-group', type=int, default=6)
+    parser.add_argument('--train', type=int, default=1200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from booking_app.seatmap import SeatMap
+
+    for capacity in args.capacities:
+        rng = random.Random(args.seed)
+        groups = [rng.randint(1, args.max_group) for _ in range(capacity)]
+        bitset, bitset_seconds = fill(SeatMap.empty(capacity, args.seats_per_row), groups)
+        scan, scan_seconds = fill(SeatList(capacity, args.seats_per_row), groups)
+        report('seat_map', capacity=capacity, words=-(-capacity // 64), allocations=bitset,
+               bitset_us=round(bitset_seconds / bitset * 1e6, 2),
+               scan_us=round(scan_seconds / scan * 1e6, 2))
+
+    if args.train:
+        user = bench_user()
+        rng = random.Random(args.seed)
+        groups = [rng.randint(1, args.max_group) for _ in range(args.train)]
+        for seats_per_row in (0, args.seats_per_row):
+            travel_option = hot_travel_option(
+                'BENCH-SEATMAP-1', args.train, seats_per_row=seats_per_row)
+            bookings, seconds = book_out(user, travel_option, groups)
+            report('seat_map_booking', capacity=args.train, seats_per_row=seats_per_row,
+                   bookings=bookings, bookings_per_sec=round(bookings / seconds, 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Booking throughput on one hot departure as its seat counter is split into more shards.
+
+For each --shards value the departure is reset to --seats seats, split with
+``booking_app.services.shard_seat_counter`` (0 keeps the single
+available_seats row), and --workers processes book it through
+``reserve_seats`` until it is sold out. Each run reports bookings/sec and
+checks that the shards and bookings still add up to the capacity.
+
+On MySQL or PostgreSQL the row locks are per shard, so throughput should
+grow with the shard count until the workers no longer queue on one row.
+SQLite locks the whole database for every write, so there the numbers
+stay flat and only the oversold check means anything.
+
+    python -m benchmarks.seat_shards --workers 8 --seats 4000 --shards 0 1 4 16
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+
+from benchmarks.common import setup_django, bench_user, hot_travel_option, Timer, report
+
+TRAVEL_ID = 'BENCH-SHARDED-1'
+
+
+def worker(travel_option_id, max_seats_per_booking, results):
+    setup_django()
+    from django.db import connections, DatabaseError
+    from booking_app.models import TravelOption
+    from booking_app.services import reserve_seats, SoldOut
+
+    connections.close_all()
+    user = bench_user()
+    travel_option = TravelOption.objects.get(pk=travel_option_id)
+    booked = sold_out = errors = 0
+
+    while sold_out < 5:
+        seats = random.randint(1, max_seats_per_booking)
+        try:
+            reserve_seats(user, travel_option, seats)
+            booked += 1
+            sold_out = 0
+        except SoldOut:
+            if seats == 1:
+                sold_out += 1
+        except DatabaseError:
+            errors += 1
+
+    connections.close_all()
+    results.put((booked, errors))
+
+
+def run(shards, args):
+    from django.db import connections
+    from django.db.models import Sum
+    from booking_app.models import Booking, SeatShard
+    from booking_app.services import shard_seat_counter
+
+    travel_option = hot_travel_option(TRAVEL_ID, args.seats)
+    shard_seat_counter(travel_option.pk, shards)
+    connections.close_all()
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=worker,
+            args=(travel_option.pk, args.max_seats_per_booking, results))
+        for _ in range(args.workers)
+    ]
+    with Timer() as timer:
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    travel_option.refresh_from_db()
+    if shards:
+        seats_left = SeatShard.objects.filter(travel_option=travel_option).aggregate(
+            total=Sum('available_seats'))['total']
+    else:
+        seats_left = travel_option.available_seats
+    bookings = Booking.objects.filter(travel_option=travel_option)
+    seats_sold = bookings.aggregate(total=Sum('number_of_seats'))['total'] or 0
+    booking_count = bookings.count()
+    oversold = seats_sold + seats_left - args.seats
+
+    report(
+        'seat_shards',
+        shards=shards,
+        workers=args.workers,
+        capacity=args.seats,
+        bookings=booking_count,
+        seats_sold=seats_sold,
+        seats_left=seats_left,
+        oversold=oversold,
+        errors=sum(errors for _, errors in outcomes),
+        seconds=round(timer.elapsed, 3),
+        bookings_per_sec=round(booking_count / timer.elapsed, 1),
+    )
+    return bool(oversold or seats_left < 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seats', type=int, default=4000)
+    parser.add_argument('--max-seats-per-booking', type=int, default=4)
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 1, 4, 16])
+    args = parser.parse_args(argv)
+
+    setup_django()
+    bench_user()
+    failed = [run(shards, args) for shards in args.shards]
+    return 1 if any(failed) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Telemetry overhead: request latency with TelemetryMiddleware on and off.
+
+Times the search page, a booking list and a login through the full
+middleware stack with Django's test client, with ``TELEMETRY['ENABLED']``
+off and on, and prints one Server-Timing header per page to show where
+the time goes.
+
+    python -m benchmarks.telemetry --repeat 300
+"""
+import argparse
+import statistics
+
+from benchmarks.common import setup_django, bench_user, hot_travel_option, Timer, report
+
+PREFIX = 'BENCH-TELEMETRY-'
+
+
+def interleaved_ms(request, repeat, settings_on, settings_off):
+    """Median milliseconds with telemetry off and on, alternating to cancel drift."""
+    from django.test.utils import override_settings
+
+    timings = {False: [], True: []}
+    for i in range(repeat * 2):
+        enabled = bool(i % 2)
+        with override_settings(**(settings_on if enabled else settings_off)):
+            with Timer() as timer:
+                request()
+        timings[enabled].append(timer.elapsed * 1000)
+    return [round(statistics.median(timings[enabled]), 3) for enabled in (False, True)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=300)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+    from django.test import Client
+    from django.test.utils import override_settings
+
+    user = bench_user()
+    user.set_password('bench-password')
+    user.save()
+    hot_travel_option(f"{PREFIX}0", 40, source='Pune', destination='Goa')
+    client = Client()
+    client.force_login(user)
+    login = Client()
+    pages = {
+        'travel_list': lambda: client.get('/travel/', {'source': 'Pune'}),
+        'booking_list': lambda: client.get('/bookings/'),
+        'login': lambda: login.post(
+            '/login/', {'username': user.username, 'password': 'bench-password'}),
+    }
+
+    throttle_off = {**settings.THROTTLE, 'ENABLED': False}
+    settings_on = {'TELEMETRY': {**settings.TELEMETRY, 'ENABLED': True}, 'THROTTLE': throttle_off}
+    settings_off = {'TELEMETRY': {**settings.TELEMETRY, 'ENABLED': False},
+                    'THROTTLE': throttle_off}
+    for name, request in pages.items():
+        repeat = args.repeat if name != 'login' else max(args.repeat // 10, 5)
+        with override_settings(**settings_on):
+            for _ in range(5):
+                server_timing = request()['Server-Timing']
+        off_ms, on_ms = interleaved_ms(request, repeat, settings_on, settings_off)
+        report('telemetry', page=name, off_ms=off_ms, on_ms=on_ms,
+               overhead_us=round((on_ms - off_ms) * 1000), server_timing=server_timing)
+
+    # The middleware alone, around a view that does nothing.
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from booking_app.telemetry import TelemetryMiddleware, metrics
+
+    middleware = TelemetryMiddleware(lambda request: HttpResponse())
+    request = RequestFactory().get('/travel/')
+    request.resolver_match = None
+    off_ms, on_ms = interleaved_ms(lambda: middleware(request), args.repeat * 10,
+                                   settings_on, settings_off)
+    metrics.reset()
+    report('telemetry', page='middleware_only', off_ms=off_ms, on_ms=on_ms,
+           overhead_us=round((on_ms - off_ms) * 1000, 1))
+
+if __name__ == '__main__':
+    main()
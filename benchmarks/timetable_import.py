@@ -0,0 +1,94 @@
+"""Bulk timetable import throughput: import_timetable against one create() per row.
+
+Writes a synthetic CSV timetable (--rows records over a few hundred routes)
+and imports it twice with the management command, the second pass being all
+updates. The row-at-a-time baseline is what populate_data.py does and is
+timed on a small sample only.
+
+    python -m benchmarks.timetable_import --rows 1000000
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from benchmarks.common import setup_django, Timer, report
+
+PREFIX = 'BENCH-TT-'
+CITIES = ['Mumbai', 'Delhi', 'Bangalore', 'Chennai', 'Kolkata', 'Hyderabad', 'Pune',
+          'Ahmedabad', 'Jaipur', 'Lucknow', 'Kochi', 'Goa', 'Chandigarh', 'Bhopal',
+          'Indore', 'Nagpur', 'Surat', 'Varanasi', 'Patna', 'Guwahati']
+
+
+def write_timetable(path, rows):
+    from django.utils import timezone
+
+    rng = random.Random(42)
+    start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['travel_id', 'travel_type', 'source', 'destination',
+                         'departure_datetime', 'arrival_datetime', 'price', 'available_seats'])
+        for i in range(rows):
+            source, destination = rng.sample(CITIES, 2)
+            departure = start + timedelta(minutes=i)
+            writer.writerow([
+                f"{PREFIX}{i}", rng.choice(['flight', 'train', 'bus']), source, destination,
+                departure.isoformat(), (departure + timedelta(hours=rng.randint(1, 20))).isoformat(),
+                rng.randint(300, 9000), rng.randint(10, 200)])
+
+
+def row_at_a_time(rows):
+    from django.utils import timezone
+    from booking_app.models import TravelOption
+
+    start = timezone.now() + timedelta(days=1)
+    for i in range(rows):
+        travel_id = f"{PREFIX}SLOW-{i}"
+        if TravelOption.objects.filter(travel_id=travel_id).exists():
+            continue
+        TravelOption.objects.create(
+            travel_id=travel_id, travel_type='bus', source='Pune', destination='Goa',
+            departure_datetime=start, arrival_datetime=start + timedelta(hours=10),
+            price=700, available_seats=40)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--baseline-rows', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from booking_app.models import TravelOption
+
+    TravelOption.objects.filter(travel_id__startswith=PREFIX).delete()
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        write_timetable(path, args.rows)
+        for phase in ('insert', 'update'):
+            with Timer() as timer:
+                call_command('import_timetable', path, batch_size=args.batch_size,
+                             restart=True, stdout=StringIO())
+            report(f'timetable_import.bulk_{phase}', rows=args.rows,
+                   seconds=round(timer.elapsed, 2),
+                   rows_per_s=round(args.rows / timer.elapsed))
+
+        with Timer() as timer:
+            row_at_a_time(args.baseline_rows)
+        report('timetable_import.row_at_a_time', rows=args.baseline_rows,
+               seconds=round(timer.elapsed, 2),
+               rows_per_s=round(args.baseline_rows / timer.elapsed))
+    finally:
+        os.remove(path)
+        TravelOption.objects.filter(travel_id__startswith=PREFIX).delete()
+
+
+if __name__ == '__main__':
+    main()
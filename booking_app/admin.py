@@ -1,20 +1,223 @@
-from django.contrib import admin
-from .models import TravelOption, Booking
+import datetime
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.db import models
+from django.utils import timezone
+from .models import TravelOption, Booking, City, Route, ArchivedBooking
+from .exports import export_response
+from .search_index import get_city_index
+from .services import assign_seat_map, cancel_departures, shard_seat_counter
+from .utils import EstimatedCountPaginator
+
+
+def _truncate(value, kind, tzinfo=None):
+    if timezone.is_aware(value):
+        value = timezone.localtime(value, tzinfo)
+    value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if kind in ('year', 'month'):
+        value = value.replace(day=1)
+    if kind == 'year':
+        value = value.replace(month=1)
+    return value
+
+
+def _next_period(value, kind):
+    if kind == 'year':
+        return value.replace(year=value.year + 1)
+    if kind == 'month':
+        return (value.replace(year=value.year + 1, month=1) if value.month == 12
+                else value.replace(month=value.month + 1))
+    return value + datetime.timedelta(days=1)
+
+
+class DateHierarchyQuerySet(models.QuerySet):
+    """QuerySet whose datetimes() are built from the first and last value.
+
+    The admin date hierarchy asks for the distinct years, months or days of
+    the changelist, which is a ``SELECT DISTINCT`` over every matching row.
+    Here it costs two index seeks on the field instead, listing every
+    period between the first and last value, including any without rows.
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        values = self.exclude(**{f'{field_name}__isnull': True}).values_list(
+            field_name, flat=True)
+        first = values.order_by(field_name).first()
+        last = values.order_by(f'-{field_name}').first()
+        if first is None:
+            return []
+        first, last = _truncate(first, kind, tzinfo), _truncate(last, kind, tzinfo)
+        periods = []
+        while first <= last:
+            periods.append(first)
+            first = _next_period(first, kind)
+        return periods[::-1] if order == 'DESC' else periods
+
+
+@admin.action(description="Export selected bookings (CSV)")
+def export_bookings_csv(modeladmin, request, queryset):
+    return export_response([queryset], 'csv', 'bookings')
+
+
+@admin.action(description="Export selected bookings (JSON Lines)")
+def export_bookings_jsonl(modeladmin, request, queryset):
+    return export_response([queryset], 'jsonl', 'bookings')
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """ModelAdmin for tables with millions of rows.
+
+    No full ``COUNT(*)`` (see EstimatedCountPaginator) and a date hierarchy
+    answered by DateHierarchyQuerySet.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return DateHierarchyQuerySet(queryset.model, queryset.query, queryset.db)
+
+
+class CityFilter(admin.SimpleListFilter):
+    """Filter on a route end by City id.
+
+    Choices come from the in-memory city index rather than a
+    ``SELECT DISTINCT`` over the departures table on every page load.
+    """
+
+    field = None
+
+    def lookups(self, request, model_admin):
+        names = get_city_index().names
+        return sorted(((str(city_id), name) for city_id, name in names.items()),
+                      key=lambda choice: choice[1])
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{f'route__{self.field}_id': self.value()})
+        return queryset
+
+
+class OriginFilter(CityFilter):
+    title = 'source'
+    parameter_name = 'origin'
+    field = 'origin'
+
+
+class DestinationFilter(CityFilter):
+    title = 'destination'
+    parameter_name = 'destination'
+    field = 'destination'
 
 
 @admin.register(TravelOption)
-class TravelOptionAdmin(admin.ModelAdmin):
-    list_display = ['travel_id', 'travel_type', 'source',
-                    'destination', 'departure_datetime', 'price', 'available_seats']
-    list_filter = ['travel_type', 'source', 'destination']
-    search_fields = ['travel_id', 'source', 'destination']
+class TravelOptionAdmin(ScalableAdmin):
+    list_display = ['travel_id', 'travel_type', 'source', 'destination',
+                    'departure_datetime', 'price', 'available_seats', 'seat_shards']
+    list_filter = ['travel_type', OriginFilter, DestinationFilter, 'queue_bookings']
+    # Prefix lookups on the unique travel_id index; filter on cities instead
+    # of a substring search over every row.
+    search_fields = ['^travel_id']
     ordering = ['departure_datetime']
+    date_hierarchy = 'departure_datetime'
+    actions = ['cancel_bookings', 'split_seat_counter', 'merge_seat_counter',
+               'export_bookings_csv', 'export_bookings_jsonl']
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return []
+        # A split counter's seats live in its shards; available_seats is their sum.
+        if obj.seat_shards:
+            return ['available_seats', 'seats_per_row']
+        # With a seat map, available_seats counts its free seats, and the
+        # bookings' seat numbers depend on the row length.
+        if obj.seat_map is not None:
+            return ['available_seats', 'seats_per_row']
+        # Bookings change the count under a row lock; a form holding the
+        # count from when the page loaded would write it back stale.
+        return ['available_seats']
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and obj.seats_per_row and 'seats_per_row' in form.changed_data:
+            assign_seat_map(obj.pk, obj.seats_per_row)
+
+    @admin.action(description="Cancel all bookings of the selected travel options")
+    def cancel_bookings(self, request, queryset):
+        cancelled, seats = cancel_departures(list(queryset.values_list('pk', flat=True)))
+        self.message_user(
+            request, f"Cancelled {cancelled} bookings and restored {seats} seats.",
+            messages.SUCCESS)
+
+    @admin.action(description="Split the seat counter of the selected travel options")
+    def split_seat_counter(self, request, queryset):
+        shards = getattr(settings, 'SEAT_SHARDS', 8)
+        # Seat-mapped departures lock their row to pick seats; they keep one counter.
+        for travel_option_id in queryset.filter(seats_per_row=0).values_list('pk', flat=True):
+            shard_seat_counter(travel_option_id, shards)
+        self.message_user(
+            request, f"Split the seat counters into {shards} shards. "
+                     f"Keep rebalance_seat_shards running.", messages.SUCCESS)
+
+    @admin.action(description="Merge the seat counter of the selected travel options")
+    def merge_seat_counter(self, request, queryset):
+        for travel_option_id in queryset.filter(seat_shards__gt=0).values_list('pk', flat=True):
+            shard_seat_counter(travel_option_id, 0)
+        self.message_user(request, "Merged the seat counters.", messages.SUCCESS)
+
+    def departure_bookings(self, queryset):
+        return Booking.objects.filter(travel_option__in=queryset.order_by().values('pk'))
+
+    @admin.action(description="Export bookings of the selected travel options (CSV)")
+    def export_bookings_csv(self, request, queryset):
+        return export_response([self.departure_bookings(queryset)], 'csv', 'bookings')
+
+    @admin.action(description="Export bookings of the selected travel options (JSON Lines)")
+    def export_bookings_jsonl(self, request, queryset):
+        return export_response([self.departure_bookings(queryset)], 'jsonl', 'bookings')
 
 
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(ScalableAdmin):
     list_display = ['booking_id', 'user', 'travel_option',
                     'number_of_seats', 'total_price', 'booking_date', 'status']
     list_filter = ['status', 'booking_date']
-    search_fields = ['booking_id', 'user__username']
+    list_select_related = ['user', 'travel_option']
+    autocomplete_fields = ['user', 'travel_option']
+    search_fields = ['=booking_id', '^user__username']
     ordering = ['-booking_date']
+    date_hierarchy = 'booking_date'
+    actions = [export_bookings_csv, export_bookings_jsonl]
+
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(ScalableAdmin):
+    list_display = ['booking_id', 'user', 'travel_option',
+                    'number_of_seats', 'total_price', 'booking_date', 'status']
+    list_select_related = ['user', 'travel_option']
+    search_fields = ['=booking_id']
+    ordering = ['-id']
+    actions = [export_bookings_csv, export_bookings_jsonl]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(City)
+class CityAdmin(admin.ModelAdmin):
+    search_fields = ['name']
+
+
+@admin.register(Route)
+class RouteAdmin(admin.ModelAdmin):
+    list_display = ['origin', 'destination']
+    list_select_related = ['origin', 'destination']
+    search_fields = ['origin__name', 'destination__name']
+    autocomplete_fields = ['origin', 'destination']
@@ -0,0 +1,182 @@
+"""Read-only JSON API (v1) for search, travel option detail and the user's bookings.
+
+Every response carries a strong ETag computed from the rows' ``updated_at``
+and seat counts (booking status for bookings), so ``If-None-Match`` gets a
+304 before anything is serialized. Search pages are kept, already encoded,
+in the search cache and invalidated with it.
+"""
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from functools import wraps
+from operator import attrgetter
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from booking_app.utils import paginate_by_cursor, paginate_merged_by_cursor
+from .forms import TravelSearchForm
+from .models import TravelOption, Booking, ArchivedBooking
+from .search_cache import first_departure, search_cache
+from .services import search_travel_options
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+TRAVEL_FIELDS = {name: attrgetter(name) for name in [
+    'travel_id', 'travel_type', 'source', 'destination', 'departure_datetime',
+    'arrival_datetime', 'price', 'available_seats']}
+BOOKING_FIELDS = {
+    **{name: attrgetter(name) for name in [
+        'booking_id', 'status', 'number_of_seats', 'seat_numbers', 'total_price',
+        'booking_date']},
+    **{name: attrgetter(f'travel_option.{name}') for name in [
+        'travel_id', 'travel_type', 'source', 'destination', 'departure_datetime',
+        'arrival_datetime']},
+}
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def api_settings():
+    return {'SEARCH_MAX_AGE': 5, 'DETAIL_MAX_AGE': 5, **getattr(settings, 'API', {})}
+
+
+class ApiError(Exception):
+    def __init__(self, status, errors):
+        self.status = status
+        self.errors = errors
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def error_response(status, errors):
+    return HttpResponse(dumps({'errors': errors}), status=status,
+                        content_type='application/json')
+
+
+def plain_value(value):
+    """A model value as JSON-ready data: ISO 8601 dates, decimals as strings."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def serialize(objects, getters):
+    return [{name: plain_value(get(obj)) for name, get in getters.items()} for obj in objects]
+
+
+def make_etag(*versions):
+    return '"%s"' % hashlib.sha1(repr(versions).encode()).hexdigest()
+
+
+def selected_fields(request, available):
+    """The ``fields`` query parameter as {name: getter}; every field by default."""
+    fields = request.GET.get('fields')
+    if not fields:
+        return available
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(400, {'fields': [f"Unknown field: {', '.join(unknown)}."]})
+    return {name: available[name] for name in names}
+
+
+def page_limit(request):
+    try:
+        return min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        raise ApiError(400, {'limit': ['Enter a whole number.']})
+
+
+def conditional_json(request, etag, body, **cache_control):
+    """A 304 when the client's ETag matches, else ``body()`` as JSON; both with the ETag."""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body(), content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, **cache_control)
+    return response
+
+
+def api_view(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as e:
+            return error_response(e.status, e.errors)
+    return wrapper
+
+
+def _page_links(page):
+    return {'next_cursor': page.next_cursor, 'previous_cursor': page.previous_cursor}
+
+
+@api_view
+def travel_search(request):
+    """Upcoming travel options, filtered like travel_list, ``limit`` per page."""
+    form = TravelSearchForm(request.GET)
+    if not form.is_valid():
+        raise ApiError(400, {field: list(errors) for field, errors in form.errors.items()})
+    criteria = form.search_criteria()
+    fields = selected_fields(request, TRAVEL_FIELDS)
+    limit = page_limit(request)
+
+    def compute():
+        queryset = search_travel_options(criteria).only(
+            'id', 'updated_at', 'available_seats', 'departure_datetime', *fields)
+        page = paginate_by_cursor(request, queryset, limit, ['departure_datetime', 'id'])
+        etag = make_etag(list(fields), _page_links(page),
+                         [(obj.pk, obj.updated_at, obj.available_seats) for obj in page])
+        return (etag, dumps({'results': serialize(page, fields), **_page_links(page)}),
+                first_departure(page))
+
+    etag, body, _ = search_cache.get_or_set(
+        'api_travel_search',
+        {**criteria, 'cursor': request.GET.get('cursor'), 'fields': list(fields), 'limit': limit},
+        criteria['route_ids'], compute, lambda result: result[2])
+    # Anonymous responses are shared: nginx micro-caches them for max-age.
+    return conditional_json(request, etag, lambda: body,
+                            public=True, max_age=api_settings()['SEARCH_MAX_AGE'])
+
+
+@api_view
+def travel_detail(request, travel_id):
+    fields = selected_fields(request, TRAVEL_FIELDS)
+    travel_option = TravelOption.objects.only(
+        'id', 'updated_at', 'available_seats', *fields).filter(travel_id=travel_id).first()
+    if travel_option is None:
+        raise ApiError(404, {'travel_id': ['Not found.']})
+    etag = make_etag(list(fields), travel_option.pk, travel_option.updated_at,
+                     travel_option.available_seats)
+    return conditional_json(request, etag, lambda: dumps(serialize([travel_option], fields)[0]),
+                            public=True, max_age=api_settings()['DETAIL_MAX_AGE'])
+
+
+@api_view
+def booking_list(request):
+    """The user's bookings, live and archived, newest first."""
+    if not request.user.is_authenticated:
+        raise ApiError(401, {'__all__': ['Log in to see your bookings.']})
+    fields = selected_fields(request, BOOKING_FIELDS)
+    page = paginate_merged_by_cursor(request, [
+        Booking.objects.filter(user=request.user).select_related('travel_option'),
+        ArchivedBooking.objects.filter(user=request.user).select_related('travel_option'),
+    ], page_limit(request), ['-booking_date', '-id'])
+    etag = make_etag(list(fields), _page_links(page), [
+        (booking.pk, booking.status, booking.travel_option.updated_at,
+         booking.travel_option.available_seats) for booking in page])
+    return conditional_json(
+        request, etag, lambda: dumps({'results': serialize(page, fields), **_page_links(page)}),
+        private=True, no_cache=True)
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ArchivedBooking, ArchivedTravelOption, Booking, SeatShard, TravelOption
+
+DEFAULT_AFTER_DAYS = 30
+CHUNK_ATTEMPTS = 3
+TRAVEL_OPTION_FIELDS = [
+    'id', 'travel_id', 'travel_type', 'source', 'destination', 'departure_datetime',
+    'arrival_datetime', 'price', 'available_seats', 'route_id', 'created_at', 'updated_at']
+BOOKING_FIELDS = [
+    'id', 'booking_id', 'user_id', 'travel_option_id', 'number_of_seats', 'total_price',
+    'booking_date', 'status', 'seat_numbers']
+
+
+def archive_cutoff(days=None):
+    """Departures before this are archived: ARCHIVE_AFTER_DAYS days ago by default."""
+    if days is None:
+        days = getattr(settings, 'ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS)
+    return timezone.now() - timezone.timedelta(days=days)
+
+
+def archive_chunk(cutoff, chunk_size=1000):
+    """Move up to ``chunk_size`` departures before ``cutoff``, with their bookings.
+
+    One transaction per chunk: the rows are copied into the archive tables
+    and deleted from the live ones together, so an interrupted run leaves
+    each departure either live or archived. Returns (travel options,
+    bookings) moved; (0, 0) once nothing is left.
+
+    A booking committed after the chunk's bookings were read is left in
+    place, so its foreign key fails the delete and the chunk rolls back;
+    it is then tried again, picking the new booking up.
+    """
+    for attempt in range(CHUNK_ATTEMPTS):
+        try:
+            return move_chunk(cutoff, chunk_size)
+        except IntegrityError:
+            if attempt == CHUNK_ATTEMPTS - 1:
+                raise
+
+
+def move_chunk(cutoff, chunk_size):
+    with transaction.atomic():
+        options = list(TravelOption.objects.select_for_update().filter(
+            departure_datetime__lt=cutoff
+        ).order_by('departure_datetime', 'id').values(*TRAVEL_OPTION_FIELDS)[:chunk_size])
+        if not options:
+            return 0, 0
+        ids = [option['id'] for option in options]
+        bookings = list(Booking.objects.filter(travel_option_id__in=ids).values(*BOOKING_FIELDS))
+
+        ArchivedTravelOption.objects.bulk_create(
+            [ArchivedTravelOption(**option) for option in options])
+        ArchivedBooking.objects.bulk_create(
+            [ArchivedBooking(**booking) for booking in bookings], batch_size=chunk_size)
+
+        last_id = max((booking['id'] for booking in bookings), default=0)
+        Booking.objects.filter(travel_option_id__in=ids, pk__lte=last_id).delete()
+        SeatShard.objects.filter(travel_option_id__in=ids).delete()
+        # Without per-row delete signals: departed rows are in no search
+        # result, fare calendar day or connection scan from now on.
+        TravelOption.objects.filter(pk__in=ids)._raw_delete(TravelOption.objects.db)
+    return len(options), len(bookings)
+
+
+def archive_departed(cutoff=None, chunk_size=1000, progress=None):
+    """Archive every departure before ``cutoff``; returns (travel options, bookings) moved.
+
+    ``progress`` is called with the running totals after every chunk.
+    """
+    cutoff = archive_cutoff() if cutoff is None else cutoff
+    total_options = total_bookings = 0
+    while True:
+        options, bookings = archive_chunk(cutoff, chunk_size)
+        if not options:
+            return total_options, total_bookings
+        total_options += options
+        total_bookings += bookings
+        if progress is not None:
+            progress(total_options, total_bookings)
@@ -0,0 +1,86 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render, aget_object_or_404
+
+from booking_app.utils import apaginate_by_cursor, apaginate_merged_by_cursor
+from .fare_calendar import fare_calendar
+from .search_cache import first_departure, search_cache
+from .services import upcoming_travel_options, search_travel_options
+from .models import Booking, ArchivedBooking
+from .forms import TravelSearchForm
+from .views import calendar_query
+
+# Templates read request.user and the session through the context
+# processors, which is sync-only, so rendering happens in a worker thread.
+arender = sync_to_async(render)
+
+
+async def _auser(request):
+    # request.user and request.auser() cache separately; share the user the
+    # async lookup loaded so rendering doesn't query for it a second time.
+    request.user = await request.auser()
+    return request.user
+
+
+async def home(request):
+    async def compute():
+        return [option async for option in upcoming_travel_options()[:6]]
+
+    travel_options = await search_cache.aget_or_set('home', {}, None, compute, first_departure)
+    return await arender(request, 'booking_app/home.html', {'travel_options': travel_options})
+
+
+def _search_criteria(form):
+    # Resolving city names may rebuild the city index from the database.
+    return form.search_criteria() if form.is_valid() else {}
+
+
+async def travel_list(request):
+    form = TravelSearchForm(request.GET or None)
+    criteria = await sync_to_async(_search_criteria)(form)
+    cursor = request.GET.get('cursor')
+
+    async def compute():
+        page = await apaginate_by_cursor(
+            request, search_travel_options(criteria), 8, ['departure_datetime', 'id'])
+        calendar = None
+        if criteria.get('route_ids') is not None:
+            calendar = await sync_to_async(fare_calendar)(criteria)
+        return page, calendar
+
+    travel_options_page, calendar = await search_cache.aget_or_set(
+        'travel_list', {**criteria, 'cursor': cursor}, criteria.get('route_ids'), compute,
+        lambda result: first_departure(result[0]))
+
+    return await arender(request, 'booking_app/travel_list.html', {
+        'travel_options': travel_options_page,
+        'fare_calendar': calendar,
+        'fare_calendar_query': calendar_query(request),
+        'form': form
+    })
+
+
+@login_required
+async def booking_list(request):
+    user = await _auser(request)
+    bookings = Booking.objects.filter(user=user).select_related('travel_option')
+    archived = ArchivedBooking.objects.filter(user=user).select_related('travel_option')
+
+    bookings_page = await apaginate_merged_by_cursor(
+        request, [bookings, archived], 8, ['-booking_date', '-id'])
+
+    return await arender(request, 'booking_app/booking_list.html', {
+        'bookings': bookings_page
+    })
+
+
+@login_required
+async def booking_detail(request, booking_id):
+    user = await _auser(request)
+    booking = await Booking.objects.select_related('travel_option').filter(
+        booking_id=booking_id, user=user).afirst()
+    if booking is None:
+        booking = await aget_object_or_404(
+            ArchivedBooking.objects.select_related('travel_option'),
+            booking_id=booking_id, user=user)
+    return await arender(request, 'booking_app/booking_detail.html', {'booking': booking})
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+UserModel = get_user_model()
+# Caches each worker has its own copy of.
+PER_PROCESS_CACHES = (LocMemCache, DummyCache)
+
+
+def _cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', None) or 'default']
+
+
+def _timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+
+def user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    _cache().delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that loads the user for each request from the cache.
+
+    Entries are dropped whenever the user is saved or deleted (see
+    booking_app.signals). That only reaches every worker through a cache
+    they share, so ``AUTH_USER_CACHE_ALIAS`` must name one: with a
+    per-process cache the others would keep serving a deactivated user or
+    an old password hash for up to ``AUTH_USER_CACHE_TIMEOUT`` seconds.
+    """
+
+    def __init__(self):
+        super().__init__()
+        if isinstance(_cache(), PER_PROCESS_CACHES):
+            raise ImproperlyConfigured(
+                "CachedModelBackend needs AUTH_USER_CACHE_ALIAS to name a cache "
+                "shared by all workers.")
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = _cache().get(key)
+        if user is None:
+            try:
+                user = UserModel._default_manager.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            _cache().set(key, user, _timeout())
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = await _cache().aget(key)
+        if user is None:
+            try:
+                user = await UserModel._default_manager.aget(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            await _cache().aset(key, user, _timeout())
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,16 @@
+from django.db.backends.mysql import base
+
+from booking_app.backends.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """django.db.backends.mysql with connections kept in a per-process pool."""
+
+    def ping_connection(self, raw):
+        raw.ping()
+
+    def _set_autocommit(self, autocommit):
+        # Every checkout goes through connect(), which sets autocommit again;
+        # skip the round trip when the pooled connection already has it.
+        if self.connection.get_autocommit() != autocommit:
+            super()._set_autocommit(autocommit)
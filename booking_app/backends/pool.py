@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.db import DatabaseError
+
+
+class PoolTimeout(DatabaseError):
+    """No connection became free within the pool's checkout timeout."""
+
+
+class PooledConnection:
+    def __init__(self, raw, generation):
+        self.raw = raw
+        self.generation = generation
+        self.created_at = self.returned_at = time.monotonic()
+
+
+class ConnectionPool:
+    """Thread-safe pool of DB-API connections for one database alias in one process.
+
+    ``connect``, ``ping`` and ``close`` are callables taking care of the
+    driver specifics. Connections that sat idle for longer than
+    ``health_check_after`` seconds are pinged before being handed out, and
+    connections older than ``max_lifetime`` (or opened before the last
+    ``recycle()``) are closed when they come back instead of being reused.
+    """
+
+    def __init__(self, connect, ping, close, max_size=10, timeout=5.0,
+                 max_lifetime=1800.0, health_check_after=1.0):
+        self._connect = connect
+        self._ping = ping
+        self._close = close
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+        self._condition = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = deque()
+        self._size = 0
+        self._in_use = 0
+        self._generation = 0
+        self.metrics = dict.fromkeys(
+            ['checkouts', 'connects', 'waits', 'timeouts', 'health_check_failures',
+             'recycled', 'discarded'], 0)
+        self.metrics['wait_seconds'] = 0.0
+
+    def _expired(self, conn, now):
+        if conn.generation != self._generation:
+            return True
+        return self.max_lifetime is not None and now - conn.created_at >= self.max_lifetime
+
+    def _close_quietly(self, conn):
+        try:
+            self._close(conn.raw)
+        except Exception:
+            pass
+
+    def checkout(self):
+        """Return an idle connection, or open one while the pool has room."""
+        with self._condition:
+            if self._pid != os.getpid():
+                # Never share a parent's sockets with a forked worker.
+                self._reset()
+            self.metrics['checkouts'] += 1
+            conn, deadline = None, None
+            while conn is None:
+                now = time.monotonic()
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if self._expired(candidate, now):
+                        self._size -= 1
+                        self.metrics['recycled'] += 1
+                        self._close_quietly(candidate)
+                    else:
+                        conn = candidate
+                        break
+                if conn is not None or self._size < self.max_size:
+                    break
+                if deadline is None:
+                    deadline = now + self.timeout
+                    self.metrics['waits'] += 1
+                if now >= deadline:
+                    self.metrics['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"No database connection free after {self.timeout}s "
+                        f"({self.max_size} in use).")
+                self._condition.wait(deadline - now)
+                self.metrics['wait_seconds'] += time.monotonic() - now
+            if conn is None:
+                # Claim the slot now, connect outside the lock.
+                self._size += 1
+            self._in_use += 1
+            generation = self._generation
+
+        try:
+            if conn is not None and time.monotonic() - conn.returned_at >= self.health_check_after:
+                try:
+                    self._ping(conn.raw)
+                except Exception:
+                    self._close_quietly(conn)
+                    conn = None
+                    with self._condition:
+                        self.metrics['health_check_failures'] += 1
+            if conn is None:
+                conn = PooledConnection(self._connect(), generation)
+                with self._condition:
+                    self.metrics['connects'] += 1
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        return conn
+
+    def checkin(self, conn, reusable=True):
+        """Give a connection back; it's closed instead when unusable or expired."""
+        with self._condition:
+            if self._pid != os.getpid():
+                self._close_quietly(conn)
+                return
+            self._in_use -= 1
+            now = time.monotonic()
+            if reusable and not self._expired(conn, now):
+                conn.returned_at = now
+                self._idle.append(conn)
+            else:
+                self._size -= 1
+                self.metrics['discarded' if not reusable else 'recycled'] += 1
+                self._close_quietly(conn)
+            self._condition.notify()
+
+    def recycle(self):
+        """Close idle connections now and the ones in use once they come back."""
+        with self._condition:
+            self._generation += 1
+            while self._idle:
+                self._size -= 1
+                self.metrics['recycled'] += 1
+                self._close_quietly(self._idle.pop())
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                **self.metrics,
+                'wait_seconds': round(self.metrics['wait_seconds'], 6),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, factory):
+    """Return the process-wide pool for ``alias``, creating it with ``factory()``."""
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = factory()
+        return _pools[alias]
+
+
+def pool_stats():
+    return {alias: pool.stats() for alias, pool in _pools.items()}
+
+
+class PooledDatabaseWrapperMixin:
+    """Check connections out of a ConnectionPool instead of opening and closing them.
+
+    Pool settings come from the ``POOL`` key of the database settings:
+    ``MAX_SIZE`` (per worker process), ``TIMEOUT`` (seconds to wait for a
+    free connection), ``MAX_LIFETIME`` and ``HEALTH_CHECK_AFTER`` (seconds
+    idle before a connection is pinged at checkout). ``MAX_SIZE`` 0 turns
+    pooling off.
+    """
+
+    pooled = None
+
+    def pool_options(self):
+        return self.settings_dict.get('POOL') or {}
+
+    @property
+    def pool(self):
+        options = self.pool_options()
+        if not options.get('MAX_SIZE', 10):
+            return None
+        return get_pool(self.alias, lambda: ConnectionPool(
+            connect=lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(
+                self.get_connection_params()),
+            ping=self.ping_connection,
+            close=lambda raw: raw.close(),
+            max_size=options.get('MAX_SIZE', 10),
+            timeout=options.get('TIMEOUT', 5.0),
+            max_lifetime=options.get('MAX_LIFETIME', 1800.0),
+            health_check_after=options.get('HEALTH_CHECK_AFTER', 1.0),
+        ))
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        self.pooled = pool.checkout()
+        return self.pooled.raw
+
+    def _close(self):
+        if self.pooled is None or self.connection is None:
+            return super()._close()
+        pooled, self.pooled = self.pooled, None
+        reusable = not self.errors_occurred
+        if reusable and (self.in_atomic_block or not self.autocommit):
+            # Never hand the next request an open transaction.
+            try:
+                with self.wrap_database_errors:
+                    self.connection.rollback()
+            except Exception:
+                reusable = False
+        self.pool.checkin(pooled, reusable)
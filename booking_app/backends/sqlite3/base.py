@@ -0,0 +1,10 @@
+from django.db.backends.sqlite3 import base
+
+from booking_app.backends.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """django.db.backends.sqlite3 with connections kept in a per-process pool."""
+
+    def ping_connection(self, raw):
+        raw.execute('SELECT 1')
@@ -0,0 +1,123 @@
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import Resolver404, resolve
+
+STICKY_COOKIE = 'primary_until'
+# The app label of DatabaseCache's table, read and written on the primary
+# without making the request sticky.
+CACHE_APP_LABEL = 'django_cache'
+
+
+class RoutingState:
+    """Per-request routing decision, shared with any threads the request spawns."""
+
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.wrote = False
+
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+class PrimaryReplicaRouter:
+    """Send reads to a replica only inside requests that were marked safe for it.
+
+    Everything else (management commands, writes, reads inside a
+    transaction, reads after this request wrote) uses the primary, so code
+    that doesn't opt in always sees its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label != CACHE_APP_LABEL:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def sticky_until(request):
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+def choose_replica(request):
+    """The replica alias this request may read from, or None for the primary."""
+    replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+    if not replicas or request.method not in ('GET', 'HEAD'):
+        return None
+    if sticky_until(request) > time.time():
+        return None
+    try:
+        match = resolve(request.path_info, getattr(request, 'urlconf', None))
+    except Resolver404:
+        return None
+    if match.view_name not in getattr(settings, 'REPLICA_READ_VIEWS', ()):
+        return None
+    return random.choice(replicas)
+
+
+class ReplicaRoutingMiddleware:
+    """Route read-only views (``settings.REPLICA_READ_VIEWS``) to a replica.
+
+    A request that writes anything sets a cookie keeping that client's reads
+    on the primary for ``settings.REPLICA_LAG`` seconds, so a user who just
+    booked or cancelled doesn't read a replica that hasn't caught up yet.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(choose_replica(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState(choose_replica(request))
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(request, response, state)
+
+    def finish(self, request, response, state):
+        if state.wrote and getattr(settings, 'DATABASE_REPLICAS', ()):
+            lag = getattr(settings, 'REPLICA_LAG', 2)
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + lag:.3f}',
+                                max_age=max(1, round(lag)), httponly=True, samesite='Lax')
+        return response
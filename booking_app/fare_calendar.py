@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import FareDay, TravelOption
+from .search_cache import search_cache
+from .utils import day_range
+
+DEFAULT_DAYS = 14
+MAX_DAYS = 90
+
+
+def day_key(route_id, travel_type, departure_datetime):
+    if route_id is None or travel_type is None or not isinstance(departure_datetime, datetime):
+        return None
+    if timezone.is_naive(departure_datetime):
+        departure_datetime = timezone.make_aware(departure_datetime)
+    return route_id, travel_type, timezone.localdate(departure_datetime)
+
+
+def summarize(rows):
+    """Fold (route_id, travel_type, departure_datetime, price, seats) rows into FareDays by day key."""
+    fare_days = {}
+    for route_id, travel_type, departure_datetime, price, seats in rows:
+        key = day_key(route_id, travel_type, departure_datetime)
+        fare_day = fare_days.get(key)
+        if fare_day is None:
+            fare_day = fare_days[key] = FareDay(
+                route_id=key[0], travel_type=key[1], day=key[2],
+                min_price=None, available_seats=0, departures=0)
+        if seats > 0:
+            fare_day.available_seats += seats
+            fare_day.departures += 1
+            if fare_day.min_price is None or price < fare_day.min_price:
+                fare_day.min_price = price
+    return fare_days
+
+
+def save_fare_days(fare_days):
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target.
+    unique_fields = (['route', 'day', 'travel_type']
+                     if connection.features.supports_update_conflicts_with_target else None)
+    FareDay.objects.bulk_create(
+        fare_days, update_conflicts=True, unique_fields=unique_fields,
+        update_fields=['min_price', 'available_seats', 'departures'])
+
+
+def refresh_fare_days(keys):
+    """Recompute the FareDays for these (route_id, travel_type, day) keys.
+
+    Only the departures of the affected routes and days are read, through
+    the (route, departure_datetime) index, so the cost follows the size of
+    the change rather than of the timetable.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    start = day_range(min(day for _, _, day in keys))[0]
+    end = day_range(max(day for _, _, day in keys))[1]
+    rows = TravelOption.objects.filter(
+        route_id__in={route_id for route_id, _, _ in keys},
+        departure_datetime__gte=start,
+        departure_datetime__lt=end
+    ).order_by().values_list(
+        'route_id', 'travel_type', 'departure_datetime', 'price', 'available_seats')
+    fare_days = {key: fare_day for key, fare_day in summarize(rows).items() if key in keys}
+    if fare_days:
+        save_fare_days(list(fare_days.values()))
+    gone = keys - fare_days.keys()
+    if gone:
+        condition = Q()
+        for route_id, travel_type, day in gone:
+            condition |= Q(route_id=route_id, travel_type=travel_type, day=day)
+        FareDay.objects.filter(condition).delete()
+
+
+def refresh_after_commit(fare_keys):
+    """Refresh the calendar for these TravelOption.fare_key()s once the transaction commits.
+
+    Cached searches of the same routes (which carry the calendar) are
+    invalidated after the refresh, so they are never repopulated from the
+    old figures.
+    """
+    fare_keys = list(fare_keys)
+    keys = {day_key(*fare_key) for fare_key in fare_keys} - {None}
+    route_ids = {fare_key[0] for fare_key in fare_keys if fare_key[0] is not None}
+    if not route_ids:
+        return
+
+    def refresh():
+        refresh_fare_days(keys)
+        search_cache.invalidate(route_ids)
+
+    transaction.on_commit(refresh)
+
+
+def rebuild_fare_calendar(batch_size=5000):
+    """Recompute every FareDay from today on from the departures table."""
+    today = timezone.localdate()
+    rows = TravelOption.objects.filter(
+        departure_datetime__gte=day_range(today)[0]
+    ).order_by().values_list(
+        'route_id', 'travel_type', 'departure_datetime', 'price', 'available_seats')
+    fare_days = summarize(row for row in rows.iterator(chunk_size=batch_size)
+                          if row[0] is not None)
+    with transaction.atomic():
+        FareDay.objects.filter(day__gte=today).delete()
+        FareDay.objects.bulk_create(fare_days.values(), batch_size=batch_size)
+    return len(fare_days)
+
+
+def fare_calendar(criteria, days=DEFAULT_DAYS):
+    """Cheapest fare, seats left and bookable departures per day for a search.
+
+    Covers ``days`` days from today over the search's routes and travel type
+    (``criteria`` as from TravelSearchForm.search_criteria(); its route_ids
+    must not be None). Days without departures have a None ``min_price``.
+    """
+    today = timezone.localdate()
+    fare_days = FareDay.objects.filter(
+        route_id__in=criteria['route_ids'],
+        day__gte=today,
+        day__lt=today + timedelta(days=days))
+    if criteria.get('travel_type'):
+        fare_days = fare_days.filter(travel_type=criteria['travel_type'])
+
+    calendar = {today + timedelta(days=offset): {'min_price': None, 'available_seats': 0,
+                                                 'departures': 0}
+                for offset in range(days)}
+    for day, min_price, seats, departures in fare_days.values_list(
+            'day', 'min_price', 'available_seats', 'departures'):
+        entry = calendar[day]
+        entry['available_seats'] += seats
+        entry['departures'] += departures
+        if min_price is not None and (entry['min_price'] is None or min_price < entry['min_price']):
+            entry['min_price'] = min_price
+    return [{'date': day, **entry} for day, entry in calendar.items()]
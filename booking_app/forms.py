@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from django.contrib.auth.models import User
 from .models import Booking
+from .search_index import get_city_index
 from django.utils import timezone
 
 
@@ -33,8 +34,12 @@ class TravelSearchForm(forms.Form):
     ]
 
     travel_type = forms.ChoiceField(choices=TRAVEL_TYPES, required=False)
-    source = forms.CharField(max_length=100, required=False)
-    destination = forms.CharField(max_length=100, required=False)
+    source = forms.CharField(
+        max_length=100, required=False,
+        widget=forms.TextInput(attrs={'list': 'city-options', 'autocomplete': 'off'}))
+    destination = forms.CharField(
+        max_length=100, required=False,
+        widget=forms.TextInput(attrs={'list': 'city-options', 'autocomplete': 'off'}))
     departure_date = forms.DateField(
         required=False, widget=forms.DateInput(attrs={'type': 'date'}))
 
@@ -45,6 +50,32 @@ class TravelSearchForm(forms.Form):
                 "Departure date cannot be in the past.")
         return date
 
+    def clean(self):
+        cleaned_data = super().clean()
+        source = cleaned_data.get('source')
+        destination = cleaned_data.get('destination')
+
+        # Resolve the typed city names to route keys once, so the search
+        # query is an indexed lookup on route_id. None means "any route".
+        cleaned_data['route_ids'] = None
+        cleaned_data['origin_ids'] = cleaned_data['destination_ids'] = None
+        if source or destination:
+            index = get_city_index()
+            origin_ids = index.resolve(source) if source else None
+            destination_ids = index.resolve(destination) if destination else None
+            cleaned_data['route_ids'] = index.route_ids(origin_ids, destination_ids)
+            cleaned_data['origin_ids'] = origin_ids
+            cleaned_data['destination_ids'] = destination_ids
+        return cleaned_data
+
+    def search_criteria(self):
+        """The normalized filters a search runs on; equal criteria mean equal results."""
+        return {
+            'travel_type': self.cleaned_data.get('travel_type') or None,
+            'route_ids': self.cleaned_data.get('route_ids'),
+            'departure_date': self.cleaned_data.get('departure_date'),
+        }
+
 
 class BookingForm(forms.ModelForm):
     class Meta:
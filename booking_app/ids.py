@@ -0,0 +1,210 @@
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections
+from django.utils import timezone
+
+# 41 bits of milliseconds since EPOCH_MS, 10 bits of worker id and a 12 bit
+# per-millisecond sequence, i.e. up to 4096 ids per millisecond per worker.
+EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Crockford's base32 leaves out I, L, O and U so ids are easy to read out.
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ENCODED_LENGTH = 13  # ceil(63 / 5)
+
+LEASE_SECONDS = 600
+
+
+def encode(value):
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def decode(text):
+    value = 0
+    for char in text.upper():
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+def default_worker_id():
+    worker_id = getattr(settings, 'BOOKING_ID_WORKER_ID', None)
+    if worker_id is None:
+        return None
+    return int(worker_id) & MAX_WORKER_ID
+
+
+class WorkerIdLease:
+    """A worker id leased from the BookingIdWorker table for one process.
+
+    The lease is renewed once half of it has passed; if it ran out meanwhile
+    and another process took the id, a new one is leased. It goes through a
+    connection of its own in autocommit mode, so a booking transaction that
+    rolls back can't take the lease with it. Inside a transaction it is only
+    renewed once it has run out: SQLite would make the lease connection wait
+    for that transaction, so signals.py renews it ahead of them.
+    """
+
+    def __init__(self, seconds=LEASE_SECONDS, using=DEFAULT_DB_ALIAS):
+        self.seconds = seconds
+        self.using = using
+        self.owner = f'{socket.gethostname()[:60]}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.worker_id = None
+        self._renew_at = self._expires_at = 0
+
+    def current(self):
+        started = time.monotonic()
+        if started >= self._renew_at and (
+                started >= self._expires_at or not connections[self.using].in_atomic_block):
+            connection = connections.create_connection(self.using)
+            try:
+                with connection.cursor() as cursor:
+                    self.worker_id = self._acquire(connection, cursor)
+            finally:
+                connection.close()
+            self._renew_at = started + self.seconds / 2
+            self._expires_at = started + self.seconds
+        return self.worker_id
+
+    def _acquire(self, connection, cursor):
+        table = connection.ops.quote_name(apps.get_model('booking_app', 'BookingIdWorker')._meta.db_table)
+        now = timezone.now()
+        adapt = connection.ops.adapt_datetimefield_value
+        expires_at = adapt(now + timezone.timedelta(seconds=self.seconds))
+        now = adapt(now)
+
+        if self.worker_id is not None:
+            cursor.execute(
+                f'UPDATE {table} SET expires_at = %s WHERE worker_id = %s AND owner = %s',
+                [expires_at, self.worker_id, self.owner])
+            if cursor.rowcount == 1:
+                return self.worker_id
+
+        for _ in range(10):
+            cursor.execute(f'SELECT worker_id FROM {table} WHERE expires_at < %s ORDER BY expires_at', [now])
+            for (worker_id,) in cursor.fetchall():
+                cursor.execute(
+                    f'UPDATE {table} SET owner = %s, expires_at = %s WHERE worker_id = %s AND expires_at < %s',
+                    [self.owner, expires_at, worker_id, now])
+                if cursor.rowcount == 1:
+                    return worker_id
+
+            cursor.execute(f'SELECT worker_id FROM {table}')
+            leased = {worker_id for (worker_id,) in cursor.fetchall()}
+            worker_id = next((n for n in range(MAX_WORKER_ID + 1) if n not in leased), None)
+            if worker_id is None:
+                break
+            try:
+                cursor.execute(
+                    f'INSERT INTO {table} (worker_id, owner, expires_at) VALUES (%s, %s, %s)',
+                    [worker_id, self.owner, expires_at])
+                return worker_id
+            except IntegrityError:
+                continue  # another process took it first
+        raise RuntimeError('No booking id worker id is free; set BOOKING_ID_WORKER_ID.')
+
+
+class IdGenerator:
+    """Snowflake-style generator of time-sortable 63 bit ids.
+
+    Ids are unique per worker id without touching the database for each
+    id. The worker id is ``settings.BOOKING_ID_WORKER_ID`` when set,
+    otherwise one leased from the database (WorkerIdLease). State, and the
+    lease, are reset after a fork so gunicorn workers never share either.
+    """
+
+    def __init__(self, worker_id=None, clock=time.time_ns, lease=WorkerIdLease):
+        self._fixed_worker_id = worker_id
+        self._clock = clock
+        self._new_lease = lease
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lease = None
+        if self._fixed_worker_id is None:
+            self._worker_id = default_worker_id()
+            if self._worker_id is None:
+                self._lease = self._new_lease()
+        else:
+            self._worker_id = self._fixed_worker_id & MAX_WORKER_ID
+        self._last_ms = -1
+        self._sequence = 0
+
+    @property
+    def worker_id(self):
+        if self._lease is not None:
+            return self._lease.current()
+        return self._worker_id
+
+    def _now_ms(self):
+        return self._clock() // 1_000_000 - EPOCH_MS
+
+    def renew_lease(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            return self.worker_id
+
+    def next_int(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            worker_id = self.worker_id
+
+            now = self._now_ms()
+            if now < self._last_ms:
+                # Clock stepped backwards; keep issuing from the last
+                # millisecond we used instead of risking duplicates.
+                now = self._last_ms
+
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Borrow the next millisecond rather than wait for the
+                    # clock, which may be far behind after stepping back.
+                    now = self._last_ms + 1
+            else:
+                self._sequence = 0
+
+            self._last_ms = now
+            return ((now << (WORKER_BITS + SEQUENCE_BITS))
+                    | (worker_id << SEQUENCE_BITS)
+                    | self._sequence)
+
+    def next_id(self, prefix=''):
+        return f"{prefix}{encode(self.next_int())}"
+
+
+def parse(id_value):
+    """Split an encoded id (without prefix) into (timestamp_ms, worker_id, sequence)."""
+    value = decode(id_value)
+    return (
+        (value >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS,
+        (value >> SEQUENCE_BITS) & MAX_WORKER_ID,
+        value & MAX_SEQUENCE,
+    )
+
+
+_generator = IdGenerator()
+
+
+def new_booking_id():
+    return _generator.next_id(prefix='BK')
+
+
+def renew_booking_id_lease():
+    return _generator.renew_lease()
@@ -0,0 +1,282 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import TravelOption
+
+KINDS = {code: kind for kind, (code, _) in enumerate(TravelOption.TRAVEL_TYPES)}
+NEVER = 2 ** 62
+
+DEFAULTS = {
+    'MAX_CHANGES': 2,
+    # Minutes needed before boarding, by the travel type being boarded.
+    'MIN_LAYOVER': {'flight': 60, 'train': 15, 'bus': 15},
+    'HORIZON_HOURS': 48,
+    'RESULTS': 5,
+    'REFRESH_INTERVAL': 5,
+    # Rows committed up to this many seconds after their updated_at are still seen.
+    'REFRESH_OVERLAP': 30,
+    'MAX_AGE': 3600,
+    'REBUILD_AFTER_CHANGES': 1000,
+}
+
+
+def search_settings():
+    return {**DEFAULTS, **getattr(settings, 'CONNECTION_SEARCH', {})}
+
+
+def _entry(row):
+    pk, origin_id, destination_id, departure, arrival, seats, travel_type = row
+    return (int(departure.timestamp()), pk, origin_id, destination_id,
+            int(arrival.timestamp()), seats, KINDS[travel_type])
+
+
+class ConnectionIndex:
+    """Departures as parallel arrays sorted by (departure, pk), for connection scans.
+
+    Rows are ``(pk, origin_city_id, destination_city_id, departure_datetime,
+    arrival_datetime, available_seats, travel_type)``. A second pair of
+    arrays sorted by pk finds an entry's departure time, so single
+    departures can be updated, moved or removed in place; array inserts and
+    deletes are a memmove, not a rebuild.
+    """
+
+    COLUMNS = [('departures', 'q'), ('pks', 'q'), ('origins', 'l'), ('destinations', 'l'),
+               ('arrivals', 'q'), ('seats', 'l'), ('kinds', 'b')]
+
+    def __init__(self, rows=()):
+        entries = sorted(_entry(row) for row in rows)
+        for position, (name, typecode) in enumerate(self.COLUMNS):
+            setattr(self, name, array(typecode, (entry[position] for entry in entries)))
+        by_pk = sorted((entry[1], entry[0]) for entry in entries)
+        self.pk_order = array('q', (pk for pk, _ in by_pk))
+        self.pk_departures = array('q', (departure for _, departure in by_pk))
+
+    def __len__(self):
+        return len(self.departures)
+
+    def _find(self, pk):
+        i = bisect_left(self.pk_order, pk)
+        if i == len(self.pk_order) or self.pk_order[i] != pk:
+            return None
+        position = bisect_left(self.departures, self.pk_departures[i])
+        while self.pks[position] != pk:
+            position += 1
+        return position
+
+    def remove(self, pk):
+        position = self._find(pk)
+        if position is None:
+            return
+        for name, _ in self.COLUMNS:
+            del getattr(self, name)[position]
+        i = bisect_left(self.pk_order, pk)
+        del self.pk_order[i]
+        del self.pk_departures[i]
+
+    def _insert(self, entry):
+        departure, pk = entry[0], entry[1]
+        position = bisect_left(self.departures, departure)
+        while (position < len(self.departures) and self.departures[position] == departure
+               and self.pks[position] < pk):
+            position += 1
+        for (name, _), value in zip(self.COLUMNS, entry):
+            getattr(self, name).insert(position, value)
+        i = bisect_left(self.pk_order, pk)
+        self.pk_order.insert(i, pk)
+        self.pk_departures.insert(i, departure)
+
+    def update(self, rows):
+        """Apply changed rows: seat changes in place, anything else as a move."""
+        for row in rows:
+            entry = _entry(row)
+            position = self._find(entry[1])
+            if position is not None:
+                if all(getattr(self, name)[position] == value
+                       for (name, _), value in zip(self.COLUMNS, entry) if name != 'seats'):
+                    self.seats[position] = entry[5]
+                    continue
+                self.remove(entry[1])
+            self._insert(entry)
+
+    def _scan(self, origin_ids, destination_ids, earliest, max_changes, layovers,
+              seats, horizon, kind):
+        """Earliest-arrival scan; returns the positions of the legs, or None.
+
+        ``arrive[k][city]`` is the earliest arrival at city using at most k
+        legs. Connections are visited in departure order, so each is looked
+        at once; among equally early itineraries the one with fewest legs wins.
+        """
+        departures, arrivals = self.departures, self.arrivals
+        origins, destinations = self.origins, self.destinations
+        seats_left, kinds = self.seats, self.kinds
+        legs = max_changes + 1
+        starts = set(origin_ids)
+        targets = set(destination_ids) - starts
+        arrive = [dict.fromkeys(starts, earliest)] + [{} for _ in range(legs)]
+        parent = [None] + [{} for _ in range(legs)]
+        best = NEVER
+        stop = earliest + horizon
+
+        for i in range(bisect_left(departures, earliest), len(departures)):
+            departure = departures[i]
+            if departure >= best or departure > stop:
+                break
+            if seats_left[i] < seats or (kind is not None and kinds[i] != kind):
+                continue
+            origin = origins[i]
+            for k in range(legs):
+                reached = arrive[k].get(origin)
+                if reached is not None and reached + (layovers[kinds[i]] if k else 0) <= departure:
+                    break
+            else:
+                continue
+            destination, arrival = destinations[i], arrivals[i]
+            for j in range(k + 1, legs + 1):
+                current = arrive[j].get(destination)
+                if current is not None and current <= arrival:
+                    break
+                arrive[j][destination] = arrival
+                parent[j][destination] = i
+            if destination in targets and arrival < best:
+                best = arrival
+
+        if best == NEVER:
+            return None
+        level, city = min((j, target) for j in range(1, legs + 1) for target in targets
+                          if arrive[j].get(target) == best)
+        path = []
+        while True:
+            i = parent[level][city]
+            path.append(i)
+            city = origins[i]
+            if city in starts:
+                return path[::-1]
+            level -= 1
+
+    def journeys(self, origin_ids, destination_ids, earliest, max_changes=2, layovers=(0, 0, 0),
+                 seats=1, horizon=48 * 3600, travel_type=None, limit=5):
+        """Up to ``limit`` itineraries as lists of TravelOption pks, by departure.
+
+        Each is the earliest arrival for a departure after the previous
+        itinerary's; ``layovers`` holds the seconds needed before boarding,
+        indexed like KINDS.
+        """
+        kind = KINDS[travel_type] if travel_type else None
+        found = []
+        while len(found) < limit:
+            path = self._scan(origin_ids, destination_ids, earliest, max_changes, layovers,
+                              seats, horizon, kind)
+            if path is None:
+                break
+            found.append([self.pks[i] for i in path])
+            earliest = self.departures[path[0]] + 1
+        return found
+
+
+def _rows(queryset):
+    return queryset.filter(route__isnull=False).values_list(
+        'pk', 'route__origin_id', 'route__destination_id', 'departure_datetime',
+        'arrival_datetime', 'available_seats', 'travel_type')
+
+
+_index = None
+_built_at = 0
+_refreshed_at = 0
+_synced_until = None
+_lock = threading.Lock()
+
+
+def _connection_index():
+    """This process's ConnectionIndex, caught up with TravelOption changes.
+
+    Built from upcoming departures, then kept current from ``updated_at``
+    every REFRESH_INTERVAL seconds. Deletes don't show there: this process's
+    are applied by forget_travel_option, other processes' when
+    find_itineraries finds the row gone. Rebuilt after MAX_AGE seconds (to
+    drop departed rows) or when too many rows changed at once. Call with
+    _lock held.
+    """
+    global _index, _built_at, _refreshed_at, _synced_until
+    options = search_settings()
+    now = time.monotonic()
+    if _index is not None and now - _refreshed_at < options['REFRESH_INTERVAL']:
+        return _index
+
+    started = timezone.now()
+    if _index is not None and now - _built_at < options['MAX_AGE']:
+        since = _synced_until - timezone.timedelta(seconds=options['REFRESH_OVERLAP'])
+        changed = list(_rows(TravelOption.objects.filter(updated_at__gt=since)))
+        if len(changed) <= options['REBUILD_AFTER_CHANGES']:
+            _index.update(changed)
+            _refreshed_at, _synced_until = now, started
+            return _index
+
+    _index = ConnectionIndex(_rows(TravelOption.objects.filter(departure_datetime__gte=started)))
+    _built_at = _refreshed_at = now
+    _synced_until = started
+    return _index
+
+
+def reset_connection_index():
+    global _index
+    with _lock:
+        _index = None
+
+
+def forget_travel_option(pk):
+    with _lock:
+        if _index is not None:
+            _index.remove(pk)
+
+
+def find_itineraries(origin_ids, destination_ids, earliest, travel_type=None, seats=1):
+    """Itineraries with up to MAX_CHANGES changes, as dicts with the legs' TravelOptions.
+
+    Seats are checked again against the database rows, so the index being
+    a few seconds behind never offers a sold-out or deleted leg; such legs
+    are corrected in the index and the search run again without them.
+    """
+    options = search_settings()
+    layovers = [0] * len(KINDS)
+    for code, minutes in options['MIN_LAYOVER'].items():
+        layovers[KINDS[code]] = minutes * 60
+    travel_options = {}
+    while True:
+        with _lock:
+            index = _connection_index()
+            found = index.journeys(
+                origin_ids, destination_ids, int(earliest.timestamp()), options['MAX_CHANGES'],
+                layovers, seats, options['HORIZON_HOURS'] * 3600, travel_type, options['RESULTS'])
+        wanted = {pk for pks in found for pk in pks}
+        travel_options.update(TravelOption.objects.in_bulk(wanted - travel_options.keys()))
+        stale = {pk for pk in wanted
+                 if pk not in travel_options or travel_options[pk].available_seats < seats}
+        if not stale:
+            break
+        rows = list(_rows(TravelOption.objects.filter(pk__in=stale)))
+        with _lock:
+            index.update(rows)
+            for pk in stale - {row[0] for row in rows}:
+                index.remove(pk)
+        for pk in stale:
+            travel_options.pop(pk, None)
+
+    itineraries = []
+    for pks in found:
+        legs = [travel_options[pk] for pk in pks]
+        for previous, leg in zip(legs, legs[1:]):
+            leg.layover_minutes = int(
+                (leg.departure_datetime - previous.arrival_datetime).total_seconds() // 60)
+        itineraries.append({
+            'legs': legs,
+            'departure': legs[0].departure_datetime,
+            'arrival': legs[-1].arrival_datetime,
+            'changes': len(legs) - 1,
+            'total_price': sum(leg.price for leg in legs),
+        })
+    return itineraries
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking_app.archive import archive_cutoff, archive_departed
+
+
+class Command(BaseCommand):
+    help = ("Move departures that left more than --days days ago, and their bookings, "
+            "into the archive tables.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Archive departures older than this (default: ARCHIVE_AFTER_DAYS).")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Travel options moved per transaction.")
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['days'])
+        started = time.perf_counter()
+
+        def progress(total_options, total_bookings):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{total_options} travel options, {total_bookings} bookings "
+                                  f"{self.rate(total_options + total_bookings, started)}")
+
+        total_options, total_bookings = archive_departed(
+            cutoff, options['chunk_size'], progress=progress)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {total_options} travel options and {total_bookings} bookings departing "
+            f"before {cutoff:%Y-%m-%d %H:%M} {self.rate(total_options + total_bookings, started)}."))
+
+    @staticmethod
+    def rate(rows, started):
+        elapsed = time.perf_counter() - started
+        return f"in {elapsed:.1f}s ({rows / max(elapsed, 1e-6):.0f} rows/s)"
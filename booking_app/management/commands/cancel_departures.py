@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from booking_app.models import TravelOption
+from booking_app.services import cancel_departures
+
+
+class Command(BaseCommand):
+    help = ("Cancel every confirmed and pending booking of the given departures "
+            "and give their seats back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('travel_ids', nargs='+', metavar='travel_id')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Bookings cancelled per transaction.")
+
+    def handle(self, *args, **options):
+        travel_ids = set(options['travel_ids'])
+        found = dict(TravelOption.objects.filter(travel_id__in=travel_ids)
+                     .values_list('travel_id', 'pk'))
+        missing = travel_ids - found.keys()
+        if missing:
+            raise CommandError(f"Unknown travel_id: {', '.join(sorted(missing))}")
+
+        cancelled, seats = cancel_departures(list(found.values()), options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Cancelled {cancelled} bookings on {len(found)} departures, "
+            f"restored {seats} seats."))
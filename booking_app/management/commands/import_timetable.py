@@ -0,0 +1,71 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking_app.timetable import Checkpoint, InvalidRow, import_timetable
+
+
+class Command(BaseCommand):
+    help = ("Import travel options from a CSV or JSONL timetable (file or '-' for stdin), "
+            "inserting new travel_ids and updating existing ones.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Timetable file, or '-' to read stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Defaults to the file extension, or csv for stdin.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--checkpoint',
+                            help="Progress file used to resume a failed import "
+                                 "(default: <path>.checkpoint, none for stdin).")
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore an existing checkpoint and start from the first record.")
+        parser.add_argument('--update-seats', action='store_true',
+                            help="Overwrite available_seats of existing travel options, except "
+                                 "those with a seat map or split seat counter. Off by default "
+                                 "so booked seats aren't handed back.")
+        parser.add_argument('--max-errors', type=int, default=100,
+                            help="Abort after this many invalid records.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        checkpoint_path = options['checkpoint']
+        if checkpoint_path is None and path != '-':
+            checkpoint_path = f"{path}.checkpoint"
+        checkpoint = Checkpoint(checkpoint_path)
+        if options['restart']:
+            checkpoint.clear()
+
+        started = time.monotonic()
+
+        def on_batch(stats):
+            done = stats['records'] - stats['skipped']
+            rate = done / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f"{stats['records']} records, {stats['imported']} imported, "
+                f"{stats['invalid']} invalid ({rate:.0f} rows/s)")
+
+        def on_error(error):
+            self.stderr.write(f"Skipped {error}")
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            stats = import_timetable(
+                stream, fmt, options['batch_size'], checkpoint, options['update_seats'],
+                options['max_errors'], on_batch, on_error)
+        except InvalidRow:
+            raise CommandError(
+                f"More than {options['max_errors']} invalid records. Fix them (or raise "
+                f"--max-errors) and rerun to resume from the last committed batch.")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        if stats['skipped']:
+            self.stdout.write(f"Resumed after {stats['skipped']} records from the checkpoint.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['imported']} travel options in {elapsed:.1f}s "
+            f"({stats['imported'] / max(elapsed, 1e-6):.0f} rows/s), "
+            f"{stats['invalid']} invalid records skipped."))
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from booking_app.services import drain_booking_queue, pending_departures
+
+
+class Command(BaseCommand):
+    help = ("Confirm or reject pending bookings of departures that take queued bookings, "
+            "in batches of one transaction per departure.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Pending bookings per departure per transaction.")
+        parser.add_argument('--interval', type=float, default=0.2,
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, **options):
+        totals = {'confirmed': 0, 'rejected': 0, 'seats': 0}
+        try:
+            while True:
+                drained = False
+                # One batch per departure per pass, so one hot sale can't
+                # starve the others.
+                for travel_option_id in list(pending_departures()):
+                    try:
+                        stats = drain_booking_queue(travel_option_id, options['batch_size'])
+                    except OperationalError as e:
+                        # Deadlocks and lock wait timeouts roll the batch
+                        # back; it is simply retried on the next pass.
+                        self.stderr.write(f"Travel option {travel_option_id}: {e}")
+                        continue
+                    if stats['confirmed'] or stats['rejected']:
+                        drained = True
+                        self.stdout.write(
+                            f"Travel option {travel_option_id}: {stats['confirmed']} confirmed, "
+                            f"{stats['rejected']} rejected, {stats['seats']} seats")
+                    for key in totals:
+                        totals[key] += stats[key]
+                if not drained:
+                    if options['once']:
+                        break
+                    close_old_connections()
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['confirmed']} bookings confirmed, {totals['rejected']} rejected."))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from booking_app.services import rebalance_seat_shards, sharded_departures
+
+
+class Command(BaseCommand):
+    help = ("Keep available_seats of departures with a split seat counter at the sum of "
+            "their shards, and move seats between shards that have become uneven.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help="Seconds between passes over the sharded departures.")
+        parser.add_argument('--once', action='store_true',
+                            help="Make a single pass and exit.")
+
+    def handle(self, *args, **options):
+        passes = moved = 0
+        try:
+            while True:
+                for travel_option_id in list(sharded_departures()):
+                    try:
+                        stats = rebalance_seat_shards(travel_option_id)
+                    except OperationalError as e:
+                        self.stderr.write(f"Travel option {travel_option_id}: {e}")
+                        continue
+                    if stats and stats['moved']:
+                        moved += stats['moved']
+                        self.stdout.write(
+                            f"Travel option {travel_option_id}: moved {stats['moved']} "
+                            f"of {stats['seats']} seats")
+                passes += 1
+                if options['once']:
+                    break
+                close_old_connections()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"{passes} passes, {moved} seats moved."))
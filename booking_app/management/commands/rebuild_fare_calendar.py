@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from booking_app.fare_calendar import rebuild_fare_calendar
+
+
+class Command(BaseCommand):
+    help = ("Recompute the fare calendar from the travel options table. It is kept "
+            "current on every change; run this after editing departures with raw SQL.")
+
+    def handle(self, *args, **options):
+        count = rebuild_fare_calendar()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} fare calendar days."))
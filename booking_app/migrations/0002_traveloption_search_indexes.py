@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['departure_datetime', 'available_seats'], name='travel_departure_seats_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['travel_type', 'departure_datetime', 'available_seats'], name='travel_type_departure_idx'),
+        ),
+    ]
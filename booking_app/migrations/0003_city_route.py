@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_routes(apps, schema_editor):
+    City = apps.get_model('booking_app', 'City')
+    Route = apps.get_model('booking_app', 'Route')
+    TravelOption = apps.get_model('booking_app', 'TravelOption')
+
+    cities = {}
+
+    def city_for(name):
+        name = ' '.join(name.split())
+        key = name.casefold()
+        if key not in cities:
+            cities[key], _ = City.objects.get_or_create(name=name)
+        return cities[key]
+
+    pairs = TravelOption.objects.values_list('source', 'destination').distinct()
+    for source, destination in pairs:
+        route, _ = Route.objects.get_or_create(
+            origin=city_for(source), destination=city_for(destination))
+        TravelOption.objects.filter(
+            source=source, destination=destination).update(route=route)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0002_traveloption_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'cities',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Route',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='arriving_routes', to='booking_app.city')),
+                ('origin', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='departing_routes', to='booking_app.city')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='route',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='travel_options', to='booking_app.route'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['route', 'departure_datetime', 'available_seats'], name='travel_route_departure_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='route',
+            constraint=models.UniqueConstraint(fields=('origin', 'destination'), name='unique_route'),
+        ),
+        migrations.RunPython(populate_routes, migrations.RunPython.noop),
+    ]
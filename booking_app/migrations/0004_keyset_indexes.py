@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0003_city_route'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # Add the new indexes before dropping the old ones: MySQL refuses to drop
+    # the only index covering a foreign key.
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'booking_date', 'id'], name='booking_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['departure_datetime', 'id', 'available_seats'], name='travel_departure_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['travel_type', 'departure_datetime', 'id', 'available_seats'], name='travel_type_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['route', 'departure_datetime', 'id', 'available_seats'], name='travel_route_key_idx'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RemoveIndex(
+            model_name='traveloption',
+            name='travel_departure_seats_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='traveloption',
+            name='travel_type_departure_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='traveloption',
+            name='travel_route_departure_idx',
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0004_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveloption',
+            name='queue_bookings',
+            field=models.BooleanField(default=False, help_text='Take bookings as pending and confirm them in batches (process_booking_queue). Use for hot sales.'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('rejected', 'Rejected'), ('cancelled', 'Cancelled')], default='confirmed', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'travel_option', 'id'], name='booking_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_fare_days(apps, schema_editor):
+    FareDay = apps.get_model('booking_app', 'FareDay')
+    TravelOption = apps.get_model('booking_app', 'TravelOption')
+
+    fare_days = {}
+    rows = TravelOption.objects.filter(
+        departure_datetime__gte=timezone.now() - timezone.timedelta(days=1),
+        route__isnull=False,
+    ).values_list('route_id', 'travel_type', 'departure_datetime', 'price', 'available_seats')
+    for route_id, travel_type, departure_datetime, price, seats in rows.iterator(chunk_size=5000):
+        key = (route_id, travel_type, timezone.localdate(departure_datetime))
+        if key not in fare_days:
+            fare_days[key] = FareDay(route_id=route_id, travel_type=travel_type, day=key[2],
+                                     min_price=None, available_seats=0, departures=0)
+        fare_day = fare_days[key]
+        if seats > 0:
+            fare_day.available_seats += seats
+            fare_day.departures += 1
+            if fare_day.min_price is None or price < fare_day.min_price:
+                fare_day.min_price = price
+    FareDay.objects.bulk_create(fare_days.values(), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0005_booking_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FareDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('travel_type', models.CharField(choices=[('flight', 'Flight'), ('train', 'Train'), ('bus', 'Bus')], max_length=10)),
+                ('day', models.DateField()),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('available_seats', models.IntegerField()),
+                ('departures', models.IntegerField(help_text='Departures with seats left.')),
+                ('route', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='fare_days', to='booking_app.route')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('route', 'day', 'travel_type'), name='unique_fare_day')],
+            },
+        ),
+        migrations.RunPython(populate_fare_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0006_fare_calendar'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='traveloption',
+            index=models.Index(fields=['updated_at'], name='travel_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0007_traveloption_updated_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['booking_date', 'id'], name='booking_date_idx'),
+        ),
+    ]
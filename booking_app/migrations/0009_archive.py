@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0008_booking_date_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTravelOption',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('travel_id', models.CharField(db_index=True, max_length=50)),
+                ('travel_type', models.CharField(choices=[('flight', 'Flight'), ('train', 'Train'), ('bus', 'Bus')], max_length=10)),
+                ('source', models.CharField(max_length=100)),
+                ('destination', models.CharField(max_length=100)),
+                ('departure_datetime', models.DateTimeField()),
+                ('arrival_datetime', models.DateTimeField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('available_seats', models.IntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('route', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='booking_app.route')),
+            ],
+            options={
+                'ordering': ['departure_datetime'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('booking_id', models.CharField(max_length=50, unique=True)),
+                ('number_of_seats', models.IntegerField()),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('booking_date', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('rejected', 'Rejected'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to=settings.AUTH_USER_MODEL)),
+                ('travel_option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='booking_app.archivedtraveloption')),
+            ],
+            options={
+                'ordering': ['-booking_date'],
+                'indexes': [models.Index(fields=['user', 'booking_date', 'id'], name='archived_booking_user_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:18
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0009_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='traveloption',
+            name='seat_shards',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text="Seat counter rows (SeatShard) the capacity is split over, so concurrent bookings don't all update this row; 0 when not split. available_seats is then their sum, kept by rebalance_seat_shards."),
+        ),
+        migrations.CreateModel(
+            name='SeatShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('available_seats', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)])),
+                ('travel_option', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='booking_app.traveloption')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('travel_option', 'shard'), name='seat_shard_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:27
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0010_seat_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='seat_numbers',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='seat_numbers',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='seat_map',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='traveloption',
+            name='seats_per_row',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Seats in each row of the seat map (1A, 1B, ...). Bookings then get seat numbers, kept together where possible; 0 for no seat map.', validators=[django.core.validators.MaxValueValidator(10)]),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_app', '0011_seat_map'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingIdWorker',
+            fields=[
+                ('worker_id', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('owner', models.CharField(max_length=100)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
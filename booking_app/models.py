@@ -1,7 +1,54 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.core.validators import MinValueValidator
-from django.utils import timezone
+from django.core.validators import MaxValueValidator, MinValueValidator
+
+from .ids import new_booking_id
+from .seatmap import SeatMap
+
+
+class City(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ['name']
+        verbose_name_plural = 'cities'
+
+    def __str__(self):
+        return self.name
+
+
+class RouteManager(models.Manager):
+    def for_names(self, source, destination):
+        """Return the route between two city names, creating cities and route as needed."""
+        origin = self._city(source)
+        destination = self._city(destination)
+        route, _ = self.get_or_create(origin=origin, destination=destination)
+        return route
+
+    def _city(self, name):
+        name = ' '.join(name.split())
+        city = City.objects.filter(name__iexact=name).first()
+        if city is None:
+            city, _ = City.objects.get_or_create(name=name)
+        return city
+
+
+class Route(models.Model):
+    origin = models.ForeignKey(
+        City, on_delete=models.PROTECT, related_name='departing_routes')
+    destination = models.ForeignKey(
+        City, on_delete=models.PROTECT, related_name='arriving_routes')
+
+    objects = RouteManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['origin', 'destination'], name='unique_route'),
+        ]
+
+    def __str__(self):
+        return f"{self.origin} to {self.destination}"
 
 
 class TravelOption(models.Model):
@@ -20,28 +67,170 @@ class TravelOption(models.Model):
     price = models.DecimalField(
         max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     available_seats = models.IntegerField(validators=[MinValueValidator(0)])
+    queue_bookings = models.BooleanField(
+        default=False,
+        help_text="Take bookings as pending and confirm them in batches "
+                  "(process_booking_queue). Use for hot sales.")
+    seat_shards = models.PositiveSmallIntegerField(
+        default=0, editable=False,
+        help_text="Seat counter rows (SeatShard) the capacity is split over, so "
+                  "concurrent bookings don't all update this row; 0 when not split. "
+                  "available_seats is then their sum, kept by rebalance_seat_shards.")
+    seats_per_row = models.PositiveSmallIntegerField(
+        default=0, validators=[MaxValueValidator(10)],
+        help_text="Seats in each row of the seat map (1A, 1B, ...). Bookings then "
+                  "get seat numbers, kept together where possible; 0 for no seat map.")
+    # Taken seats, one bit each; see booking_app.seatmap.
+    seat_map = models.BinaryField(null=True, editable=False)
+    # Normalized (source, destination) key; kept in sync with the free-text
+    # fields on save. The composite index below leads with it, so the FK
+    # doesn't need an index of its own.
+    route = models.ForeignKey(
+        Route, on_delete=models.PROTECT, related_name='travel_options',
+        null=True, blank=True, editable=False, db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Written by bookings and the seat counter services, not by editing.
+    SEAT_FIELDS = ('available_seats', 'seat_map', 'seat_shards')
+
     class Meta:
         ordering = ['departure_datetime']
+        # Upcoming departures with seats left in (departure_datetime, id)
+        # order, the keyset travel_list pages on. available_seats trails so
+        # the seats filter is checked inside the index.
+        indexes = [
+            models.Index(fields=['departure_datetime', 'id', 'available_seats'],
+                         name='travel_departure_key_idx'),
+            models.Index(fields=['travel_type', 'departure_datetime', 'id', 'available_seats'],
+                         name='travel_type_key_idx'),
+            models.Index(fields=['route', 'departure_datetime', 'id', 'available_seats'],
+                         name='travel_route_key_idx'),
+            # Changes the connection search index catches up on.
+            models.Index(fields=['updated_at'], name='travel_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.travel_id} - {self.source} to {self.destination}"
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._route_names = self._current_route_names()
+        self._loaded_route_id = self.__dict__.get('route_id')
+        self._loaded_fare_key = self.fare_key()
+        self._loaded_seats = self._current_seats()
+
+    def _current_seats(self):
+        return {field: self.__dict__[field] for field in self.SEAT_FIELDS if field in self.__dict__}
+
+    def _current_route_names(self):
+        # Read through __dict__ so deferred fields aren't loaded here.
+        return (self.__dict__.get('source'), self.__dict__.get('destination'))
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Bookings change the seats under a row lock or with F()
+            # updates; a full-row save of a copy loaded earlier would write
+            # them back stale. Only seat fields changed on this copy are saved.
+            loaded = self._loaded_seats
+            unchanged = {field for field, value in self._current_seats().items()
+                         if field in loaded and loaded[field] == value}
+            if unchanged:
+                deferred = self.get_deferred_fields()
+                kwargs['update_fields'] = {
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                    and field.name not in unchanged}
+        if self.route_id is None or self._route_names != self._current_route_names():
+            self.route = Route.objects.for_names(self.source, self.destination)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'route'}
+        if self._state.adding and self.seats_per_row and self.seat_map is None:
+            # Existing departures get theirs from services.assign_seat_map.
+            self.seat_map = SeatMap.empty(self.available_seats, self.seats_per_row).to_bytes()
+        super().save(*args, **kwargs)
+        self._route_names = self._current_route_names()
+        self._loaded_seats = self._current_seats()
+
     def is_available(self, seats_required=1):
         return self.available_seats >= seats_required
 
+    def fare_key(self):
+        """(route_id, travel_type, departure_datetime): where this option counts in the fare calendar."""
+        return tuple(self.__dict__.get(field)
+                     for field in ('route_id', 'travel_type', 'departure_datetime'))
+
+
+class SeatShard(models.Model):
+    """One slice of the seats of a departure whose counter is split (seat_shards).
+
+    A booking takes its seats from a single shard, so bookings of one hot
+    departure update different rows instead of queueing on one.
+    """
+    travel_option = models.ForeignKey(
+        TravelOption, on_delete=models.CASCADE, related_name='shards', db_index=False)
+    shard = models.PositiveSmallIntegerField()
+    available_seats = models.IntegerField(validators=[MinValueValidator(0)])
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['travel_option', 'shard'],
+                                    name='seat_shard_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.travel_option_id}/{self.shard}: {self.available_seats} seats"
+
+
+class BookingIdWorker(models.Model):
+    """A booking id worker id (booking_app.ids) leased by one process until ``expires_at``."""
+    worker_id = models.PositiveSmallIntegerField(primary_key=True)
+    owner = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.worker_id}: {self.owner}"
+
+
+class FareDay(models.Model):
+    """Cheapest fare and seats left per route, travel type and departure day.
+
+    Derived from TravelOption and kept current by booking_app.fare_calendar
+    whenever departures or their seats change. ``min_price`` is None when
+    every departure of the day is sold out.
+    """
+    # Indexed through unique_fare_day, which leads with route.
+    route = models.ForeignKey(
+        Route, on_delete=models.CASCADE, related_name='fare_days', db_index=False)
+    travel_type = models.CharField(max_length=10, choices=TravelOption.TRAVEL_TYPES)
+    day = models.DateField()
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
+    available_seats = models.IntegerField()
+    departures = models.IntegerField(help_text="Departures with seats left.")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['route', 'day', 'travel_type'], name='unique_fare_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.route_id} {self.travel_type} {self.day}: {self.min_price}"
+
 
 class Booking(models.Model):
     STATUS_CHOICES = [
+        ('pending', 'Pending'),
         ('confirmed', 'Confirmed'),
+        ('rejected', 'Rejected'),
         ('cancelled', 'Cancelled'),
     ]
+    archived = False
 
     booking_id = models.CharField(max_length=50, unique=True)
+    # Indexed through booking_user_date_idx, which leads with user.
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, related_name='bookings')
+        User, on_delete=models.CASCADE, related_name='bookings', db_index=False)
     travel_option = models.ForeignKey(
         TravelOption, on_delete=models.CASCADE, related_name='bookings')
     number_of_seats = models.IntegerField(validators=[MinValueValidator(1)])
@@ -50,23 +239,91 @@ class Booking(models.Model):
     booking_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(
         max_length=10, choices=STATUS_CHOICES, default='confirmed')
+    # Space separated, e.g. "12A 12B"; empty without a seat map.
+    seat_numbers = models.TextField(blank=True, default='')
 
     class Meta:
         ordering = ['-booking_date']
+        indexes = [
+            models.Index(fields=['user', 'booking_date', 'id'],
+                         name='booking_user_date_idx'),
+            # The booking queue: pending bookings of one departure in
+            # arrival order, and the departures that have any.
+            models.Index(fields=['status', 'travel_option', 'id'],
+                         name='booking_queue_idx'),
+            # The admin changelist: newest first and its date hierarchy.
+            models.Index(fields=['booking_date', 'id'], name='booking_date_idx'),
+        ]
 
     def __str__(self):
         return f"Booking {self.booking_id} - {self.user.username}"
 
     def save(self, *args, **kwargs):
         if not self.booking_id:
-            self.booking_id = f"BK{timezone.now().strftime('%Y%m%d%H%M%S')}"
+            self.booking_id = new_booking_id()
         super().save(*args, **kwargs)
 
     def cancel(self):
-        if self.status == 'confirmed':
+        from .services import cancel_bookings
+
+        cancelled, _ = cancel_bookings(Booking.objects.filter(pk=self.pk))
+        if cancelled:
             self.status = 'cancelled'
-            self.travel_option.available_seats += self.number_of_seats
-            self.travel_option.save()
-            self.save()
-            return True
-        return False
+        return bool(cancelled)
+
+
+class ArchivedTravelOption(models.Model):
+    """A departed TravelOption, moved out of the live table by booking_app.archive.
+
+    Keeps the original id, so archived bookings and any references to the
+    departure stay valid.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    # Not unique: a travel_id can be used again once its departure is archived.
+    travel_id = models.CharField(max_length=50, db_index=True)
+    travel_type = models.CharField(max_length=10, choices=TravelOption.TRAVEL_TYPES)
+    source = models.CharField(max_length=100)
+    destination = models.CharField(max_length=100)
+    departure_datetime = models.DateTimeField()
+    arrival_datetime = models.DateTimeField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    available_seats = models.IntegerField()
+    route = models.ForeignKey(
+        Route, on_delete=models.PROTECT, related_name='+', null=True, db_index=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['departure_datetime']
+
+    def __str__(self):
+        return f"{self.travel_id} - {self.source} to {self.destination}"
+
+
+class ArchivedBooking(models.Model):
+    """A Booking of an archived departure; read-only history for booking_list and booking_detail."""
+    archived = True
+
+    id = models.BigIntegerField(primary_key=True)
+    booking_id = models.CharField(max_length=50, unique=True)
+    # Indexed through archived_booking_user_date_idx, which leads with user.
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='archived_bookings', db_index=False)
+    travel_option = models.ForeignKey(
+        ArchivedTravelOption, on_delete=models.CASCADE, related_name='bookings')
+    number_of_seats = models.IntegerField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    booking_date = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=Booking.STATUS_CHOICES)
+    seat_numbers = models.TextField(blank=True, default='')
+
+    class Meta:
+        ordering = ['-booking_date']
+        indexes = [
+            models.Index(fields=['user', 'booking_date', 'id'],
+                         name='archived_booking_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Booking {self.booking_id} - {self.user.username}"
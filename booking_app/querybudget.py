@@ -0,0 +1,174 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN \((?:\?|%s)(?:, (?:\?|%s))*\)", re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape so repeats of one query can be counted."""
+    sql = _LITERALS.sub('?', sql)
+    sql = _IN_LISTS.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryRecorder:
+    """Every statement run while the recorder is active, with its duration."""
+
+    def __init__(self):
+        self.queries = []
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold):
+        """Query shapes that ran at least ``threshold`` times, e.g. N+1 loops."""
+        shapes = Counter(normalize_sql(sql) for sql, _ in self.queries)
+        return {shape: count for shape, count in shapes.items() if count >= threshold}
+
+
+_active_recorders = ContextVar('query_recorders', default=())
+
+
+def _dispatch(execute, sql, params, many, context):
+    recorders = _active_recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for recorder in recorders:
+            recorder.queries.append((sql, duration))
+
+
+@receiver(connection_created)
+def install_dispatcher(sender, connection, **kwargs):
+    # A permanent wrapper on every connection that forwards to whatever
+    # recorders are active in the current context. Unlike a scoped
+    # execute_wrapper this also sees queries an async view runs through
+    # sync_to_async, since the context is copied into the worker thread.
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _dispatch)
+
+
+class record_queries:
+    """Record the queries run on every database connection inside the block."""
+
+    def __enter__(self):
+        self.recorder = QueryRecorder()
+        for connection in connections.all(initialized_only=True):
+            install_dispatcher(None, connection)
+        self._token = _active_recorders.set(_active_recorders.get() + (self.recorder,))
+        return self.recorder
+
+    def __exit__(self, *exc):
+        _active_recorders.reset(self._token)
+
+
+def check_budget(recorder, max_queries, max_repeats):
+    """Return a list of human readable budget violations (empty when within budget)."""
+    problems = []
+    if max_queries is not None and recorder.count > max_queries:
+        problems.append(f"{recorder.count} queries (budget {max_queries})")
+    for shape, count in recorder.repeated(max_repeats + 1).items():
+        problems.append(f"{count}x {shape}")
+    return problems
+
+
+class query_budget(ContextDecorator):
+    """Fail a test (or block) that runs more queries than allowed.
+
+    ``max_repeats`` caps how often a single query shape may run, which is
+    what catches per-row N+1 lookups independently of the page size.
+
+        @query_budget(4)
+        def test_booking_list(self): ...
+    """
+
+    def __init__(self, max_queries=None, max_repeats=1):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+
+    def __enter__(self):
+        self._recording = record_queries()
+        self.recorder = self._recording.__enter__()
+        return self.recorder
+
+    def __exit__(self, exc_type, *exc):
+        self._recording.__exit__(exc_type, *exc)
+        if exc_type is None:
+            problems = check_budget(self.recorder, self.max_queries, self.max_repeats)
+            if problems:
+                raise AssertionError('Query budget exceeded: ' + '; '.join(problems))
+
+
+class QueryBudgetMiddleware:
+    """Record query count and SQL time per view and flag views over budget.
+
+    Budgets come from ``settings.QUERY_BUDGETS`` (url name -> max queries)
+    with ``QUERY_BUDGET_DEFAULT`` as the fallback. Violations are logged, or
+    raised as QueryBudgetExceeded when ``QUERY_BUDGET_STRICT`` is set.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        with record_queries() as recorder:
+            response = await self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    def check(self, request, recorder):
+        match = request.resolver_match
+        url_name = match.view_name if match else None
+        request.query_count = recorder.count
+        request.query_duration = recorder.duration
+
+        budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        max_queries = budgets.get(url_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+        max_repeats = getattr(settings, 'QUERY_BUDGET_MAX_REPEATS', 2)
+        problems = check_budget(recorder, max_queries, max_repeats)
+        if problems:
+            message = (f"{request.method} {request.path} ({url_name}): "
+                       f"{'; '.join(problems)} in {recorder.duration * 1000:.1f}ms")
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning('Query budget exceeded: %s', message)
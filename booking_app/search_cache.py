@@ -0,0 +1,247 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+GLOBAL_SCOPE = 'all'
+
+
+class CacheVersions:
+    """Version counters in a Django cache, so a bump in one worker reaches all of them.
+
+    A bump stores a new random token rather than incrementing: the versions
+    only have to change, and setting them works the same on every cache.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def get_versions(self, scopes):
+        keys = [f'search-version:{scope}' for scope in scopes]
+        found = self.cache.get_many(keys)
+        return [found.get(key, 0) for key in keys]
+
+    def bump_versions(self, scopes):
+        token = uuid.uuid4().hex
+        self.cache.set_many({f'search-version:{scope}': token for scope in scopes}, None)
+
+
+class LocalLRUBackend:
+    """Per-process LRU store.
+
+    Version counters live beside it and are never evicted, or, with
+    ``versions_alias``, in that Django cache, which must then be shared by
+    every worker for invalidations to reach them all.
+    """
+
+    def __init__(self, max_entries=1000, versions_alias=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._shared_versions = CacheVersions(versions_alias) if versions_alias else None
+        self._lock = threading.Lock()
+
+    @property
+    def in_memory(self):
+        # Without I/O, async callers can use it without a thread hop.
+        return self._shared_versions is None
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        expires = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_versions(self, scopes):
+        if self._shared_versions is not None:
+            return self._shared_versions.get_versions(scopes)
+        with self._lock:
+            return [self._versions.get(scope, 0) for scope in scopes]
+
+    def bump_versions(self, scopes):
+        if self._shared_versions is not None:
+            return self._shared_versions.bump_versions(scopes)
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheBackend:
+    """Store entries and version counters in a Django cache, shared by all workers."""
+
+    in_memory = False
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+        self.versions = CacheVersions(alias)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+
+    def get_versions(self, scopes):
+        return self.versions.get_versions(scopes)
+
+    def bump_versions(self, scopes):
+        self.versions.bump_versions(scopes)
+
+    def clear(self):
+        self.cache.clear()
+
+
+def first_departure(travel_options):
+    """The earliest departure_datetime among ``travel_options``, or None."""
+    return min((option.departure_datetime for option in travel_options), default=None)
+
+
+class SearchCache:
+    """Result cache for the travel search pages.
+
+    Entries are keyed on the normalized search parameters plus the current
+    version of every route the result can contain, so bumping a route's
+    version (whenever its seats or options change) makes old entries
+    unreachable without relying on a short TTL. Searches that aren't
+    narrowed to specific routes are keyed on the global version, which is
+    bumped together with any route. Upcoming-departure results also go
+    stale when their first departure leaves, so they expire then.
+    """
+
+    def __init__(self):
+        self._backend = None
+        self.hits = self.misses = self.invalidations = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            config = getattr(settings, 'SEARCH_CACHE', {})
+            backend_class = import_string(
+                config.get('BACKEND', 'booking_app.search_cache.LocalLRUBackend'))
+            self._backend = backend_class(**config.get('OPTIONS', {}))
+        return self._backend
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'SEARCH_CACHE', {}).get('TIMEOUT', 300)
+
+    @staticmethod
+    def scopes(route_ids):
+        if route_ids is None:
+            return [GLOBAL_SCOPE]
+        return [f'route:{route_id}' for route_id in sorted(route_ids)]
+
+    def make_key(self, view, params, route_ids):
+        scopes = self.scopes(route_ids)
+        versions = self.backend.get_versions(scopes)
+        payload = json.dumps([view, params, list(zip(scopes, versions))],
+                             sort_keys=True, default=str)
+        return f'search:{view}:{hashlib.sha1(payload.encode()).hexdigest()}'
+
+    def entry_timeout(self, value, expires):
+        """Seconds to keep ``value``: TIMEOUT, or less if ``expires(value)`` comes sooner."""
+        stale_at = expires(value) if expires is not None else None
+        if stale_at is None:
+            return self.timeout
+        return min(self.timeout, (stale_at - timezone.now()).total_seconds())
+
+    def _store(self, key, value, expires):
+        timeout = self.entry_timeout(value, expires)
+        if timeout > 0:
+            self.backend.set(key, value, timeout)
+
+    def get_or_set(self, view, params, route_ids, compute, expires=None):
+        """Return the cached result for this search, computing and storing it on a miss.
+
+        ``route_ids`` lists the routes the result is restricted to, or None
+        when it can contain any route. ``expires`` maps the result to the
+        time it goes stale regardless of bookings (its first departure), or
+        None.
+        """
+        if not getattr(settings, 'SEARCH_CACHE', {}).get('ENABLED', True):
+            return compute()
+        key = self.make_key(view, params, route_ids)
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute()
+        self._store(key, value, expires)
+        return value
+
+    async def aget_or_set(self, view, params, route_ids, compute, expires=None):
+        """Async counterpart of get_or_set; ``compute`` is a coroutine function."""
+        if not getattr(settings, 'SEARCH_CACHE', {}).get('ENABLED', True):
+            return await compute()
+        key = await self._call(self.make_key, view, params, route_ids)
+        value = await self._call(self.backend.get, key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = await compute()
+        await self._call(self._store, key, value, expires)
+        return value
+
+    async def _call(self, func, *args):
+        if getattr(self.backend, 'in_memory', False):
+            return func(*args)
+        # The shared cache may be the database cache table, so stay on the
+        # request's thread and its connection.
+        return await sync_to_async(func)(*args)
+
+    def invalidate(self, route_ids):
+        """Bump the versions for these routes (and the global version)."""
+        self.invalidations += 1
+        self.backend.bump_versions(
+            [GLOBAL_SCOPE] + [f'route:{route_id}' for route_id in route_ids if route_id])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'invalidations': self.invalidations,
+        }
+        if hasattr(self.backend, '__len__'):
+            stats['entries'] = len(self.backend)
+        return stats
+
+    def reset(self):
+        self.backend.clear()
+        self.hits = self.misses = self.invalidations = 0
+
+
+search_cache = SearchCache()
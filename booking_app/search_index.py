@@ -0,0 +1,159 @@
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import City, Route
+
+VERSION_KEY = 'booking_app:city-index-version'
+
+
+def version_cache():
+    # Shared by every worker, so a new city reaches all their indexes.
+    return caches[getattr(settings, 'CITY_INDEX_VERSION_ALIAS', 'shared')]
+
+
+def normalize_city_name(name):
+    return ' '.join(name.split()).casefold()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CityIndex:
+    """In-memory prefix trie and trigram index over city names.
+
+    Used to turn what a user typed into City ids once, so travel searches
+    become indexed equality lookups on route ids instead of ``LIKE '%..%'``.
+    Every word of a name starts a trie entry, so "Delhi" also finds
+    "New Delhi".
+    """
+
+    FUZZY_THRESHOLD = 0.35
+
+    def __init__(self, cities, routes):
+        self.names = {}
+        self.trie = {}
+        self.grams = defaultdict(set)
+        for city_id, name in cities:
+            key = normalize_city_name(name)
+            self.names[city_id] = name
+            words = key.split(' ')
+            for start in range(len(words)):
+                self._insert(' '.join(words[start:]), city_id)
+            for gram in trigrams(key):
+                self.grams[gram].add(city_id)
+
+        self.routes_from = defaultdict(dict)
+        for route_id, origin_id, destination_id in routes:
+            self.routes_from[origin_id][destination_id] = route_id
+
+    def _insert(self, key, city_id):
+        node = self.trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(city_id)
+
+    def prefix(self, text, limit=None):
+        node = self.trie
+        for char in normalize_city_name(text):
+            node = node.get(char)
+            if node is None:
+                return []
+        found = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            found.update(node.get(None, ()))
+            stack.extend(child for char, child in node.items() if char is not None)
+        found = sorted(found, key=lambda city_id: self.names[city_id])
+        return found[:limit] if limit else found
+
+    def fuzzy(self, text, limit=5):
+        query = trigrams(normalize_city_name(text))
+        if not query:
+            return []
+        shared = defaultdict(int)
+        for gram in query:
+            for city_id in self.grams.get(gram, ()):
+                shared[city_id] += 1
+        scored = []
+        for city_id, count in shared.items():
+            key = normalize_city_name(self.names[city_id])
+            score = 2 * count / (len(query) + len(trigrams(key)))
+            if score >= self.FUZZY_THRESHOLD:
+                scored.append((-score, self.names[city_id], city_id))
+        scored.sort()
+        return [city_id for _, _, city_id in scored[:limit]]
+
+    def complete(self, text, limit=10):
+        """Prefix matches first, topped up with typo-tolerant matches."""
+        results = self.prefix(text, limit)
+        if len(results) < limit:
+            results += [city_id for city_id in self.fuzzy(text, limit)
+                        if city_id not in results][:limit - len(results)]
+        return [(city_id, self.names[city_id]) for city_id in results]
+
+    def resolve(self, text):
+        """Return the ids of the cities a search term refers to."""
+        key = normalize_city_name(text)
+        return self.prefix(key) or self.fuzzy(key, limit=1)
+
+    def route_ids(self, origin_ids=None, destination_ids=None):
+        """Route ids between the given cities; None means any city."""
+        origins = self.routes_from.keys() if origin_ids is None else origin_ids
+        route_ids = []
+        for origin_id in origins:
+            destinations = self.routes_from.get(origin_id, {})
+            if destination_ids is None:
+                route_ids.extend(destinations.values())
+            else:
+                route_ids.extend(
+                    destinations[d] for d in destination_ids if d in destinations)
+        return sorted(route_ids)
+
+
+_index = None
+_index_version = None
+_index_built_at = 0
+_version_checked_at = float('-inf')
+_lock = threading.Lock()
+
+
+def get_city_index():
+    """Return this process's CityIndex, rebuilding it when cities or routes changed.
+
+    The shared version is read at most every CITY_INDEX_VERSION_CHECK_INTERVAL
+    seconds, so a burst of searches costs one cache read, not one each.
+    """
+    global _index, _index_version, _index_built_at, _version_checked_at
+    now = time.monotonic()
+    max_age = getattr(settings, 'CITY_INDEX_MAX_AGE', 300)
+    fresh = _index is not None and now - _index_built_at < max_age
+    if fresh and now - _version_checked_at < getattr(
+            settings, 'CITY_INDEX_VERSION_CHECK_INTERVAL', 1):
+        return _index
+    version = version_cache().get(VERSION_KEY, 0)
+    _version_checked_at = now
+    if fresh and version == _index_version:
+        return _index
+
+    with _lock:
+        cities = City.objects.values_list('id', 'name')
+        routes = Route.objects.values_list('id', 'origin_id', 'destination_id')
+        _index = CityIndex(cities, routes)
+        _index_version = version
+        _index_built_at = time.monotonic()
+    return _index
+
+
+def invalidate_city_index():
+    global _version_checked_at
+    # A new token rather than incr, which isn't atomic on every cache.
+    version_cache().set(VERSION_KEY, uuid.uuid4().hex, None)
+    _version_checked_at = float('-inf')
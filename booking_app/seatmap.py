@@ -0,0 +1,113 @@
+"""Seat maps: which seats of a departure are taken, as a bitset.
+
+A departure with ``seats_per_row`` set stores its seat map in
+``TravelOption.seat_map``: bit i of the little-endian bytes is set when
+seat i is taken. Seats are numbered row by row, 1A, 1B, ... The bits that
+pad the map to whole bytes are set, so they are never handed out.
+
+The map is worked on as one Python int. Finding n free seats in a row is
+a handful of shifts and ANDs over the whole map, so the cost grows with
+the number of machine words in it (16 for a 1,000 seat train), not with
+the number of seats, rows or bookings.
+"""
+from functools import lru_cache
+
+SEAT_LETTERS = 'ABCDEFGHJK'
+
+
+def seat_label(index, seats_per_row):
+    row, seat = divmod(index, seats_per_row)
+    return f'{row + 1}{SEAT_LETTERS[seat]}'
+
+
+def seat_index(label, seats_per_row):
+    return (int(label[:-1]) - 1) * seats_per_row + SEAT_LETTERS.index(label[-1])
+
+
+def free_runs(free, length):
+    """The bits i of ``free`` for which seats i to i + length - 1 are all free.
+
+    Doubles the run length with every shift, so it takes log2(length) steps.
+    """
+    runs, width = free, 1
+    while width < length:
+        step = min(width, length - width)
+        runs &= runs >> step
+        width += step
+    return runs
+
+
+@lru_cache(maxsize=256)
+def row_starts(size, seats_per_row, length):
+    """The seats a block of ``length`` can start at without running into the next row."""
+    rows = -(-size // seats_per_row)
+    row = (1 << (seats_per_row - length + 1)) - 1
+    every_row = ((1 << rows * seats_per_row) - 1) // ((1 << seats_per_row) - 1)
+    return (row * every_row) & ((1 << size) - 1)
+
+
+def lowest_bits(bits, count):
+    """Indexes of the ``count`` lowest set bits."""
+    indexes = []
+    while len(indexes) < count:
+        lowest = bits & -bits
+        indexes.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return indexes
+
+
+class SeatMap:
+    def __init__(self, data, seats_per_row):
+        self.size = len(data) * 8
+        self.taken = int.from_bytes(data, 'little')
+        self.seats_per_row = seats_per_row
+
+    @classmethod
+    def empty(cls, seats, seats_per_row):
+        size = -(-seats // 8) * 8
+        padding = ((1 << size) - 1) ^ ((1 << seats) - 1)
+        return cls(padding.to_bytes(size // 8, 'little'), seats_per_row)
+
+    def to_bytes(self):
+        return self.taken.to_bytes(self.size // 8, 'little')
+
+    @property
+    def free(self):
+        return ~self.taken & ((1 << self.size) - 1)
+
+    def available(self):
+        return self.free.bit_count()
+
+    def allocate(self, number_of_seats):
+        """Take ``number_of_seats`` seats and return their indexes, or None if too few are free.
+
+        The first block that fits in one row, then the first block that
+        runs on over rows, and only then the first free seats wherever
+        they are.
+        """
+        free = self.free
+        if free.bit_count() < number_of_seats:
+            return None
+        runs = free_runs(free, number_of_seats)
+        if number_of_seats <= self.seats_per_row:
+            in_row = runs & row_starts(self.size, self.seats_per_row, number_of_seats)
+            runs = in_row or runs
+        if runs:
+            start = (runs & -runs).bit_length() - 1
+            indexes = list(range(start, start + number_of_seats))
+            self.taken |= ((1 << number_of_seats) - 1) << start
+        else:
+            indexes = lowest_bits(free, number_of_seats)
+            for index in indexes:
+                self.taken |= 1 << index
+        return indexes
+
+    def release(self, indexes):
+        for index in indexes:
+            self.taken &= ~(1 << index)
+
+    def labels(self, indexes):
+        return ' '.join(seat_label(index, self.seats_per_row) for index in indexes)
+
+    def indexes(self, labels):
+        return [seat_index(label, self.seats_per_row) for label in labels.split()]
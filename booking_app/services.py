@@ -0,0 +1,440 @@
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .fare_calendar import refresh_after_commit
+from .models import TravelOption, Booking, SeatShard
+from .seatmap import SeatMap
+from .utils import day_range
+
+
+def upcoming_travel_options():
+    return TravelOption.objects.filter(
+        departure_datetime__gte=timezone.now(),
+        available_seats__gt=0
+    )
+
+
+def search_travel_options(criteria):
+    """Upcoming bookable options matching TravelSearchForm.search_criteria()."""
+    travel_options = upcoming_travel_options()
+    if criteria.get('travel_type'):
+        travel_options = travel_options.filter(travel_type=criteria['travel_type'])
+    if criteria.get('route_ids') is not None:
+        travel_options = travel_options.filter(route_id__in=criteria['route_ids'])
+    if criteria.get('departure_date'):
+        day_start, day_end = day_range(criteria['departure_date'])
+        travel_options = travel_options.filter(
+            departure_datetime__gte=day_start,
+            departure_datetime__lt=day_end)
+    return travel_options
+
+
+class SoldOut(Exception):
+    """Raised when a departure cannot cover the requested number of seats."""
+
+
+def reserve_seats(user, travel_option, number_of_seats):
+    """Reserve seats and create the booking in a single transaction.
+
+    The seat decrement is a conditional ``UPDATE ... WHERE available_seats >= n``
+    so concurrent requests can never take the counter below zero, and the
+    booking row is only written when that update matched. Departures with
+    a split seat counter take the seats from a shard instead, see
+    reserve_sharded_seats, and those with a seat map pick seat numbers,
+    see reserve_mapped_seats.
+    """
+    if travel_option.seats_per_row:
+        return reserve_mapped_seats(user, travel_option, number_of_seats)
+    if travel_option.seat_shards:
+        return reserve_sharded_seats(user, travel_option, number_of_seats)
+    with transaction.atomic():
+        reserved = TravelOption.objects.filter(
+            pk=travel_option.pk,
+            available_seats__gte=number_of_seats
+        ).update(
+            available_seats=F('available_seats') - number_of_seats,
+            updated_at=timezone.now()
+        )
+        if not reserved:
+            raise SoldOut(travel_option.travel_id)
+
+        booking = _create_booking(user, travel_option, number_of_seats)
+        refresh_after_commit([travel_option.fare_key()])
+
+    return booking
+
+
+SHARD_ATTEMPTS = 3
+
+
+def even_split(seats, shards):
+    return [seats // shards + (1 if i < seats % shards else 0) for i in range(shards)]
+
+
+def take_from_shards(shards, number_of_seats):
+    """Take seats from locked SeatShards, fullest first; saves the shards it changed."""
+    for shard in sorted(shards, key=lambda shard: -shard.available_seats):
+        taken = min(shard.available_seats, number_of_seats)
+        if taken:
+            SeatShard.objects.filter(pk=shard.pk).update(
+                available_seats=F('available_seats') - taken)
+            shard.available_seats -= taken
+            number_of_seats -= taken
+        if not number_of_seats:
+            return
+
+
+def reserve_sharded_seats(user, travel_option, number_of_seats):
+    """reserve_seats for a departure whose seats are split over SeatShards.
+
+    Each attempt reads the shards without locking them and takes the seats
+    with a conditional UPDATE on one shard that had room, picked at random
+    so concurrent bookings spread over the shards. The travel option row is
+    not touched; rebalance_seat_shards keeps its available_seats in step.
+    Only when no single shard can cover the request (or the attempts keep
+    losing races) are all shards locked, in order, and the seats taken
+    from several of them.
+    """
+    shards = SeatShard.objects.filter(travel_option_id=travel_option.pk)
+    for _ in range(SHARD_ATTEMPTS):
+        seats = dict(shards.values_list('shard', 'available_seats'))
+        if sum(seats.values()) < number_of_seats:
+            raise SoldOut(travel_option.travel_id)
+        candidates = [shard for shard, available in seats.items() if available >= number_of_seats]
+        if not candidates:
+            break
+        # Each attempt is its own transaction, so the next read is fresh
+        # and a shard that didn't match isn't left locked.
+        with transaction.atomic():
+            if shards.filter(shard=random.choice(candidates),
+                             available_seats__gte=number_of_seats).update(
+                    available_seats=F('available_seats') - number_of_seats):
+                return _create_booking(user, travel_option, number_of_seats)
+
+    with transaction.atomic():
+        locked = list(shards.select_for_update().order_by('shard'))
+        if sum(shard.available_seats for shard in locked) < number_of_seats:
+            raise SoldOut(travel_option.travel_id)
+        take_from_shards(locked, number_of_seats)
+        return _create_booking(user, travel_option, number_of_seats)
+
+
+def reserve_mapped_seats(user, travel_option, number_of_seats):
+    """reserve_seats for a departure with a seat map; the booking gets seat numbers.
+
+    The departure row is locked while a block of seats is picked from its
+    map (see booking_app.seatmap), and the map and available_seats are
+    written back with one UPDATE.
+    """
+    with transaction.atomic():
+        locked = (TravelOption.objects.select_for_update()
+                  .only('seat_map', 'seats_per_row', 'route_id', 'travel_type',
+                        'departure_datetime')
+                  .get(pk=travel_option.pk))
+        seat_map = load_seat_map(travel_option.pk, locked.seat_map, locked.seats_per_row)
+        seats = seat_map.allocate(number_of_seats)
+        if seats is None:
+            raise SoldOut(travel_option.travel_id)
+        TravelOption.objects.filter(pk=travel_option.pk).update(
+            seat_map=seat_map.to_bytes(), available_seats=seat_map.available(),
+            updated_at=timezone.now())
+        booking = _create_booking(user, travel_option, number_of_seats,
+                                  seat_numbers=seat_map.labels(seats))
+        refresh_after_commit([locked.fare_key()])
+    return booking
+
+
+def _create_booking(user, travel_option, number_of_seats, seat_numbers=''):
+    return Booking.objects.create(
+        user=user,
+        travel_option=travel_option,
+        number_of_seats=number_of_seats,
+        total_price=travel_option.price * number_of_seats,
+        seat_numbers=seat_numbers
+    )
+
+
+def load_seat_map(travel_option_id, seat_map, seats_per_row):
+    """The SeatMap of a locked departure with seats_per_row set.
+
+    Rows that got seats_per_row without going through TravelOption.save
+    (bulk_create, raw inserts) have no map yet; assign_seat_map builds it.
+    """
+    if seat_map is None:
+        return assign_seat_map(travel_option_id, seats_per_row)
+    return SeatMap(seat_map, seats_per_row)
+
+
+def assign_seat_map(travel_option_id, seats_per_row):
+    """Give a departure a seat map with ``seats_per_row`` seats a row.
+
+    The map covers the seats left and those of the confirmed bookings,
+    which get seat numbers in booking order. Returns the SeatMap.
+    """
+    with transaction.atomic():
+        travel_option = (TravelOption.objects.select_for_update()
+                         .only('available_seats', 'seat_shards').get(pk=travel_option_id))
+        if travel_option.seat_shards:
+            raise ValueError("Merge the seat counter before adding a seat map.")
+        bookings = list(Booking.objects.select_for_update()
+                        .filter(travel_option_id=travel_option_id, status='confirmed')
+                        .order_by('id').only('id', 'number_of_seats'))
+        seat_map = SeatMap.empty(
+            travel_option.available_seats + sum(booking.number_of_seats for booking in bookings),
+            seats_per_row)
+        for booking in bookings:
+            booking.seat_numbers = seat_map.labels(seat_map.allocate(booking.number_of_seats))
+        Booking.objects.bulk_update(bookings, ['seat_numbers'], batch_size=1000)
+        TravelOption.objects.filter(pk=travel_option_id).update(
+            seats_per_row=seats_per_row, seat_map=seat_map.to_bytes(),
+            updated_at=timezone.now())
+    return seat_map
+
+
+def shard_seat_counter(travel_option_id, shards):
+    """Split a departure's seats evenly over ``shards`` SeatShards; 0 merges them back.
+
+    Returns the departure's seats.
+    """
+    with transaction.atomic():
+        travel_option = (TravelOption.objects.select_for_update()
+                         .only('available_seats', 'seat_shards', 'seats_per_row', 'route_id',
+                               'travel_type', 'departure_datetime')
+                         .get(pk=travel_option_id))
+        if travel_option.seats_per_row:
+            raise ValueError("A departure with a seat map can't have its seat counter split.")
+        current = list(SeatShard.objects.select_for_update()
+                       .filter(travel_option_id=travel_option_id).order_by('shard'))
+        seats = (sum(shard.available_seats for shard in current) if travel_option.seat_shards
+                 else travel_option.available_seats)
+        SeatShard.objects.filter(travel_option_id=travel_option_id).delete()
+        SeatShard.objects.bulk_create([
+            SeatShard(travel_option_id=travel_option_id, shard=shard, available_seats=available)
+            for shard, available in enumerate(even_split(seats, shards) if shards else [])])
+        TravelOption.objects.filter(pk=travel_option_id).update(
+            seat_shards=shards, available_seats=seats, updated_at=timezone.now())
+        refresh_after_commit([travel_option.fare_key()])
+    return seats
+
+
+def rebalance_seat_shards(travel_option_id):
+    """Store the sum of a sharded departure's seats in available_seats, and even
+    the shards out once one has fallen below half its share.
+
+    The sum is read without locks, so bookings carry on meanwhile; only an
+    uneven departure has its row and shards locked, briefly, to move seats.
+    Returns ``{'seats': n, 'moved': n}``, or None if the departure isn't sharded.
+    """
+    travel_option = (TravelOption.objects.filter(pk=travel_option_id, seat_shards__gt=0)
+                     .only('available_seats', 'seat_shards', 'route_id', 'travel_type',
+                           'departure_datetime').first())
+    if travel_option is None:
+        return None
+    counts = list(SeatShard.objects.filter(travel_option_id=travel_option_id)
+                  .values_list('available_seats', flat=True))
+    seats, moved = sum(counts), 0
+    if counts and min(counts) * 2 < seats // len(counts):
+        with transaction.atomic():
+            # The departure first, then the shards in order, as
+            # cancel_bookings and drain_booking_queue lock them.
+            TravelOption.objects.select_for_update().filter(
+                pk=travel_option_id).values_list('pk').first()
+            locked = list(SeatShard.objects.select_for_update()
+                          .filter(travel_option_id=travel_option_id).order_by('shard'))
+            seats = sum(shard.available_seats for shard in locked)
+            for shard, available in zip(locked, even_split(seats, len(locked))):
+                if shard.available_seats != available:
+                    moved += max(available - shard.available_seats, 0)
+                    SeatShard.objects.filter(pk=shard.pk).update(available_seats=available)
+    if seats != travel_option.available_seats:
+        with transaction.atomic():
+            TravelOption.objects.filter(pk=travel_option_id).update(
+                available_seats=seats, updated_at=timezone.now())
+            refresh_after_commit([travel_option.fare_key()])
+    return {'seats': seats, 'moved': moved}
+
+
+def sharded_departures():
+    """Ids of upcoming travel options whose seat counter is split."""
+    return (TravelOption.objects.filter(seat_shards__gt=0, departure_datetime__gte=timezone.now())
+            .order_by('id').values_list('id', flat=True))
+
+
+CANCELLABLE = ('confirmed', 'pending')
+
+
+def cancel_bookings(bookings, chunk_size=1000):
+    """Cancel the confirmed and pending bookings in ``bookings`` and give their seats back.
+
+    Works departure by departure and ``chunk_size`` bookings at a time; each
+    chunk is one transaction that locks the departure, marks the chunk
+    cancelled with one UPDATE and restores its seats with one
+    ``F('available_seats') + n`` UPDATE, so a failure never leaves seats and
+    bookings out of step. Bookings already cancelled (e.g. by a concurrent
+    request) are skipped. Pending bookings hold no seats. A departure with
+    a seat map has the bookings' seats freed in the map as well.
+
+    Returns ``(bookings cancelled, seats restored)``.
+    """
+    bookings = bookings.filter(status__in=CANCELLABLE).order_by()
+    departures = bookings.values_list('travel_option_id', flat=True).distinct()
+    cancelled = restored = 0
+    for travel_option_id in list(departures):
+        while True:
+            with transaction.atomic():
+                # Lock the departure first, in the same order as
+                # drain_booking_queue, so the two never deadlock.
+                fare_key = (TravelOption.objects.select_for_update()
+                            .filter(pk=travel_option_id)
+                            .values_list('route_id', 'travel_type', 'departure_datetime',
+                                         'seat_shards', 'seats_per_row', 'seat_map')
+                            .first())
+                # Before any status changes, so a map built now seats this chunk too.
+                seat_map = (load_seat_map(travel_option_id, fare_key[5], fare_key[4])
+                            if fare_key[4] else None)
+                chunk = list(bookings.select_for_update()
+                             .filter(travel_option_id=travel_option_id)
+                             .order_by('id')
+                             .values_list('id', 'status', 'number_of_seats',
+                                          'seat_numbers')[:chunk_size])
+                if not chunk:
+                    break
+                Booking.objects.filter(id__in=[row[0] for row in chunk]).update(
+                    status='cancelled')
+                seats = sum(n for _, status, n, _ in chunk if status == 'confirmed')
+                if seats and seat_map:
+                    for _, status, _, seat_numbers in chunk:
+                        if status == 'confirmed':
+                            seat_map.release(seat_map.indexes(seat_numbers))
+                    TravelOption.objects.filter(pk=travel_option_id).update(
+                        seat_map=seat_map.to_bytes(), available_seats=seat_map.available(),
+                        updated_at=timezone.now()
+                    )
+                    refresh_after_commit([fare_key[:3]])
+                elif seats and fare_key[3]:
+                    # Back into one shard; rebalance_seat_shards updates
+                    # available_seats and the fare calendar.
+                    SeatShard.objects.filter(
+                        travel_option_id=travel_option_id, shard=chunk[0][0] % fare_key[3]
+                    ).update(available_seats=F('available_seats') + seats)
+                elif seats:
+                    TravelOption.objects.filter(pk=travel_option_id).update(
+                        available_seats=F('available_seats') + seats,
+                        updated_at=timezone.now()
+                    )
+                    refresh_after_commit([fare_key[:3]])
+            cancelled += len(chunk)
+            restored += seats
+            if len(chunk) < chunk_size:
+                break
+    return cancelled, restored
+
+
+def cancel_departures(travel_options, chunk_size=1000):
+    """Cancel every open booking of ``travel_options`` (a queryset or list of ids)."""
+    return cancel_bookings(
+        Booking.objects.filter(travel_option__in=travel_options), chunk_size)
+
+
+def takes_queued_bookings(travel_option):
+    return travel_option.queue_bookings or getattr(settings, 'BOOKING_QUEUE_ALL', False)
+
+
+def enqueue_booking(user, travel_option, number_of_seats):
+    """Append a pending booking to the departure's queue, see drain_booking_queue.
+
+    Only the booking row is written, so requests for a hot departure don't
+    queue up on its seat counter. Requests the counter already can't cover
+    are turned away at once.
+    """
+    if travel_option.available_seats < number_of_seats:
+        raise SoldOut(travel_option.travel_id)
+    return Booking.objects.create(
+        user=user,
+        travel_option=travel_option,
+        number_of_seats=number_of_seats,
+        total_price=travel_option.price * number_of_seats,
+        status='pending'
+    )
+
+
+def pending_departures():
+    """Ids of travel options with pending bookings."""
+    return (Booking.objects.filter(status='pending')
+            .order_by('travel_option_id')
+            .values_list('travel_option_id', flat=True)
+            .distinct())
+
+
+def drain_booking_queue(travel_option_id, batch_size=500):
+    """Confirm or reject up to ``batch_size`` pending bookings of one departure.
+
+    Bookings are taken in arrival order and confirmed while seats last; one
+    that doesn't fit is rejected, but smaller ones behind it can still be
+    confirmed. The whole batch costs one seat decrement and two status
+    updates in a single transaction. The departure row is locked with SKIP
+    LOCKED so several workers can drain different departures side by side.
+
+    Returns ``{'confirmed': n, 'rejected': n, 'seats': n}``.
+    """
+    stats = {'confirmed': 0, 'rejected': 0, 'seats': 0}
+    with transaction.atomic():
+        travel_option = (TravelOption.objects.select_for_update(skip_locked=True)
+                         .only('available_seats', 'seat_shards', 'seats_per_row', 'seat_map',
+                               'route_id', 'travel_type', 'departure_datetime')
+                         .filter(pk=travel_option_id).first())
+        if travel_option is None:
+            return stats
+        # Locked too, so a user cancelling a pending booking waits for us.
+        pending = list(Booking.objects.select_for_update()
+                       .filter(status='pending', travel_option_id=travel_option_id)
+                       .order_by('id')
+                       .values_list('id', 'number_of_seats')[:batch_size])
+        shards = []
+        if travel_option.seat_shards:
+            shards = list(SeatShard.objects.select_for_update()
+                          .filter(travel_option_id=travel_option_id).order_by('shard'))
+            travel_option.available_seats = sum(shard.available_seats for shard in shards)
+        seat_map = None
+        if travel_option.seats_per_row:
+            seat_map = load_seat_map(
+                travel_option_id, travel_option.seat_map, travel_option.seats_per_row)
+            travel_option.available_seats = seat_map.available()
+        seats_left = travel_option.available_seats
+        confirmed, rejected, seated = [], [], []
+        for booking_id, number_of_seats in pending:
+            if number_of_seats <= seats_left:
+                seats_left -= number_of_seats
+                confirmed.append(booking_id)
+                if seat_map:
+                    seated.append(Booking(id=booking_id, seat_numbers=seat_map.labels(
+                        seat_map.allocate(number_of_seats))))
+            else:
+                rejected.append(booking_id)
+
+        taken = travel_option.available_seats - seats_left
+        if taken and seat_map:
+            TravelOption.objects.filter(pk=travel_option_id).update(
+                seat_map=seat_map.to_bytes(), available_seats=seats_left,
+                updated_at=timezone.now()
+            )
+            Booking.objects.bulk_update(seated, ['seat_numbers'])
+            refresh_after_commit([travel_option.fare_key()])
+        elif taken and shards:
+            take_from_shards(shards, taken)
+        elif taken:
+            TravelOption.objects.filter(pk=travel_option_id).update(
+                available_seats=F('available_seats') - taken,
+                updated_at=timezone.now()
+            )
+            refresh_after_commit([travel_option.fare_key()])
+        if confirmed:
+            Booking.objects.filter(id__in=confirmed).update(status='confirmed')
+        if rejected:
+            Booking.objects.filter(id__in=rejected).update(status='rejected')
+    stats.update(confirmed=len(confirmed), rejected=len(rejected), seats=taken)
+    return stats
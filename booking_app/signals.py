@@ -0,0 +1,57 @@
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .auth_backends import invalidate_cached_user
+from .fare_calendar import refresh_after_commit
+from .ids import renew_booking_id_lease
+from .journeys import forget_travel_option
+from .models import City, Route, TravelOption
+from .search_cache import search_cache
+from .search_index import invalidate_city_index
+
+
+@receiver([post_save, post_delete], sender=City)
+@receiver([post_save, post_delete], sender=Route)
+def city_index_changed(sender, **kwargs):
+    invalidate_city_index()
+
+
+@receiver([post_save, post_delete], sender=TravelOption)
+def travel_option_changed(sender, instance, **kwargs):
+    search_cache.invalidate({instance.route_id, instance._loaded_route_id})
+    instance._loaded_route_id = instance.route_id
+
+
+@receiver(post_save, sender=TravelOption)
+def travel_option_saved(sender, instance, **kwargs):
+    refresh_after_commit([instance._loaded_fare_key, instance.fare_key()])
+    instance._loaded_fare_key = instance.fare_key()
+
+
+@receiver(post_delete, sender=TravelOption)
+def travel_option_deleted(sender, instance, **kwargs):
+    refresh_after_commit([instance.fare_key()])
+    pk = instance.pk
+    transaction.on_commit(lambda: forget_travel_option(pk))
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(request_started)
+@receiver(connection_created)
+def booking_id_lease_due(sender, connection=None, **kwargs):
+    # Before any transaction is open; skips the lease's own connections.
+    if connection is None or connection is connections[DEFAULT_DB_ALIAS]:
+        try:
+            renew_booking_id_lease()
+        except DatabaseError:
+            # No BookingIdWorker table yet, e.g. while migrating a new
+            # database; the first booking id takes the lease instead.
+            pass
@@ -0,0 +1,379 @@
+"""Per-request timing by phase, Server-Timing headers and Prometheus metrics.
+
+TelemetryMiddleware times each request and reports where the time went
+in a ``Server-Timing`` header:
+
+- ``db`` is SQL time, from QueryBudgetMiddleware's recorder.
+- ``template`` is rendering, through TimedDjangoTemplates.
+- ``password`` is hashing, through TimedPBKDF2PasswordHasher.
+- ``session`` is session loads and saves, through TimedSessionMiddleware.
+
+The totals are also added, per URL name, to this process's latency and
+query-count histograms, which the ``metrics`` view serves in the
+Prometheus text format. Worker processes can't see each other's memory,
+so with ``TELEMETRY['DIR']`` set each worker writes its totals to its own
+file there every ``FLUSH_INTERVAL`` seconds. ``/metrics`` then adds up
+the files of every worker, whichever worker serves it.
+"""
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.template.backends.django import DjangoTemplates, Template
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64)
+QUANTILES = (0.5, 0.95, 0.99)
+PHASES = ('db', 'template', 'password', 'session')
+
+
+def telemetry_settings():
+    return {'ENABLED': True, 'SERVER_TIMING': True, 'DIR': None, 'FLUSH_INTERVAL': 5,
+            'METRICS_TOKEN': None, **getattr(settings, 'TELEMETRY', {})}
+
+
+class RequestTimings:
+    """Seconds spent in each phase of the current request."""
+
+    def __init__(self):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.open = set()
+
+
+_current = ContextVar('request_timings', default=None)
+
+
+class timed(ContextDecorator):
+    """Add the time spent in the block to ``phase`` of the current request.
+
+    Nested blocks of the same phase count once, e.g. an async session
+    load that runs the sync one in a thread.
+    """
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.timings = _current.get()
+        if self.timings is None or self.phase in self.timings.open:
+            self.timings = None
+            return
+        self.timings.open.add(self.phase)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if self.timings is not None:
+            self.timings.phases[self.phase] += time.perf_counter() - self.start
+            self.timings.open.discard(self.phase)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates whose top-level renders count as the ``template`` phase."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class TimedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """The default hasher, with hashing counted as the ``password`` phase."""
+
+    def encode(self, password, salt, iterations=None):
+        with timed('password'):
+            return super().encode(password, salt, iterations)
+
+    def verify(self, password, encoded):
+        with timed('password'):
+            return super().verify(password, encoded)
+
+
+class TimedSession:
+    def load(self):
+        with timed('session'):
+            return super().load()
+
+    def save(self, must_create=False):
+        with timed('session'):
+            return super().save(must_create)
+
+    async def aload(self):
+        with timed('session'):
+            return await super().aload()
+
+    async def asave(self, must_create=False):
+        with timed('session'):
+            return await super().asave(must_create)
+
+
+class TimedSessionMiddleware(SessionMiddleware):
+    """SessionMiddleware whose session loads and saves count as the ``session`` phase."""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        # Same __qualname__: stores salt session data with it, so sessions
+        # written by the plain store (and earlier deploys) still load.
+        self.SessionStore = type('Timed' + self.SessionStore.__name__,
+                                 (TimedSession, self.SessionStore),
+                                 {'__qualname__': self.SessionStore.__qualname__})
+
+
+def _empty_series():
+    return {
+        'status': {},
+        'duration': [0] * (len(DURATION_BUCKETS) + 1),
+        'duration_sum': 0.0,
+        'queries': [0] * (len(QUERY_BUCKETS) + 1),
+        'queries_sum': 0,
+        'phases': dict.fromkeys(PHASES, 0.0),
+    }
+
+
+def _add_series(total, series):
+    for status, count in series['status'].items():
+        total['status'][status] = total['status'].get(status, 0) + count
+    for name in ('duration', 'queries'):
+        total[name] = [a + b for a, b in zip(total[name], series[name])]
+        total[f'{name}_sum'] += series[f'{name}_sum']
+    for phase, seconds in series['phases'].items():
+        total['phases'][phase] = total['phases'].get(phase, 0.0) + seconds
+
+
+def quantile(q, buckets, counts):
+    """Estimate the ``q`` quantile from histogram counts, like Prometheus does.
+
+    Interpolates linearly inside the bucket the quantile falls in; values
+    past the last bound are reported as that bound.
+    """
+    rank = q * sum(counts)
+    if not rank:
+        return None
+    seen = 0
+    for i, count in enumerate(counts):
+        if seen + count >= rank and count:
+            if i == len(buckets):
+                return buckets[-1]
+            lower = buckets[i - 1] if i else 0
+            return lower + (buckets[i] - lower) * (rank - seen) / count
+        seen += count
+    return buckets[-1]
+
+
+class RequestMetrics:
+    """Per-view latency and query-count histograms for this process.
+
+    Buckets are fixed, so histograms from several workers add up exactly,
+    which per-process quantiles would not.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._series = {}
+        self._flushed = 0.0
+
+    def _own(self):
+        # Forked workers start with the parent's (empty) totals; each
+        # process needs its own file name, even if a pid is reused.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._series = {}
+            self._name = f'metrics-{self._pid}-{uuid.uuid4().hex[:8]}.json'
+        return self._series
+
+    def observe(self, view, status, duration, queries, phases):
+        with self._lock:
+            series = self._own().setdefault(view, _empty_series())
+            status = f'{status // 100}xx'
+            series['status'][status] = series['status'].get(status, 0) + 1
+            series['duration'][bisect_left(DURATION_BUCKETS, duration)] += 1
+            series['duration_sum'] += duration
+            series['queries'][bisect_left(QUERY_BUCKETS, queries)] += 1
+            series['queries_sum'] += queries
+            for phase, seconds in phases.items():
+                series['phases'][phase] += seconds
+        config = telemetry_settings()
+        if config['DIR'] and time.monotonic() - self._flushed >= config['FLUSH_INTERVAL']:
+            self.flush()
+
+    def flush(self):
+        """Write this process's totals to its file in ``TELEMETRY['DIR']``."""
+        directory = telemetry_settings()['DIR']
+        if not directory:
+            return
+        with self._lock:
+            data = json.dumps(self._own())
+            self._flushed = time.monotonic()
+        path = Path(directory) / self._name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        tmp.write_text(data)
+        os.replace(tmp, path)
+
+    def collect(self):
+        """{view: series} summed over every worker (just this one without a DIR)."""
+        directory = telemetry_settings()['DIR']
+        if not directory:
+            with self._lock:
+                return copy.deepcopy(self._own())
+        self.flush()
+        totals = {}
+        # Files of exited workers are kept so the counters never go down;
+        # empty the directory when the server starts.
+        for path in Path(directory).glob('metrics-*.json'):
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for view, series in data.items():
+                _add_series(totals.setdefault(view, _empty_series()), series)
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._own().clear()
+
+
+metrics = RequestMetrics()
+atexit.register(metrics.flush)
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _histogram(lines, name, view, buckets, counts, total):
+    labels = f'view="{_label(view)}"'
+    cumulative = 0
+    for bound, count in zip((*buckets, '+Inf'), counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_sum{{{labels}}} {total}')
+    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+
+def render_metrics(series_by_view):
+    """The Prometheus text exposition (format 0.0.4) of ``collect()``'s totals."""
+    views = sorted(series_by_view.items())
+    lines = [
+        '# HELP booking_http_requests_total Requests by URL name and status class.',
+        '# TYPE booking_http_requests_total counter',
+    ]
+    for view, series in views:
+        for status, count in sorted(series['status'].items()):
+            lines.append(
+                f'booking_http_requests_total{{view="{_label(view)}",status="{status}"}} {count}')
+    for name, help_text, buckets, key in [
+        ('booking_http_request_duration_seconds', 'Time in Django, by URL name.',
+         DURATION_BUCKETS, 'duration'),
+        ('booking_http_request_queries', 'SQL queries per request, by URL name.',
+         QUERY_BUCKETS, 'queries'),
+    ]:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for view, series in views:
+            _histogram(lines, name, view, buckets, series[key], series[f'{key}_sum'])
+    lines += [
+        '# HELP booking_http_request_duration_estimate_seconds '
+        'p50/p95/p99 latency estimated from the histogram.',
+        '# TYPE booking_http_request_duration_estimate_seconds gauge',
+    ]
+    for view, series in views:
+        for q in QUANTILES:
+            value = quantile(q, DURATION_BUCKETS, series['duration'])
+            if value is not None:
+                lines.append(f'booking_http_request_duration_estimate_seconds'
+                             f'{{view="{_label(view)}",quantile="{q}"}} {value:.6f}')
+    lines += [
+        '# HELP booking_http_request_phase_seconds_total '
+        'Time in SQL, templates, password hashing and sessions.',
+        '# TYPE booking_http_request_phase_seconds_total counter',
+    ]
+    for view, series in views:
+        for phase, seconds in sorted(series['phases'].items()):
+            lines.append(f'booking_http_request_phase_seconds_total'
+                         f'{{view="{_label(view)}",phase="{phase}"}} {seconds:.6f}')
+    return '\n'.join(lines) + '\n'
+
+
+def server_timing(phases, total, queries):
+    """The Server-Timing header value; durations in milliseconds."""
+    entries = []
+    for phase, seconds in phases.items():
+        if seconds or (phase == 'db' and queries):
+            entry = f'{phase};dur={seconds * 1000:.1f}'
+            if phase == 'db':
+                entry += f';desc="{queries} queries"'
+            entries.append(entry)
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class TelemetryMiddleware:
+    """Time each request by phase; see the module docstring.
+
+    Must come before QueryBudgetMiddleware, whose query count and SQL time
+    it reports, and before the session middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not telemetry_settings()['ENABLED']:
+            return self.get_response(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, time.perf_counter() - start, timings)
+
+    async def __acall__(self, request):
+        if not telemetry_settings()['ENABLED']:
+            return await self.get_response(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, time.perf_counter() - start, timings)
+
+    def record(self, request, response, total, timings):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        queries = getattr(request, 'query_count', 0)
+        phases = {**timings.phases, 'db': getattr(request, 'query_duration', 0.0)}
+        metrics.observe(view, response.status_code, total, queries, phases)
+        if telemetry_settings()['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(phases, total, queries)
+        return response
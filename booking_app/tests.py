@@ -1,8 +1,53 @@
-from django.test import TestCase
-from django.contrib.auth.models import User
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.utils import ConnectionHandler
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.test import (
+    TestCase, TransactionTestCase, RequestFactory, AsyncRequestFactory, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import AnonymousUser, User
 from django.utils import timezone
-from .models import TravelOption, Booking
+from . import archive, async_views
+from .archive import archive_departed
+from .auth_backends import CachedModelBackend
+from .models import (
+    TravelOption, Booking, City, Route, FareDay, ArchivedTravelOption, ArchivedBooking,
+    SeatShard, BookingIdWorker)
+from .seatmap import SeatMap
+from .backends.pool import ConnectionPool, PoolTimeout
+from .db_routing import STICKY_COOKIE
+from .exports import stream_bookings
 from .forms import BookingForm
+from .ids import IdGenerator, WorkerIdLease, parse
+from .journeys import ConnectionIndex, find_itineraries, reset_connection_index
+from .querybudget import (
+    query_budget, normalize_sql, record_queries, QueryBudgetExceeded, QueryBudgetMiddleware)
+from .search_cache import search_cache, first_departure, LocalLRUBackend
+from .search_index import get_city_index, invalidate_city_index, VERSION_KEY
+from .services import (
+    reserve_seats, enqueue_booking, drain_booking_queue, pending_departures, SoldOut,
+    cancel_bookings, shard_seat_counter, rebalance_seat_shards, sharded_departures,
+    assign_seat_map)
+from .telemetry import RequestMetrics, metrics as request_metrics, quantile
+from .throttling import (
+    throttle, CacheThrottleStore, LocalThrottleStore, ThrottleMiddleware, PRUNE_INTERVAL)
+from .utils import paginate_by_cursor, keyset_chunks, _encode_cursor
 
 
 class TravelOptionModelTest(TestCase):
@@ -98,3 +143,2049 @@ class ViewTests(TestCase):
         response = self.client.get('/travel/')
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, self.travel.source)
+
+
+class SeatReservationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password')
+        self.travel = TravelOption.objects.create(
+            travel_id="FL123",
+            travel_type="flight",
+            source="New York",
+            destination="London",
+            departure_datetime=timezone.now() + timezone.timedelta(days=1),
+            arrival_datetime=timezone.now() + timezone.timedelta(days=1, hours=8),
+            price=500.00,
+            available_seats=3
+        )
+
+    def test_reserve_seats(self):
+        booking = reserve_seats(self.user, self.travel, 2)
+        self.travel.refresh_from_db()
+        self.assertEqual(self.travel.available_seats, 1)
+        self.assertEqual(booking.total_price, 1000)
+
+    def test_sold_out(self):
+        reserve_seats(self.user, self.travel, 3)
+        with self.assertRaises(SoldOut):
+            reserve_seats(self.user, self.travel, 1)
+        self.travel.refresh_from_db()
+        self.assertEqual(self.travel.available_seats, 0)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_stale_instance_cannot_oversell(self):
+        stale = TravelOption.objects.get(pk=self.travel.pk)
+        reserve_seats(self.user, self.travel, 3)
+        with self.assertRaises(SoldOut):
+            reserve_seats(self.user, stale, 2)
+
+    def test_book_travel_view_sold_out(self):
+        self.client.login(username='testuser', password='password')
+        TravelOption.objects.filter(pk=self.travel.pk).update(available_seats=0)
+        response = self.client.post(
+            f'/book/{self.travel.travel_id}/', {'number_of_seats': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Booking.objects.exists())
+
+
+class BookingIdTest(TestCase):
+    def test_ids_are_unique_across_threads(self):
+        generator = IdGenerator(worker_id=7)
+        results = []
+
+        def issue():
+            results.append([generator.next_id() for _ in range(5000)])
+
+        threads = [threading.Thread(target=issue) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        all_ids = [booking_id for batch in results for booking_id in batch]
+        self.assertEqual(len(set(all_ids)), 40000)
+        for batch in results:
+            self.assertEqual(batch, sorted(batch))
+
+    def test_sequence_rollover_borrows_next_millisecond(self):
+        now = [1_800_000_000_000_000_000]
+
+        def clock():
+            now[0] += 1000  # 1µs per call
+            return now[0]
+
+        generator = IdGenerator(worker_id=1, clock=clock)
+        ids = [generator.next_int() for _ in range(10000)]
+        self.assertEqual(len(set(ids)), 10000)
+        self.assertEqual(ids, sorted(ids))
+
+        # A clock stepped back a minute doesn't stall the generator.
+        now[0] -= 60 * 10**9
+        more = [generator.next_int() for _ in range(10000)]
+        self.assertEqual(len(set(ids + more)), 20000)
+        self.assertEqual(more, sorted(more))
+        self.assertGreater(more[0], ids[-1])
+
+    def test_workers_do_not_collide(self):
+        def frozen():
+            return 1_800_000_000_000_000_000
+
+        first = IdGenerator(worker_id=1, clock=frozen).next_id()
+        second = IdGenerator(worker_id=2, clock=frozen).next_id()
+        self.assertNotEqual(first, second)
+        self.assertEqual(parse(first)[1:], (1, 0))
+        self.assertEqual(parse(second)[1:], (2, 0))
+
+    def test_booking_ids_in_the_same_second(self):
+        user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        travel = TravelOption.objects.create(
+            travel_id="FL123",
+            travel_type="flight",
+            source="New York",
+            destination="London",
+            departure_datetime=timezone.now() + timezone.timedelta(days=1),
+            arrival_datetime=timezone.now() + timezone.timedelta(days=1, hours=8),
+            price=500.00,
+            available_seats=100
+        )
+        bookings = [reserve_seats(user, travel, 1) for _ in range(20)]
+        booking_ids = [booking.booking_id for booking in bookings]
+        self.assertEqual(len(set(booking_ids)), 20)
+        self.assertTrue(all(booking_id.startswith('BK') for booking_id in booking_ids))
+        response = self.client.get(f'/booking/{booking_ids[0]}/')
+        self.assertEqual(response.status_code, 302)  # resolves, login required
+
+
+class WorkerIdLeaseTest(TransactionTestCase):
+    def test_processes_lease_different_worker_ids(self):
+        first, second = WorkerIdLease(), WorkerIdLease()
+        self.assertEqual({first.current(), second.current()}, {0, 1})
+        self.assertEqual(first.current(), first.current())
+
+    def test_expired_lease_is_taken_over_and_replaced(self):
+        stalled = WorkerIdLease()
+        self.assertEqual(stalled.current(), 0)
+        BookingIdWorker.objects.update(expires_at=timezone.now() - timezone.timedelta(seconds=1))
+
+        other = WorkerIdLease()
+        self.assertEqual(other.current(), 0)
+        stalled._renew_at = 0  # due for renewal: finds its id gone
+        self.assertEqual(stalled.current(), 1)
+
+    def test_lease_is_renewed_inside_a_transaction_only_once_it_ran_out(self):
+        lease = WorkerIdLease()
+        lease.current()
+        leased_until = BookingIdWorker.objects.get().expires_at
+        lease._renew_at = 0
+        with transaction.atomic():
+            lease.current()
+        self.assertEqual(BookingIdWorker.objects.get().expires_at, leased_until)
+        lease.current()
+        self.assertGreater(BookingIdWorker.objects.get().expires_at, leased_until)
+
+    def test_new_database_migrates_without_a_configured_id(self):
+        # The lease table doesn't exist until its migration has run.
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'core.settings_bench',
+                   'BENCH_SQLITE_PATH': os.path.join(directory, 'new.sqlite3')}
+            env.pop('BOOKING_ID_WORKER_ID', None)
+            result = subprocess.run(
+                [sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_generator_uses_the_lease_without_a_configured_id(self):
+        with self.settings(BOOKING_ID_WORKER_ID=None):
+            IdGenerator().next_int()
+            generator = IdGenerator()
+            self.assertEqual(parse(generator.next_id())[1], 1)
+
+
+class QueryPlanTest(TestCase):
+    """EXPLAIN every TravelOption/Booking query the search and booking pages
+    issue and fail on full table scans or sorts at production scale.
+
+    On SQLite the planner is fed statistics for PLAN_ROWS rows through
+    sqlite_stat1; on MySQL the rows are actually loaded, so keep
+    QUERY_PLAN_ROWS small there unless running the full check.
+    """
+    PLAN_ROWS = int(os.environ.get('QUERY_PLAN_ROWS', 1_000_000))
+    TABLES = [TravelOption._meta.db_table, Booking._meta.db_table,
+              ArchivedBooking._meta.db_table]
+
+    @classmethod
+    def setUpTestData(cls):
+        TravelOption.objects.create(
+            travel_id="TR100",
+            travel_type="train",
+            source="Mumbai",
+            destination="Delhi",
+            departure_datetime=timezone.now() + timezone.timedelta(days=1),
+            arrival_datetime=timezone.now() + timezone.timedelta(days=1, hours=16),
+            price=900.00,
+            available_seats=100
+        )
+        cls.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        if connection.vendor == 'mysql':
+            cls.load_mysql_rows()
+        elif connection.vendor == 'sqlite':
+            cls.load_sqlite_stats()
+
+    @classmethod
+    def load_sqlite_stats(cls):
+        rows = cls.PLAN_ROWS
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            for table in cls.TABLES:
+                cursor.execute('DELETE FROM sqlite_stat1 WHERE tbl = %s', [table])
+                cursor.execute(
+                    'SELECT name FROM sqlite_master WHERE type = %s AND tbl_name = %s',
+                    ['index', table])
+                for (index_name,) in cursor.fetchall():
+                    cursor.execute(f'PRAGMA index_info("{index_name}")')
+                    columns = len(cursor.fetchall())
+                    # Leading columns are assumed fairly selective: a few
+                    # thousand rows per value, one row per full key.
+                    stat = ' '.join([str(rows)] + ['3000'] * (columns - 1) + ['1'])
+                    cursor.execute('INSERT INTO sqlite_stat1 VALUES (%s, %s, %s)',
+                                   [table, index_name, stat])
+                cursor.execute('INSERT INTO sqlite_stat1 VALUES (%s, NULL, %s)',
+                               [table, str(rows)])
+            cursor.execute('ANALYZE sqlite_master')
+
+    @classmethod
+    def load_mysql_rows(cls):
+        now = timezone.now()
+        batch = []
+        for i in range(cls.PLAN_ROWS):
+            departure = now + timezone.timedelta(minutes=i % 525600)
+            batch.append(TravelOption(
+                travel_id=f"PLAN{i}",
+                travel_type=('flight', 'train', 'bus')[i % 3],
+                source=f"City{i % 50}",
+                destination=f"City{(i + 7) % 50}",
+                departure_datetime=departure,
+                arrival_datetime=departure + timezone.timedelta(hours=2),
+                price=100 + i % 900,
+                available_seats=i % 120
+            ))
+            if len(batch) == 10000:
+                TravelOption.objects.bulk_create(batch)
+                batch = []
+        TravelOption.objects.bulk_create(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE TABLE {", ".join(cls.TABLES)}')
+
+    def setUp(self):
+        search_cache.reset()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN FORMAT=JSON ' + sql)
+                return cursor.fetchone()[0]
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def is_full_scan(self, plan):
+        if connection.vendor == 'mysql':
+            return '"access_type": "ALL"' in plan
+        return any(
+            line.startswith(f'SCAN {table}') and 'INDEX' not in line
+            for line in plan.splitlines() for table in self.TABLES
+        ) or 'TEMP B-TREE' in plan
+
+    def assertNoFullScan(self, url):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            self.skipTest('EXPLAIN checks only cover SQLite and MySQL')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        searched = [q['sql'] for q in queries
+                    if any(table in q['sql'] for table in self.TABLES)]
+        self.assertTrue(searched)
+        for sql in searched:
+            plan = self.explain(sql)
+            self.assertFalse(self.is_full_scan(plan), f"{url}: {sql}\n{plan}")
+
+    def test_home(self):
+        self.assertNoFullScan('/')
+
+    def test_travel_list(self):
+        self.assertNoFullScan('/travel/')
+
+    def test_travel_list_by_type(self):
+        self.assertNoFullScan('/travel/?travel_type=train')
+
+    def test_travel_list_by_date(self):
+        tomorrow = (timezone.now() + timezone.timedelta(days=1)).date()
+        self.assertNoFullScan(f'/travel/?departure_date={tomorrow}')
+        self.assertNoFullScan(f'/travel/?travel_type=bus&departure_date={tomorrow}')
+
+    def test_travel_list_by_route(self):
+        self.assertNoFullScan('/travel/?source=Mumbai&destination=Delhi')
+        self.assertNoFullScan('/travel/?source=Mumb&travel_type=train')
+
+    def test_travel_list_deep_page(self):
+        travel = TravelOption.objects.get(travel_id="TR100")
+        cursor = _encode_cursor(travel, [('departure_datetime', False), ('id', False)], 'next')
+        self.assertNoFullScan(f'/travel/?cursor={cursor}')
+        self.assertNoFullScan(f'/travel/?travel_type=train&cursor={cursor}')
+
+    def test_api_search(self):
+        self.assertNoFullScan('/api/v1/travel/?source=Mumbai&destination=Delhi')
+        self.assertNoFullScan('/api/v1/travel/?travel_type=train&fields=travel_id,price')
+
+    def test_booking_list(self):
+        booking = reserve_seats(self.user, TravelOption.objects.get(travel_id="TR100"), 1)
+        self.client.login(username='testuser', password='password')
+        self.assertNoFullScan('/bookings/')
+        cursor = _encode_cursor(booking, [('booking_date', True), ('id', True)], 'next')
+        self.assertNoFullScan(f'/bookings/?cursor={cursor}')
+
+
+class CitySearchTest(TestCase):
+    def setUp(self):
+        departure = timezone.now() + timezone.timedelta(days=1)
+        for travel_id, source, destination in [
+            ("FL1", "Mumbai", "Delhi"),
+            ("FL2", "Mumbai", "Chennai"),
+            ("FL3", "Bangalore", "Delhi"),
+        ]:
+            TravelOption.objects.create(
+                travel_id=travel_id,
+                travel_type="flight",
+                source=source,
+                destination=destination,
+                departure_datetime=departure,
+                arrival_datetime=departure + timezone.timedelta(hours=2),
+                price=3000.00,
+                available_seats=50
+            )
+
+    def test_route_assigned_on_save(self):
+        travel = TravelOption.objects.get(travel_id="FL1")
+        self.assertEqual(str(travel.route), "Mumbai to Delhi")
+        travel.destination = "chennai"
+        travel.save()
+        self.assertEqual(travel.route, TravelOption.objects.get(travel_id="FL2").route)
+        self.assertEqual(City.objects.count(), 4)
+
+    def test_index_prefix_and_fuzzy(self):
+        index = get_city_index()
+        mumbai = City.objects.get(name="Mumbai").pk
+        self.assertEqual(index.resolve("mumbai"), [mumbai])
+        self.assertEqual(index.resolve("Mum"), [mumbai])
+        self.assertEqual(index.resolve("Mumbay"), [mumbai])
+        self.assertEqual(index.resolve("Zzyzx"), [])
+
+    def test_word_starts_are_indexed(self):
+        new_delhi = City.objects.create(name="New  Delhi").pk
+        delhi = City.objects.get(name="Delhi").pk
+        index = get_city_index()
+        self.assertEqual(index.resolve("delhi"), [delhi, new_delhi])
+        self.assertEqual(index.resolve("new del"), [new_delhi])
+        self.assertEqual(index.complete("del"), [(delhi, "Delhi"), (new_delhi, "New  Delhi")])
+
+    def test_index_version_is_shared_between_workers(self):
+        index = get_city_index()
+        # Another worker saved a city.
+        caches['shared'].set(VERSION_KEY, 'changed elsewhere', None)
+        self.assertIs(get_city_index(), index)
+        with self.settings(CITY_INDEX_VERSION_CHECK_INTERVAL=0):
+            self.assertIsNot(get_city_index(), index)
+
+    def test_autocomplete_endpoint(self):
+        response = self.client.get('/api/cities/', {'q': 'ch'})
+        self.assertEqual(response.json()['results'][0]['name'], "Chennai")
+        response = self.client.get('/api/cities/', {'q': 'Banglore'})
+        self.assertEqual(response.json()['results'][0]['name'], "Bangalore")
+
+    def test_search_by_city(self):
+        response = self.client.get('/travel/', {'source': 'mumbai'})
+        self.assertEqual(
+            {t.travel_id for t in response.context['travel_options']}, {"FL1", "FL2"})
+        response = self.client.get('/travel/', {'source': 'Mumbay', 'destination': 'Delhi'})
+        self.assertEqual(
+            [t.travel_id for t in response.context['travel_options']], ["FL1"])
+        response = self.client.get('/travel/', {'destination': 'Nowhere'})
+        self.assertEqual(len(response.context['travel_options']), 0)
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        departure = timezone.now() + timezone.timedelta(days=1)
+        # Several options share a departure time so the id tie-breaker matters.
+        for i in range(21):
+            TravelOption.objects.create(
+                travel_id=f"BUS{i:02d}",
+                travel_type="bus",
+                source="Pune",
+                destination="Goa",
+                departure_datetime=departure + timezone.timedelta(hours=i // 4),
+                arrival_datetime=departure + timezone.timedelta(hours=i // 4 + 10),
+                price=700.00,
+                available_seats=30
+            )
+        self.factory = RequestFactory()
+
+    def paginate(self, cursor=None):
+        request = self.factory.get('/travel/', {'cursor': cursor} if cursor else {})
+        return paginate_by_cursor(
+            request, TravelOption.objects.all(), 8, ['departure_datetime', 'id'])
+
+    def test_walk_forward_and_back(self):
+        expected = list(TravelOption.objects.order_by('departure_datetime', 'id'))
+        first = self.paginate()
+        self.assertEqual(list(first), expected[:8])
+        self.assertFalse(first.has_previous)
+        self.assertIsNone(first.count)
+
+        second = self.paginate(first.next_cursor)
+        self.assertEqual(list(second), expected[8:16])
+        third = self.paginate(second.next_cursor)
+        self.assertEqual(list(third), expected[16:])
+        self.assertFalse(third.has_next)
+
+        back = self.paginate(third.previous_cursor)
+        self.assertEqual(list(back), expected[8:16])
+        self.assertTrue(back.has_next)
+        start = self.paginate(back.previous_cursor)
+        self.assertEqual(list(start), expected[:8])
+        self.assertFalse(start.has_previous)
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        page = self.paginate('not-a-cursor')
+        self.assertEqual(len(page), 8)
+        self.assertFalse(page.has_previous)
+
+    def test_travel_list_has_no_count_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/travel/')
+        self.assertEqual(len(response.context['travel_options']), 8)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries))
+        next_cursor = response.context['travel_options'].next_cursor
+        response = self.client.get('/travel/', {'cursor': next_cursor})
+        self.assertContains(response, 'BUS08')
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password')
+        self.client.login(username='testuser', password='password')
+        departure = timezone.now() + timezone.timedelta(days=1)
+        for i in range(6):
+            travel = TravelOption.objects.create(
+                travel_id=f"TR{i}",
+                travel_type="train",
+                source="Mumbai",
+                destination=f"City {i}",
+                departure_datetime=departure,
+                arrival_datetime=departure + timezone.timedelta(hours=12),
+                price=800.00,
+                available_seats=50
+            )
+            self.booking = reserve_seats(self.user, travel, 2)
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x'"),
+            normalize_sql("SELECT * FROM t WHERE id IN (%s) AND name = 'y'"))
+
+    def test_decorator_flags_n_plus_one(self):
+        with self.assertRaises(AssertionError):
+            with query_budget(max_repeats=1):
+                for booking in Booking.objects.all():
+                    booking.travel_option.source
+
+    # Logged in views also load the session and the user, a query each.
+    @query_budget(4)
+    def test_booking_list(self):
+        response = self.client.get('/bookings/')
+        self.assertEqual(len(response.context['bookings']), 6)
+
+    @query_budget(3)
+    def test_booking_detail(self):
+        self.client.get(f'/booking/{self.booking.booking_id}/')
+
+    def test_travel_list(self):
+        get_city_index()
+        self.client.logout()
+        with query_budget(2):
+            self.client.get('/travel/', {'source': 'Mumbai'})
+
+    def test_book_and_cancel(self):
+        travel = TravelOption.objects.get(travel_id="TR0")
+        with query_budget(10):
+            self.client.post(f'/book/{travel.travel_id}/', {'number_of_seats': 1})
+        with query_budget(10):
+            self.client.post(f'/booking/{self.booking.booking_id}/cancel/')
+
+    def test_admin_changelist(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True, is_superuser=True)
+        with query_budget(max_repeats=1):
+            response = self.client.get('/admin/booking_app/booking/')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(QUERY_BUDGET_STRICT=False, CACHES={**settings.CACHES, 'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'django_cache'}})
+    def test_settings_budgets_cover_commit_work(self):
+        # Cold caches, the default database 'shared' cache, and the
+        # on_commit work (fare calendar refresh) that TestCase would skip.
+        # Savepoints are left out: TestCase's transaction turns every
+        # atomic block into a pair that a real request doesn't run.
+        call_command('createcachetable', verbosity=0)
+        search_cache._backend = None
+        self.addCleanup(setattr, search_cache, '_backend', None)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True, is_superuser=True)
+        other = Booking.objects.exclude(pk=self.booking.pk).first()
+        requests = [
+            ('home', 'get', '/', {}),
+            ('travel_list', 'get', '/travel/', {'source': 'Mumbai', 'destination': 'City 1'}),
+            ('city_autocomplete', 'get', '/api/cities/', {'q': 'Mum'}),
+            ('fare_calendar', 'get', '/api/fares/', {'source': 'Mumbai', 'destination': 'City 1'}),
+            ('api_travel_search', 'get', '/api/v1/travel/', {'source': 'Mumbai'}),
+            ('api_travel_detail', 'get', '/api/v1/travel/TR1/', {}),
+            ('api_booking_list', 'get', '/api/v1/bookings/', {}),
+            ('booking_list', 'get', '/bookings/', {}),
+            ('booking_detail', 'get', f'/booking/{self.booking.booking_id}/', {}),
+            ('book_travel', 'post', '/book/TR0/', {'number_of_seats': 1}),
+            ('cancel_booking', 'post', f'/booking/{self.booking.booking_id}/cancel/', {}),
+            ('admin:booking_app_traveloption_changelist', 'post',
+             '/admin/booking_app/traveloption/',
+             {'action': 'cancel_bookings', '_selected_action': [other.travel_option_id]}),
+        ]
+        for name, method, url, data in requests:
+            search_cache.reset()
+            invalidate_city_index()
+            with self.subTest(name), record_queries() as recorder:
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = getattr(self.client, method)(url, data)
+                self.assertLess(response.status_code, 400)
+                queries = [sql for sql, _ in recorder.queries if 'SAVEPOINT' not in sql]
+                self.assertLessEqual(len(queries), settings.QUERY_BUDGETS[name])
+
+    def test_middleware_enforces_budget(self):
+        with override_settings(QUERY_BUDGETS={'booking_list': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/bookings/')
+
+
+class SearchCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password')
+        departure = timezone.now() + timezone.timedelta(days=1)
+        self.travel = TravelOption.objects.create(
+            travel_id="FL123",
+            travel_type="flight",
+            source="New York",
+            destination="London",
+            departure_datetime=departure,
+            arrival_datetime=departure + timezone.timedelta(hours=8),
+            price=500.00,
+            available_seats=100
+        )
+        self.other = TravelOption.objects.create(
+            travel_id="FL456",
+            travel_type="flight",
+            source="Paris",
+            destination="Rome",
+            departure_datetime=departure,
+            arrival_datetime=departure + timezone.timedelta(hours=2),
+            price=150.00,
+            available_seats=40
+        )
+        search_cache.reset()
+
+    def travel_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [q for q in queries if 'booking_app_traveloption' in q['sql']]
+
+    def test_repeated_search_is_served_from_cache(self):
+        self.travel_queries('/travel/?source=new+york')
+        response, queries = self.travel_queries('/travel/?source=New%20York')
+        self.assertEqual(queries, [])
+        self.assertContains(response, "100 seats left")
+        self.assertEqual(search_cache.stats()['hits'], 1)
+
+    def test_booking_invalidates_route(self):
+        self.client.get('/travel/?source=New+York')
+        self.client.get('/travel/?source=Paris')
+        self.client.get('/')
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_seats(self.user, self.travel, 3)
+
+        response, queries = self.travel_queries('/travel/?source=New+York')
+        self.assertTrue(queries)
+        self.assertContains(response, "97 seats left")
+        _, queries = self.travel_queries('/travel/?source=Paris')
+        self.assertEqual(queries, [])
+        _, queries = self.travel_queries('/')
+        self.assertTrue(queries)
+        self.assertEqual(search_cache.stats()['invalidations'], 1)
+
+    def test_cancel_invalidates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = reserve_seats(self.user, self.travel, 3)
+        self.client.get('/travel/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.get(pk=booking.pk).cancel()
+        response = self.client.get('/travel/')
+        self.assertContains(response, "100 seats left")
+
+    def test_lru_eviction(self):
+        backend = LocalLRUBackend(max_entries=2)
+        backend.set('a', 1, 60)
+        backend.set('b', 2, 60)
+        backend.get('a')
+        backend.set('c', 3, 60)
+        self.assertEqual(backend.get('a'), 1)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(len(backend), 2)
+
+    def test_versions_are_shared_between_workers(self):
+        worker, other_worker = (LocalLRUBackend(versions_alias='shared') for _ in range(2))
+        before = other_worker.get_versions(['all', 'route:1'])
+        worker.bump_versions(['all'])
+        after = other_worker.get_versions(['all', 'route:1'])
+        self.assertNotEqual(after[0], before[0])
+        self.assertEqual(after[1], before[1])
+
+    def test_entries_expire_with_their_first_departure(self):
+        soon = timezone.now() + timezone.timedelta(seconds=30)
+        timeout = search_cache.entry_timeout([TravelOption(departure_datetime=soon)],
+                                             first_departure)
+        self.assertTrue(0 < timeout <= 30)
+        self.assertEqual(search_cache.entry_timeout([], first_departure), search_cache.timeout)
+
+        departed = timezone.now() - timezone.timedelta(seconds=1)
+        for _ in range(2):
+            search_cache.get_or_set('test', {}, None, lambda: 'result', lambda _: departed)
+        self.assertEqual(search_cache.stats()['misses'], 2)
+
+    def test_stats_endpoint_requires_staff(self):
+        self.client.login(username='testuser', password='password')
+        self.assertEqual(self.client.get('/stats/search-cache/').status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/stats/search-cache/')
+        self.assertIn('hit_ratio', response.json())
+
+
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        departure = timezone.now() + timezone.timedelta(days=2)
+        self.travel = TravelOption.objects.create(
+            travel_id="TR100",
+            travel_type="train",
+            source="Mumbai",
+            destination="Delhi",
+            departure_datetime=departure,
+            arrival_datetime=departure + timezone.timedelta(hours=16),
+            price=1500.00,
+            available_seats=80
+        )
+        self.factory = AsyncRequestFactory()
+        search_cache.reset()
+
+    def request(self, path, user=None):
+        request = self.factory.get(path)
+        request.user = user or self.user
+
+        async def auser():
+            return request.user
+        request.auser = auser
+        request.session = {}
+        return request
+
+    async def test_travel_list(self):
+        response = await async_views.travel_list(self.request('/travel/?source=mumbai'))
+        self.assertContains(response, "TR100")
+        response = await async_views.travel_list(self.request('/travel/?source=Chennai'))
+        self.assertNotContains(response, "TR100")
+
+    async def test_home_uses_search_cache(self):
+        await async_views.home(self.request('/'))
+        response = await async_views.home(self.request('/'))
+        self.assertContains(response, "Mumbai")
+        self.assertEqual(search_cache.stats()['hits'], 1)
+
+    async def test_booking_list_and_detail(self):
+        booking = await sync_to_async(reserve_seats)(self.user, self.travel, 2)
+        response = await async_views.booking_list(self.request('/bookings/'))
+        self.assertContains(response, booking.booking_id)
+        response = await async_views.booking_detail(
+            self.request(f'/booking/{booking.booking_id}/'), booking.booking_id)
+        self.assertContains(response, booking.booking_id)
+
+        other = await User.objects.acreate(username='other')
+        with self.assertRaises(Http404):
+            await async_views.booking_detail(
+                self.request(f'/booking/{booking.booking_id}/', other), booking.booking_id)
+
+    @override_settings(QUERY_BUDGET_STRICT=True, QUERY_BUDGET_DEFAULT=1)
+    async def test_query_budget_middleware_counts_async_queries(self):
+        async def view(request):
+            await TravelOption.objects.acount()
+            await TravelOption.objects.acount()
+            return HttpResponse()
+
+        middleware = QueryBudgetMiddleware(view)
+        request = self.request('/')
+        request.resolver_match = None
+        with self.assertRaises(QueryBudgetExceeded):
+            await middleware(request)
+        self.assertEqual(request.query_count, 2)
+
+
+class ImportTimetableTest(TestCase):
+    HEADER = ('travel_id,travel_type,source,destination,departure_datetime,'
+              'arrival_datetime,price,available_seats\n')
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def row(self, travel_id, source='Mumbai', destination='Delhi', seats=100, price=1500):
+        return (f"{travel_id},train,{source},{destination},2030-01-01T08:00:00,"
+                f"2030-01-01T20:00:00,{price},{seats}\n")
+
+    def test_import_resolves_routes(self):
+        path = self.write('timetable.csv', self.HEADER + self.row('TR1')
+                          + self.row('TR2', ' new  york', 'london') + self.row('TR3', 'mumbai'))
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_timetable', path, batch_size=100, stdout=StringIO())
+        self.assertLess(len(queries), 15)
+
+        self.assertEqual(TravelOption.objects.count(), 3)
+        self.assertEqual(City.objects.filter(name__in=['Mumbai', 'mumbai']).count(), 1)
+        travel = TravelOption.objects.get(travel_id='TR2')
+        self.assertEqual(travel.source, 'new york')
+        self.assertEqual(str(travel.route), 'new york to london')
+        self.assertEqual(TravelOption.objects.get(travel_id='TR3').route_id,
+                         TravelOption.objects.get(travel_id='TR1').route_id)
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def test_reimport_updates_without_touching_seats(self):
+        call_command('import_timetable', self.write('a.csv', self.HEADER + self.row('TR1')),
+                     stdout=StringIO())
+        TravelOption.objects.filter(travel_id='TR1').update(available_seats=60)
+        path = self.write('b.csv', self.HEADER + self.row('TR1', seats=100, price=999))
+        call_command('import_timetable', path, stdout=StringIO())
+
+        travel = TravelOption.objects.get(travel_id='TR1')
+        self.assertEqual(travel.price, 999)
+        self.assertEqual(travel.available_seats, 60)
+        call_command('import_timetable', path, update_seats=True, stdout=StringIO())
+        travel.refresh_from_db()
+        self.assertEqual(travel.available_seats, 100)
+
+        # Seat maps and split counters own their departure's seats.
+        assign_seat_map(travel.pk, 4)
+        path = self.write('c.csv', self.HEADER + self.row('TR1', seats=500, price=899))
+        call_command('import_timetable', path, update_seats=True, stdout=StringIO())
+        travel.refresh_from_db()
+        self.assertEqual((travel.price, travel.available_seats), (899, 100))
+
+    def test_invalid_rows_are_skipped(self):
+        path = self.write('timetable.jsonl', '\n'.join([
+            '{"travel_id": "FL1", "travel_type": "flight", "source": "Pune", "destination": "Goa",'
+            ' "departure_datetime": "2030-01-01T08:00:00Z", "arrival_datetime": "2030-01-01T09:00:00Z",'
+            ' "price": 2500, "available_seats": 180}',
+            '{"travel_id": "FL2", "travel_type": "boat"}',
+            'not json',
+        ]))
+        stderr = StringIO()
+        call_command('import_timetable', path, stdout=StringIO(), stderr=stderr)
+        self.assertEqual(list(TravelOption.objects.values_list('travel_id', flat=True)), ['FL1'])
+        self.assertIn('line 2: travel_type', stderr.getvalue())
+        self.assertIn('line 3: invalid JSON', stderr.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('import_timetable', path, max_errors=1, restart=True,
+                         stdout=StringIO(), stderr=StringIO())
+
+    def test_resume_from_checkpoint(self):
+        rows = [self.row(f'TR{i}') for i in range(10)]
+        path = self.write('timetable.csv', self.HEADER + ''.join(rows[:6])
+                          + 'TRX,train,Mumbai,Delhi,bad,bad,1,1\n' + ''.join(rows[6:]))
+        with self.assertRaises(CommandError):
+            call_command('import_timetable', path, batch_size=3, max_errors=0,
+                         stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(TravelOption.objects.count(), 6)
+
+        stdout = StringIO()
+        call_command('import_timetable', path, batch_size=3, stdout=stdout, stderr=StringIO())
+        self.assertIn('Resumed after 6 records', stdout.getvalue())
+        self.assertEqual(TravelOption.objects.count(), 10)
+        self.assertEqual(Route.objects.count(), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_LAG=5)
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password')
+        self.travel = TravelOption.objects.create(
+            travel_id="TR100",
+            travel_type="train",
+            source="Mumbai",
+            destination="Delhi",
+            departure_datetime=timezone.now() + timezone.timedelta(days=2),
+            arrival_datetime=timezone.now() + timezone.timedelta(days=2, hours=16),
+            price=1500.00,
+            available_seats=80
+        )
+        search_cache.reset()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url)
+        return response, len(primary), len(replica)
+
+    def test_read_only_views_use_replica(self):
+        response, primary, replica = self.get('/travel/')
+        self.assertContains(response, "TR100")
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_other_views_use_primary(self):
+        self.client.login(username='testuser', password='password')
+        _, primary, replica = self.get('/profile/')
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+        self.assertEqual(TravelOption.objects.db, 'default')
+
+    def test_writes_stick_to_primary(self):
+        self.client.login(username='testuser', password='password')
+        response = self.client.post('/book/TR100/', {'number_of_seats': 2})
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        response, primary, replica = self.get('/bookings/')
+        self.assertContains(response, Booking.objects.get().booking_id)
+        self.assertEqual(replica, 0)
+
+        self.client.cookies[STICKY_COOKIE] = str(timezone.now().timestamp() - 1)
+        _, primary, replica = self.get('/bookings/')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(TestCase):
+    def make_pool(self, **options):
+        def ping(raw):
+            if not raw.healthy:
+                raise OSError('gone away')
+        return ConnectionPool(FakeConnection, ping, FakeConnection.close, **options)
+
+    def test_reuses_connections(self):
+        pool = self.make_pool()
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        self.assertEqual(pool.stats()['connects'], 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test_waits_then_times_out_when_full(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        conn = pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        threading.Timer(0.01, pool.checkin, [conn]).start()
+        pool.timeout = 1
+        self.assertIs(pool.checkout(), conn)
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['timeouts'], stats['size']), (2, 1, 1))
+
+    def test_health_check_replaces_dead_connection(self):
+        pool = self.make_pool(health_check_after=0)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        conn.raw.healthy = False
+        replacement = pool.checkout()
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.raw.closed)
+        self.assertEqual(pool.stats()['health_check_failures'], 1)
+
+    def test_recycles_old_and_broken_connections(self):
+        pool = self.make_pool(max_lifetime=0)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        self.assertTrue(conn.raw.closed)
+
+        pool.max_lifetime = None
+        conn = pool.checkout()
+        pool.recycle()
+        pool.checkin(conn)
+        self.assertTrue(conn.raw.closed)
+        conn = pool.checkout()
+        pool.checkin(conn, reusable=False)
+        stats = pool.stats()
+        self.assertEqual((stats['recycled'], stats['discarded'], stats['size']), (2, 1, 0))
+
+    def test_sqlite_backend_pools_connections(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        handler = ConnectionHandler({'default': {}, 'pooled': {
+            'ENGINE': 'booking_app.backends.sqlite3',
+            'NAME': os.path.join(directory.name, 'pooled.sqlite3'),
+            'POOL': {'MAX_SIZE': 2},
+        }})
+        pooled = handler['pooled']
+        pooled.ensure_connection()
+        raw = pooled.connection
+        with pooled.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (id integer)')
+        pooled.close()
+        self.assertIsNone(pooled.connection)
+
+        with pooled.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM t')
+        self.assertIs(pooled.connection, raw)
+        self.assertEqual(pooled.pool.stats()['connects'], 1)
+        pooled.close()
+        pooled.pool.recycle()
+
+
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies',
+                   AUTHENTICATION_BACKENDS=['booking_app.auth_backends.CachedModelBackend'],
+                   AUTH_USER_CACHE_ALIAS='shared')
+class SessionAndUserCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password')
+        self.client.login(username='testuser', password='password')
+        travel = TravelOption.objects.create(
+            travel_id="TR100",
+            travel_type="train",
+            source="Mumbai",
+            destination="Delhi",
+            departure_datetime=timezone.now() + timezone.timedelta(days=2),
+            arrival_datetime=timezone.now() + timezone.timedelta(days=2, hours=16),
+            price=1500.00,
+            available_seats=80
+        )
+        reserve_seats(self.user, travel, 2)
+
+    def test_booking_list_only_queries_bookings(self):
+        self.client.get('/bookings/')
+        # Live and archived bookings; no session or user queries.
+        with self.assertNumQueries(2):
+            response = self.client.get('/bookings/')
+        self.assertEqual(len(response.context['bookings']), 1)
+
+    def test_profile_update_reaches_next_request(self):
+        self.client.get('/profile/')
+        response = self.client.post('/profile/', {
+            'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com'},
+            follow=True)
+        self.assertContains(response, 'Profile updated successfully!')
+        self.assertEqual(response.context['user'].first_name, 'Ada')
+
+    def test_deactivated_user_is_logged_out(self):
+        self.client.get('/bookings/')
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/bookings/')
+        self.assertRedirects(response, '/login/?next=/bookings/')
+
+    def test_per_process_cache_is_refused(self):
+        with override_settings(AUTH_USER_CACHE_ALIAS='default'):
+            with self.assertRaises(ImproperlyConfigured):
+                CachedModelBackend()
+
+
+class SessionRevocationTest(TestCase):
+    def test_logout_ends_the_session_everywhere(self):
+        User.objects.create_user('testuser', 'test@example.com', 'password')
+        self.client.login(username='testuser', password='password')
+        cookie = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.client.get('/logout/')
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+        response = self.client.get('/bookings/')
+        self.assertRedirects(response, '/login/?next=/bookings/')
+
+
+THROTTLE_RULES = {
+    'login': [{'key': 'ip', 'rate': '2/m', 'burst': 2, 'methods': ['POST']}],
+    'book_travel': [
+        {'key': 'user', 'rate': '3/m', 'burst': 3, 'methods': ['POST']},
+        {'key': 'travel_id', 'concurrency': 1, 'wait': 0.1, 'methods': ['POST']},
+    ],
+}
+
+
+@override_settings(THROTTLE={'ENABLED': True, 'RULES': THROTTLE_RULES})
+class ThrottleTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password')
+        self.travel = TravelOption.objects.create(
+            travel_id="FL123",
+            travel_type="flight",
+            source="New York",
+            destination="London",
+            departure_datetime=timezone.now() + timezone.timedelta(days=1),
+            arrival_datetime=timezone.now() + timezone.timedelta(days=1, hours=8),
+            price=500.00,
+            available_seats=100
+        )
+        throttle.reset()
+        self.addCleanup(throttle.reset)
+
+    def test_login_rate_per_ip(self):
+        for _ in range(2):
+            response = self.client.post('/login/', {'username': 'testuser', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post('/login/', {'username': 'testuser', 'password': 'password'})
+        self.assertEqual(response.status_code, 429)
+        # Counting down from 30s since the bucket ran dry; logins are slow to hash.
+        self.assertIn(response['Retry-After'], ('29', '30'))
+        self.assertEqual(self.client.get('/login/').status_code, 200)
+
+        response = self.client.post('/login/', {'username': 'testuser', 'password': 'password'},
+                                    REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(throttle.stats()['login:ip:rate:throttled'], 1)
+
+    def test_client_ip_is_the_hop_the_proxy_added(self):
+        request = RequestFactory().get(
+            '/login/', HTTP_X_FORWARDED_FOR='1.2.3.4, 203.0.113.7, 10.0.0.9')
+        with self.settings(THROTTLE={'IP_HEADER': 'HTTP_X_FORWARDED_FOR'}):
+            self.assertEqual(throttle.client_ip(request), '10.0.0.9')
+        with self.settings(THROTTLE={'IP_HEADER': 'HTTP_X_FORWARDED_FOR', 'TRUSTED_PROXIES': 2}):
+            self.assertEqual(throttle.client_ip(request), '203.0.113.7')
+
+    def test_idle_buckets_are_pruned(self):
+        store = LocalThrottleStore()
+        store.take('idle', rate=1, burst=2)
+        store.take('busy', rate=0.001, burst=1)
+        store.prune(time.monotonic() + PRUNE_INTERVAL)
+        self.assertEqual(list(store._buckets), ['busy'])
+        self.assertGreater(store.take('busy', rate=0.001, burst=1), 0)
+
+    def test_booking_rate_per_user(self):
+        self.client.login(username='testuser', password='password')
+        for _ in range(3):
+            self.client.post('/book/FL123/', {'number_of_seats': 1})
+        response = self.client.post('/book/FL123/', {'number_of_seats': 1})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(Booking.objects.count(), 3)
+
+    def test_booking_concurrency_per_departure(self):
+        self.client.login(username='testuser', password='password')
+        slot = 'book_travel:concurrency:travel:FL123'
+        throttle.store.acquire(slot, 1)
+        response = self.client.post('/book/FL123/', {'number_of_seats': 1})
+        self.assertEqual(response.status_code, 429)
+        stats = throttle.stats()
+        self.assertEqual(stats['book_travel:travel_id:concurrency:queued'], 1)
+        self.assertEqual(stats['book_travel:travel_id:concurrency:rejected'], 1)
+
+        threading.Timer(0.02, throttle.store.release, [slot]).start()
+        response = self.client.post('/book/FL123/', {'number_of_seats': 1})
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(THROTTLE={'RULES': {'login': [
+        {'key': 'ip', 'rate': '10/m', 'burst': 10},
+        {'key': 'global', 'concurrency': 1, 'wait': 1}]}})
+    async def test_async_middleware_keeps_cache_store_off_the_event_loop(self):
+        store = CacheThrottleStore(alias='default')
+        threads = []
+        for name in ('take', 'acquire', 'release'):
+            method = getattr(store, name)
+
+            def record(*args, method=method):
+                threads.append(threading.get_ident())
+                return method(*args)
+            setattr(store, name, record)
+        self.addCleanup(setattr, throttle, '_store', throttle._store)
+        throttle._store = store
+
+        async def view(request):
+            return HttpResponse()
+
+        request = AsyncRequestFactory().get('/login/')
+
+        async def auser():
+            return AnonymousUser()
+        request.auser = auser
+        response = await ThrottleMiddleware(view)(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.get_ident(), threads)
+
+
+class BookingQueueTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password')
+        self.travel = TravelOption.objects.create(
+            travel_id="FL123",
+            travel_type="flight",
+            source="New York",
+            destination="London",
+            departure_datetime=timezone.now() + timezone.timedelta(days=1),
+            arrival_datetime=timezone.now() + timezone.timedelta(days=1, hours=8),
+            price=500.00,
+            available_seats=5,
+            queue_bookings=True
+        )
+
+    def test_drain_confirms_in_order_while_seats_last(self):
+        bookings = [enqueue_booking(self.user, self.travel, n) for n in (2, 2, 2, 1)]
+        self.travel.refresh_from_db()
+        self.assertEqual(self.travel.available_seats, 5)
+        self.assertEqual(list(pending_departures()), [self.travel.pk])
+
+        # Two selects and three updates inside a savepoint, whatever the batch size.
+        with self.assertNumQueries(7):
+            stats = drain_booking_queue(self.travel.pk)
+        self.assertEqual(stats, {'confirmed': 3, 'rejected': 1, 'seats': 5})
+        statuses = [Booking.objects.get(pk=b.pk).status for b in bookings]
+        self.assertEqual(statuses, ['confirmed', 'confirmed', 'rejected', 'confirmed'])
+        self.travel.refresh_from_db()
+        self.assertEqual(self.travel.available_seats, 0)
+        self.assertFalse(pending_departures().exists())
+        with self.assertRaises(SoldOut):
+            enqueue_booking(self.user, self.travel, 1)
+
+    def test_batch_size(self):
+        for _ in range(3):
+            enqueue_booking(self.user, self.travel, 1)
+        self.assertEqual(drain_booking_queue(self.travel.pk, batch_size=2)['confirmed'], 2)
+        self.assertEqual(Booking.objects.filter(status='pending').count(), 1)
+
+    def test_cancel_pending_booking(self):
+        booking = enqueue_booking(self.user, self.travel, 2)
+        self.assertTrue(booking.cancel())
+        self.assertEqual(drain_booking_queue(self.travel.pk)['confirmed'], 0)
+        self.travel.refresh_from_db()
+        self.assertEqual(self.travel.available_seats, 5)
+
+    def test_book_travel_view_and_worker(self):
+        self.client.login(username='testuser', password='password')
+        response = self.client.post(f'/book/{self.travel.travel_id}/', {'number_of_seats': 2})
+        booking = Booking.objects.get()
+        self.assertEqual(booking.status, 'pending')
+        self.assertRedirects(response, f'/booking/{booking.booking_id}/')
+        self.assertContains(self.client.get(response.url), 'http-equiv="refresh"')
+
+        out = StringIO()
+        call_command('process_booking_queue', '--once', stdout=out)
+        self.assertIn('1 bookings confirmed, 0 rejected.', out.getvalue())
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'confirmed')
+        response = self.client.get(f'/booking/{booking.booking_id}/')
+        self.assertNotContains(response, 'http-equiv="refresh"')
+
+    def test_direct_path_when_not_queued(self):
+        TravelOption.objects.filter(pk=self.travel.pk).update(queue_bookings=False)
+        self.client.login(username='testuser', password='password')
+        self.client.post(f'/book/{self.travel.travel_id}/', {'number_of_seats': 2})
+        self.assertEqual(Booking.objects.get().status, 'confirmed')
+
+
+class BulkCancellationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password', is_staff=True, is_superuser=True)
+        departure = timezone.now() + timezone.timedelta(days=1)
+        self.travels = [TravelOption.objects.create(
+            travel_id=f"TR{i}",
+            travel_type="train",
+            source="Mumbai",
+            destination="Delhi",
+            departure_datetime=departure,
+            arrival_datetime=departure + timezone.timedelta(hours=16),
+            price=800.00,
+            available_seats=100
+        ) for i in range(2)]
+        for travel in self.travels:
+            for _ in range(5):
+                reserve_seats(self.user, travel, 2)
+
+    def seats(self, travel):
+        travel.refresh_from_db()
+        return travel.available_seats
+
+    def test_chunked_cancel_restores_seats(self):
+        Booking.objects.filter(
+            pk=Booking.objects.filter(travel_option=self.travels[0]).first().pk
+        ).update(status='cancelled')
+        enqueue_booking(self.user, self.travels[0], 3)
+        bookings = Booking.objects.filter(travel_option=self.travels[0])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(cancel_bookings(bookings, chunk_size=2), (5, 8))
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(self.seats(self.travels[0]), 98)
+        self.assertFalse(bookings.exclude(status='cancelled').exists())
+        self.assertEqual(self.seats(self.travels[1]), 90)
+        self.assertEqual(cancel_bookings(bookings), (0, 0))
+
+    def test_stale_instances_do_not_lose_seats(self):
+        first, second = Booking.objects.filter(travel_option=self.travels[0])[:2]
+        self.assertTrue(first.cancel())
+        self.assertTrue(second.cancel())
+        self.assertFalse(Booking.objects.get(pk=first.pk).cancel())
+        self.assertEqual(self.seats(self.travels[0]), 94)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command('cancel_departures', 'TR0', 'TR1', stdout=out)
+        self.assertIn('Cancelled 10 bookings on 2 departures, restored 20 seats.', out.getvalue())
+        self.assertEqual([self.seats(travel) for travel in self.travels], [100, 100])
+        with self.assertRaises(CommandError):
+            call_command('cancel_departures', 'TR9')
+
+    def test_admin_action(self):
+        self.client.login(username='testuser', password='password')
+        response = self.client.post('/admin/booking_app/traveloption/', {
+            'action': 'cancel_bookings', '_selected_action': [self.travels[1].pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.seats(self.travels[1]), 100)
+        self.assertEqual(self.seats(self.travels[0]), 90)
+
+
+class FareCalendarTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password')
+        self.tomorrow = timezone.localtime() + timezone.timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap = self.departure("TR1", 500, seats=2)
+            self.departure("TR2", 800)
+            self.departure("FL1", 4000, travel_type="flight")
+        search_cache.reset()
+
+    def departure(self, travel_id, price, seats=50, travel_type="train", days=1):
+        departure = self.tomorrow + timezone.timedelta(days=days - 1)
+        return TravelOption.objects.create(
+            travel_id=travel_id,
+            travel_type=travel_type,
+            source="Mumbai",
+            destination="Delhi",
+            departure_datetime=departure,
+            arrival_datetime=departure + timezone.timedelta(hours=16),
+            price=price,
+            available_seats=seats
+        )
+
+    def fare_day(self, travel_type="train", days=1):
+        day = (self.tomorrow + timezone.timedelta(days=days - 1)).date()
+        return FareDay.objects.filter(travel_type=travel_type, day=day).first()
+
+    def test_kept_current_on_booking_and_edits(self):
+        fare_day = self.fare_day()
+        self.assertEqual((fare_day.min_price, fare_day.available_seats, fare_day.departures),
+                         (500, 52, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_seats(self.user, self.cheap, 2)
+        fare_day = self.fare_day()
+        self.assertEqual((fare_day.min_price, fare_day.available_seats, fare_day.departures),
+                         (800, 50, 1))
+
+        # Moving a departure to another day updates both days.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cheap.departure_datetime += timezone.timedelta(days=1)
+            self.cheap.available_seats = 10
+            self.cheap.save()
+        self.assertEqual(self.fare_day(days=2).min_price, 500)
+        self.assertEqual(self.fare_day().available_seats, 50)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TravelOption.objects.get(travel_id="FL1").delete()
+        self.assertIsNone(self.fare_day("flight"))
+
+        incremental = set(FareDay.objects.values_list(
+            'route_id', 'travel_type', 'day', 'min_price', 'available_seats', 'departures'))
+        call_command('rebuild_fare_calendar', stdout=StringIO())
+        self.assertEqual(set(FareDay.objects.values_list(
+            'route_id', 'travel_type', 'day', 'min_price', 'available_seats', 'departures')),
+            incremental)
+
+    def test_api(self):
+        get_city_index()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/fares/', {'source': 'Mumbai', 'days': 3})
+        days = response.json()['days']
+        self.assertEqual([day['min_price'] for day in days], [None, '500.00', None])
+        self.assertEqual(days[1]['available_seats'], 102)
+        self.assertEqual(days[1]['date'], self.tomorrow.date().isoformat())
+
+        response = self.client.get('/api/fares/', {'source': 'Mumbai', 'travel_type': 'flight'})
+        self.assertEqual(len(response.json()['days']), 14)
+        self.assertEqual(response.json()['days'][1]['min_price'], '4000.00')
+        self.assertEqual(self.client.get('/api/fares/').status_code, 400)
+
+    def test_travel_list_calendar(self):
+        get_city_index()
+        response = self.client.get('/travel/', {'source': 'Mumbai', 'destination': 'Delhi'})
+        self.assertEqual(response.context['fare_calendar'][1]['min_price'], 500)
+        self.assertContains(response, 'Cheapest Fares by Day')
+        self.assertContains(
+            response, f"departure_date={self.tomorrow.date().isoformat()}")
+        self.assertIsNone(self.client.get('/travel/').context['fare_calendar'])
+
+
+class ConnectionSearchTest(TestCase):
+    A, B, C, D = 1, 2, 3, 4
+
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0) + timezone.timedelta(days=1)
+
+    def at(self, minutes):
+        return self.start + timezone.timedelta(minutes=minutes)
+
+    def row(self, pk, origin, destination, departs, arrives, seats=10, travel_type='train'):
+        return (pk, origin, destination, self.at(departs), self.at(arrives), seats, travel_type)
+
+    def journeys(self, index, origin, destination, **kwargs):
+        kwargs.setdefault('layovers', (1800, 600, 600))
+        return index.journeys([origin], [destination], int(self.start.timestamp()), **kwargs)
+
+    def test_earliest_arrival_with_layovers_and_changes(self):
+        index = ConnectionIndex([
+            self.row(1, self.A, self.D, 0, 600),                        # direct, slow
+            self.row(2, self.A, self.B, 10, 60),
+            self.row(3, self.B, self.C, 65, 120),                       # layover too short
+            self.row(4, self.B, self.C, 80, 140),
+            self.row(5, self.C, self.D, 160, 200),
+            self.row(6, self.B, self.D, 75, 150, travel_type='flight'),  # flight needs 30 min
+        ])
+        self.assertEqual(self.journeys(index, self.A, self.D, limit=1), [[2, 4, 5]])
+        self.assertEqual(self.journeys(index, self.A, self.D, max_changes=1, limit=1), [[1]])
+        self.assertEqual(self.journeys(index, self.A, self.D, travel_type='flight'), [])
+        self.assertEqual(self.journeys(index, self.A, self.D, seats=11), [])
+        # Later itineraries start after the previous one's first departure.
+        self.assertEqual(self.journeys(index, self.A, self.D), [[2, 4, 5]])
+        self.assertEqual(self.journeys(index, self.A, self.D, max_changes=0, limit=3), [[1]])
+
+    def test_incremental_updates(self):
+        index = ConnectionIndex([
+            self.row(1, self.A, self.B, 0, 60),
+            self.row(2, self.B, self.C, 90, 120),
+            self.row(3, self.B, self.C, 200, 260),
+        ])
+        self.assertEqual(self.journeys(index, self.A, self.C, limit=1), [[1, 2]])
+        index.update([self.row(2, self.B, self.C, 90, 120, seats=0)])
+        self.assertEqual(self.journeys(index, self.A, self.C, limit=1), [[1, 3]])
+        index.update([self.row(2, self.B, self.C, 100, 130, seats=5),
+                      self.row(4, self.A, self.B, 1, 30)])
+        self.assertEqual(len(index), 4)
+        self.assertEqual(list(index.pks), [1, 4, 2, 3])
+        # Same arrival either way; the later departure wins.
+        self.assertEqual(self.journeys(index, self.A, self.C), [[4, 2]])
+        index.remove(4)
+        self.assertEqual(self.journeys(index, self.A, self.C), [[1, 2]])
+
+    @override_settings(CONNECTION_SEARCH={'REFRESH_INTERVAL': 0})
+    def test_view_follows_database_changes(self):
+        reset_connection_index()
+        self.addCleanup(reset_connection_index)
+        legs = [("Pune", "Mumbai", 0, 180), ("Mumbai", "Delhi", 240, 1200)]
+        for i, (source, destination, departs, arrives) in enumerate(legs):
+            TravelOption.objects.create(
+                travel_id=f"TR{i}", travel_type="train", source=source, destination=destination,
+                departure_datetime=self.at(departs), arrival_datetime=self.at(arrives),
+                price=500, available_seats=5)
+        query = {'source': 'Pune', 'destination': 'Delhi'}
+
+        response = self.client.get('/travel/connections/', query)
+        itinerary, = response.context['itineraries']
+        self.assertEqual([leg.travel_id for leg in itinerary['legs']], ['TR0', 'TR1'])
+        self.assertEqual((itinerary['changes'], itinerary['total_price']), (1, 1000))
+        self.assertContains(response, '60 min layover')
+
+        TravelOption.objects.filter(travel_id="TR1").update(
+            available_seats=0, updated_at=timezone.now())
+        self.assertEqual(self.client.get('/travel/connections/', query).context['itineraries'], [])
+        self.assertContains(self.client.get('/travel/', query), 'Search connections with changes')
+
+    @override_settings(CONNECTION_SEARCH={'REFRESH_INTERVAL': 3600})
+    def test_deleted_leg_gives_way_to_the_alternative(self):
+        reset_connection_index()
+        self.addCleanup(reset_connection_index)
+        legs = [("Pune", "Mumbai", 0, 180), ("Mumbai", "Delhi", 240, 1200),
+                ("Mumbai", "Delhi", 300, 1300)]
+        for i, (source, destination, departs, arrives) in enumerate(legs):
+            TravelOption.objects.create(
+                travel_id=f"TR{i}", travel_type="train", source=source, destination=destination,
+                departure_datetime=self.at(departs), arrival_datetime=self.at(arrives),
+                price=500, available_seats=5)
+        route = TravelOption.objects.get(travel_id="TR0").route
+        destination = TravelOption.objects.get(travel_id="TR1").route.destination_id
+
+        def search():
+            return [[leg.travel_id for leg in itinerary['legs']] for itinerary in
+                    find_itineraries([route.origin_id], [destination], self.start)]
+
+        self.assertEqual(search(), [['TR0', 'TR1']])
+        # Deleted by another process: found gone on the re-check, and the
+        # search runs again without it.
+        TravelOption.objects.filter(travel_id="TR1")._raw_delete('default')
+        self.assertEqual(search(), [['TR0', 'TR2']])
+        # Deleted here: dropped from the index once committed.
+        with self.captureOnCommitCallbacks(execute=True):
+            TravelOption.objects.get(travel_id="TR2").delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(search(), [])
+
+
+class AdminScaleTest(TestCase):
+    """Changelists over ADMIN_SCALE_ROWS bookings stay within a fixed number
+    of queries and ADMIN_SCALE_SECONDS per page, whatever the table size.
+    """
+    ROWS = int(os.environ.get('ADMIN_SCALE_ROWS', 1_000_000))
+    SECONDS = float(os.environ.get('ADMIN_SCALE_SECONDS', 1.0))
+    MAX_QUERIES = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        departure = timezone.now() + timezone.timedelta(days=1)
+        travel = TravelOption.objects.create(
+            travel_id="TR100", travel_type="train", source="Mumbai", destination="Delhi",
+            departure_datetime=departure,
+            arrival_datetime=departure + timezone.timedelta(hours=16),
+            price=900.00, available_seats=100)
+        booked = timezone.now() - timezone.timedelta(days=400)
+        table = Booking._meta.db_table
+        with connection.cursor() as cursor:
+            for start in range(0, cls.ROWS, 50_000):
+                cursor.executemany(
+                    f'INSERT INTO {table} (booking_id, user_id, travel_option_id, '
+                    'number_of_seats, total_price, booking_date, status, seat_numbers) '
+                    'VALUES (%s, %s, %s, %s, %s, %s, %s, %s)',
+                    [(f'BKSCALE{i}', cls.admin.pk, travel.pk, 1, '900.00',
+                      booked + timezone.timedelta(seconds=30 * i),
+                      ('confirmed', 'cancelled')[i % 7 == 0], '')
+                     for i in range(start, min(start + 50_000, cls.ROWS))])
+            cursor.execute(f'ANALYZE {table}' if connection.vendor == 'sqlite'
+                           else f'ANALYZE TABLE {table}')
+        cls.last_booked = booked + timezone.timedelta(seconds=30 * (cls.ROWS - 1))
+
+    def setUp(self):
+        self.client.login(username='admin', password='password')
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(url)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), self.MAX_QUERIES,
+                             '\n'.join(q['sql'] for q in queries))
+        self.assertLess(elapsed, self.SECONDS, url)
+        return response
+
+    def test_booking_changelist(self):
+        response = self.get('/admin/booking_app/booking/')
+        self.assertEqual(len(response.context['cl'].result_list), 100)
+        if connection.vendor in ('sqlite', 'mysql'):
+            # Taken from the table statistics rather than COUNT(*).
+            self.assertGreater(response.context['cl'].result_count, 100_000)
+
+    def test_booking_changelist_filtered(self):
+        response = self.get('/admin/booking_app/booking/?status__exact=cancelled')
+        self.assertLessEqual(response.context['cl'].result_count, 10_000)
+        self.get('/admin/booking_app/booking/?q=admin')
+
+    def test_booking_date_drilldown(self):
+        last = timezone.localtime(self.last_booked)
+        response = self.get(f'/admin/booking_app/booking/?booking_date__year={last.year}')
+        self.assertContains(response, f'booking_date__month={last.month}')
+        self.get(f'/admin/booking_app/booking/?booking_date__year={last.year}'
+                 f'&booking_date__month={last.month}&booking_date__day={last.day}')
+
+    def test_last_page(self):
+        self.get('/admin/booking_app/booking/?p=999')
+
+    def test_booking_change_form(self):
+        booking = Booking.objects.order_by('-id').first()
+        response = self.get(f'/admin/booking_app/booking/{booking.pk}/change/')
+        # Foreign keys are autocomplete widgets, not <select>s of every row.
+        self.assertContains(response, 'admin-autocomplete')
+
+    def test_travel_option_changelist(self):
+        get_city_index()
+        response = self.get('/admin/booking_app/traveloption/')
+        self.assertContains(response, 'Mumbai')
+        self.get('/admin/booking_app/traveloption/?travel_type__exact=train&q=TR1')
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        now = timezone.now()
+        self.travels = {}
+        for travel_id, days in [('OLD1', -60), ('OLD2', -45), ('RECENT', -5), ('NEXT', 3)]:
+            departure = now + timezone.timedelta(days=days)
+            self.travels[travel_id] = TravelOption.objects.create(
+                travel_id=travel_id,
+                travel_type="train",
+                source="Mumbai",
+                destination="Delhi",
+                departure_datetime=departure,
+                arrival_datetime=departure + timezone.timedelta(hours=16),
+                price=500.00,
+                available_seats=100
+            )
+        for hours, travel_id in enumerate(['OLD1', 'NEXT', 'OLD2', 'NEXT', 'OLD1', 'RECENT'] * 2):
+            booking = reserve_seats(self.user, self.travels[travel_id], 1)
+            Booking.objects.filter(pk=booking.pk).update(
+                booking_date=now - timezone.timedelta(days=70, hours=-hours))
+        self.client.login(username='testuser', password='password')
+
+    def test_archive_departed(self):
+        old = list(Booking.objects.filter(travel_option__travel_id__startswith='OLD')
+                   .order_by('id').values_list('id', 'booking_id', 'booking_date', 'status'))
+        self.assertEqual(archive_departed(chunk_size=1), (2, 6))
+        self.assertEqual(set(TravelOption.objects.values_list('travel_id', flat=True)),
+                         {'RECENT', 'NEXT'})
+        self.assertEqual(Booking.objects.count(), 6)
+        self.assertEqual(list(ArchivedBooking.objects.order_by('id').values_list(
+            'id', 'booking_id', 'booking_date', 'status')), old)
+        archived = ArchivedTravelOption.objects.get(travel_id='OLD1')
+        self.assertEqual(archived.pk, self.travels['OLD1'].pk)
+        self.assertEqual(archived.available_seats, 96)
+        self.assertEqual(archived.bookings.count(), 4)
+        self.assertEqual(archive_departed(), (0, 0))
+
+    def test_chunk_is_retried_when_a_booking_arrives_mid_chunk(self):
+        move_chunk = archive.move_chunk
+        attempts = []
+
+        def booking_arrives(cutoff, chunk_size):
+            attempts.append(cutoff)
+            if len(attempts) == 1:
+                # What the delete of a departure with a booking committed since the read raises.
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            return move_chunk(cutoff, chunk_size)
+
+        with mock.patch.object(archive, 'move_chunk', booking_arrives):
+            self.assertEqual(archive_departed(), (2, 6))
+        self.assertEqual(len(attempts), 3)
+
+        with mock.patch.object(archive, 'move_chunk', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                archive.archive_chunk(archive.archive_cutoff())
+
+    def test_booking_history_falls_back_to_archive(self):
+        expected = list(Booking.objects.order_by('-booking_date', '-id')
+                        .values_list('booking_id', flat=True))
+        archive_departed()
+        response = self.client.get('/bookings/')
+        page = response.context['bookings']
+        self.assertEqual([booking.booking_id for booking in page], expected[:8])
+        self.assertTrue(any(booking.archived for booking in page))
+        with query_budget(4, max_repeats=1):
+            response = self.client.get('/bookings/', {'cursor': page.next_cursor})
+        self.assertEqual([booking.booking_id for booking in response.context['bookings']],
+                         expected[8:])
+        response = self.client.get(
+            '/bookings/', {'cursor': response.context['bookings'].previous_cursor})
+        self.assertEqual([booking.booking_id for booking in response.context['bookings']],
+                         expected[:8])
+
+        archived = ArchivedBooking.objects.first()
+        response = self.client.get(f'/booking/{archived.booking_id}/')
+        self.assertContains(response, archived.travel_option.travel_id)
+        self.assertNotContains(response, 'Cancel Booking')
+        response = self.client.post(f'/booking/{archived.booking_id}/cancel/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/booking/BKMISSING/').status_code, 404)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command('archive_travel', '--days', '50', stdout=out)
+        self.assertRegex(out.getvalue(), r'Archived 1 travel options and 4 bookings .* rows/s')
+        self.assertFalse(TravelOption.objects.filter(travel_id='OLD1').exists())
+        self.assertTrue(TravelOption.objects.filter(travel_id='OLD2').exists())
+
+
+class JsonApiTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        departure = timezone.now() + timezone.timedelta(days=1)
+        self.travels = [TravelOption.objects.create(
+            travel_id=f"FL{i}",
+            travel_type="flight",
+            source="Mumbai",
+            destination="Delhi",
+            departure_datetime=departure + timezone.timedelta(hours=i),
+            arrival_datetime=departure + timezone.timedelta(hours=i + 2),
+            price=4500.00,
+            available_seats=60
+        ) for i in range(3)]
+        search_cache.reset()
+        get_city_index()
+
+    def test_search_with_fields_and_cursor(self):
+        response = self.client.get('/api/v1/travel/', {
+            'source': 'Mumbai', 'fields': 'travel_id,price,departure_datetime', 'limit': 2})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = response.json()
+        self.assertEqual(data['results'][0], {
+            'travel_id': 'FL0', 'price': '4500.00',
+            'departure_datetime': self.travels[0].departure_datetime.isoformat()})
+        self.assertEqual(len(data['results']), 2)
+        response = self.client.get('/api/v1/travel/', {
+            'source': 'Mumbai', 'limit': 2, 'cursor': data['next_cursor']})
+        self.assertEqual([row['travel_id'] for row in response.json()['results']], ['FL2'])
+        self.assertEqual(response.json()['results'][0]['available_seats'], 60)
+
+        self.assertEqual(self.client.get('/api/v1/travel/', {'fields': 'secret'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/travel/', {'limit': 'x'}).status_code, 400)
+
+    def test_search_conditional_get(self):
+        response = self.client.get('/api/v1/travel/', {'source': 'Mumbai'})
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=5', response['Cache-Control'])
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/travel/', {'source': 'Mumbai'},
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_seats(self.user, self.travels[0], 2)
+        response = self.client.get('/api/v1/travel/', {'source': 'Mumbai'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['available_seats'], 58)
+
+    def test_travel_detail(self):
+        url = '/api/v1/travel/FL1/'
+        response = self.client.get(url, {'fields': 'travel_id,available_seats'})
+        self.assertEqual(response.json(), {'travel_id': 'FL1', 'available_seats': 60})
+        etag = response['ETag']
+        response = self.client.get(url, {'fields': 'travel_id,available_seats'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Other fields, other representation.
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+        TravelOption.objects.filter(travel_id='FL1').update(
+            available_seats=59, updated_at=timezone.now())
+        response = self.client.get(url, {'fields': 'travel_id,available_seats'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/v1/travel/XX9/').status_code, 404)
+
+    def test_bookings(self):
+        self.assertEqual(self.client.get('/api/v1/bookings/').status_code, 401)
+        booking = reserve_seats(self.user, self.travels[1], 2)
+        self.client.login(username='testuser', password='password')
+        response = self.client.get('/api/v1/bookings/', {'fields': 'booking_id,status,travel_id'})
+        self.assertEqual(response.json()['results'], [
+            {'booking_id': booking.booking_id, 'status': 'confirmed', 'travel_id': 'FL1'}])
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+        response = self.client.get('/api/v1/bookings/', {'fields': 'booking_id,status,travel_id'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        booking.cancel()
+        response = self.client.get('/api/v1/bookings/', {'fields': 'booking_id,status,travel_id'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['results'][0]['status'], 'cancelled')
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password', is_staff=True, is_superuser=True)
+        self.other = User.objects.create_user('other', 'other@example.com', 'password')
+        now = timezone.now()
+        self.travels = {}
+        for travel_id, days in [('OLD', -60), ('NEXT', 2)]:
+            departure = now + timezone.timedelta(days=days)
+            self.travels[travel_id] = TravelOption.objects.create(
+                travel_id=travel_id,
+                travel_type="bus",
+                source="Pune",
+                destination="Goa",
+                departure_datetime=departure,
+                arrival_datetime=departure + timezone.timedelta(hours=10),
+                price=700.00,
+                available_seats=100
+            )
+        for travel_id in ['OLD', 'NEXT', 'NEXT', 'OLD', 'NEXT']:
+            reserve_seats(self.user, self.travels[travel_id], 1)
+        reserve_seats(self.other, self.travels['NEXT'], 3)
+        # Same booking_date everywhere: chunks must still page on id.
+        Booking.objects.update(booking_date=now - timezone.timedelta(days=70))
+        archive_departed()
+        self.client.login(username='testuser', password='password')
+
+    def rows(self, response):
+        self.assertTrue(response.streaming)
+        return list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_user_export_csv(self):
+        response = self.client.get('/bookings/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('attachment; filename="bookings.csv"', response['Content-Disposition'])
+        rows = self.rows(response)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual({row['username'] for row in rows}, {'testuser'})
+        self.assertEqual(sorted(row['travel_id'] for row in rows), ['NEXT'] * 3 + ['OLD'] * 2)
+        self.assertEqual(rows[0]['total_price'], '700.00')
+
+    def test_user_export_jsonl(self):
+        response = self.client.get('/bookings/export/', {'format': 'jsonl'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['source'], 'Pune')
+        self.assertEqual(self.client.get('/bookings/export/', {'format': 'xls'}).status_code, 400)
+
+    def test_chunks_cover_every_row_once(self):
+        bookings = Booking.objects.all()
+        chunks = list(keyset_chunks(bookings, ['booking_date', 'id'], chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2])
+        self.assertEqual([booking.pk for chunk in chunks for booking in chunk],
+                         list(bookings.order_by('id').values_list('id', flat=True)))
+        with self.assertNumQueries(3):
+            lines = list(stream_bookings([bookings], 'csv', chunk_size=2))
+        self.assertEqual(len(lines), 3)
+
+    def test_admin_actions(self):
+        response = self.client.post('/admin/booking_app/booking/', {
+            'action': 'export_bookings_csv', 'select_across': '1', 'index': '0',
+            '_selected_action': [Booking.objects.first().pk]})
+        self.assertEqual(len(self.rows(response)), 4)
+
+        response = self.client.post('/admin/booking_app/traveloption/', {
+            'action': 'export_bookings_jsonl', '_selected_action': [self.travels['NEXT'].pk]})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 4)
+
+        response = self.client.post('/admin/booking_app/archivedbooking/', {
+            'action': 'export_bookings_csv', 'select_across': '1', 'index': '0',
+            '_selected_action': [ArchivedBooking.objects.first().pk]})
+        self.assertEqual({row['travel_id'] for row in self.rows(response)}, {'OLD'})
+
+
+class TelemetryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('testuser', 'test@example.com', 'password')
+        TravelOption.objects.create(
+            travel_id="TR300",
+            travel_type="train",
+            source="Mumbai",
+            destination="Delhi",
+            departure_datetime=timezone.now() + timezone.timedelta(days=1),
+            arrival_datetime=timezone.now() + timezone.timedelta(days=1, hours=16),
+            price=1500.00,
+            available_seats=80
+        )
+        search_cache.reset()
+        request_metrics.reset()
+        self.addCleanup(request_metrics.reset)
+
+    def timings(self, response):
+        entries = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            entries[name] = dict(param.split('=', 1) for param in params)
+        return entries
+
+    def scrape(self, **headers):
+        with override_settings(TELEMETRY={**settings.TELEMETRY, 'METRICS_TOKEN': 'secret'}):
+            return self.client.get('/metrics', **headers)
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_timed_sessions_read_plain_sessions(self):
+        self.client.login(username='testuser', password='password')
+        self.assertEqual(self.client.get('/bookings/').status_code, 200)
+
+    def test_server_timing_phases(self):
+        timings = self.timings(self.client.get('/travel/'))
+        self.assertEqual(timings['db']['desc'], '"1 queries"')
+        self.assertIn('template', timings)
+        self.assertGreaterEqual(float(timings['total']['dur']), float(timings['db']['dur']))
+
+        response = self.client.post('/login/', {'username': 'testuser', 'password': 'password'})
+        timings = self.timings(response)
+        self.assertIn('password', timings)
+        self.assertIn('session', timings)
+
+    async def test_async_request(self):
+        response = await self.async_client.get('/travel/')
+        self.assertIn('template', self.timings(response))
+
+    def test_metrics_endpoint(self):
+        for _ in range(3):
+            self.client.get('/travel/')
+        self.client.get('/no-such-page/')
+        self.assertEqual(self.scrape().status_code, 403)
+        response = self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('booking_http_requests_total{view="travel_list",status="2xx"} 3', body)
+        self.assertIn('booking_http_requests_total{view="unresolved",status="4xx"} 1', body)
+        self.assertIn(
+            'booking_http_request_duration_seconds_bucket{view="travel_list",le="+Inf"} 3', body)
+        # Only the first search misses the search cache.
+        self.assertIn('booking_http_request_queries_bucket{view="travel_list",le="0"} 2', body)
+        self.assertIn('booking_http_request_queries_sum{view="travel_list"} 1', body)
+        self.assertIn('view="travel_list",quantile="0.99"', body)
+        self.assertIn('view="travel_list",phase="template"', body)
+
+    def test_workers_share_metrics_through_files(self):
+        other_worker = RequestMetrics()
+        other_worker.observe('travel_list', 200, 0.2, 4, {'db': 0.01})
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(TELEMETRY={**settings.TELEMETRY, 'DIR': directory}):
+                other_worker.flush()
+                self.client.get('/travel/')
+                totals = request_metrics.collect()
+            self.assertEqual(len(os.listdir(directory)), 2)
+        self.assertEqual(totals['travel_list']['status'], {'2xx': 2})
+        self.assertEqual(totals['travel_list']['queries_sum'], 5)
+
+    def test_quantile_estimate(self):
+        buckets = (0.1, 0.2, 0.4)
+        self.assertIsNone(quantile(0.5, buckets, [0, 0, 0, 0]))
+        self.assertAlmostEqual(quantile(0.5, buckets, [0, 10, 0, 0]), 0.15)
+        self.assertAlmostEqual(quantile(0.95, buckets, [50, 40, 8, 2]), 0.325)
+        self.assertEqual(quantile(0.99, buckets, [0, 0, 0, 5]), 0.4)
+
+
+class SeatShardTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password')
+        self.travel = TravelOption.objects.create(
+            travel_id="FL123",
+            travel_type="flight",
+            source="New York",
+            destination="London",
+            departure_datetime=timezone.now() + timezone.timedelta(days=1),
+            arrival_datetime=timezone.now() + timezone.timedelta(days=1, hours=8),
+            price=500.00,
+            available_seats=10
+        )
+        shard_seat_counter(self.travel.pk, 4)
+        self.travel.refresh_from_db()
+
+    def shard_seats(self):
+        return list(SeatShard.objects.filter(travel_option=self.travel)
+                    .order_by('shard').values_list('available_seats', flat=True))
+
+    def test_bookings_take_seats_from_one_shard(self):
+        self.assertEqual(self.travel.seat_shards, 4)
+        self.assertEqual(self.shard_seats(), [3, 3, 2, 2])
+        # One read of the shards, one conditional shard update and the
+        # booking insert, in a savepoint.
+        with self.assertNumQueries(5):
+            reserve_seats(self.user, self.travel, 2)
+        self.assertEqual(sum(self.shard_seats()), 8)
+        self.assertEqual(TravelOption.objects.get(pk=self.travel.pk).available_seats, 10)
+
+        self.assertEqual(rebalance_seat_shards(self.travel.pk)['seats'], 8)
+        self.assertEqual(TravelOption.objects.get(pk=self.travel.pk).available_seats, 8)
+
+    def test_fragmented_seats_and_sold_out(self):
+        SeatShard.objects.filter(travel_option=self.travel).update(available_seats=1)
+        reserve_seats(self.user, self.travel, 3)
+        self.assertEqual(sum(self.shard_seats()), 1)
+        with self.assertRaises(SoldOut):
+            reserve_seats(self.user, self.travel, 2)
+        reserve_seats(self.user, self.travel, 1)
+        self.assertEqual(self.shard_seats(), [0, 0, 0, 0])
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_cancel_and_rebalance(self):
+        bookings = [reserve_seats(self.user, self.travel, 2) for _ in range(4)]
+        self.assertEqual(sum(self.shard_seats()), 2)
+        for booking in bookings[:3]:
+            booking.cancel()
+        self.assertEqual(sum(self.shard_seats()), 8)
+
+        # A shard under half its share is evened out.
+        for shard, seats in enumerate([0, 1, 3, 4]):
+            SeatShard.objects.filter(travel_option=self.travel, shard=shard).update(
+                available_seats=seats)
+        self.assertEqual(rebalance_seat_shards(self.travel.pk), {'seats': 8, 'moved': 3})
+        self.assertEqual(self.shard_seats(), [2, 2, 2, 2])
+        self.assertEqual(TravelOption.objects.get(pk=self.travel.pk).available_seats, 8)
+        self.assertEqual(list(sharded_departures()), [self.travel.pk])
+
+    def test_drain_queue_takes_from_shards(self):
+        self.travel.queue_bookings = True
+        for _ in range(3):
+            enqueue_booking(self.user, self.travel, 4)
+        self.assertEqual(drain_booking_queue(self.travel.pk),
+                         {'confirmed': 2, 'rejected': 1, 'seats': 8})
+        self.assertEqual(sum(self.shard_seats()), 2)
+
+    def test_merge(self):
+        reserve_seats(self.user, self.travel, 3)
+        self.assertEqual(shard_seat_counter(self.travel.pk, 0), 7)
+        self.travel.refresh_from_db()
+        self.assertEqual((self.travel.seat_shards, self.travel.available_seats), (0, 7))
+        self.assertFalse(SeatShard.objects.exists())
+        reserve_seats(self.user, self.travel, 7)
+        self.travel.refresh_from_db()
+        self.assertEqual(self.travel.available_seats, 0)
+
+    def test_admin_split_action(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        shard_seat_counter(self.travel.pk, 0)
+        with override_settings(SEAT_SHARDS=2):
+            self.client.post('/admin/booking_app/traveloption/', {
+                'action': 'split_seat_counter', '_selected_action': [self.travel.pk]})
+        self.assertEqual(self.shard_seats(), [5, 5])
+        response = self.client.get(f'/admin/booking_app/traveloption/{self.travel.pk}/change/')
+        self.assertNotContains(response, 'name="available_seats"')
+
+
+class SeatMapTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'password')
+        self.travel = TravelOption.objects.create(
+            travel_id="BUS7",
+            travel_type="bus",
+            source="Pune",
+            destination="Goa",
+            departure_datetime=timezone.now() + timezone.timedelta(days=1),
+            arrival_datetime=timezone.now() + timezone.timedelta(days=1, hours=9),
+            price=600.00,
+            available_seats=10,
+            seats_per_row=4
+        )
+
+    def test_allocation(self):
+        seat_map = SeatMap.empty(10, 4)
+        self.assertEqual(seat_map.available(), 10)
+        self.assertEqual(seat_map.allocate(3), [0, 1, 2])
+        # Kept in one row, then run on over rows, then scattered.
+        self.assertEqual(seat_map.allocate(2), [4, 5])
+        self.assertEqual(seat_map.allocate(3), [6, 7, 8])
+        self.assertEqual(seat_map.allocate(2), [3, 9])
+        self.assertIsNone(seat_map.allocate(1))
+        seat_map.release(seat_map.indexes('2B 2A'))
+        self.assertEqual(seat_map.labels(seat_map.allocate(2)), '2A 2B')
+        self.assertEqual(SeatMap(seat_map.to_bytes(), 4).available(), 0)
+
+        train = SeatMap.empty(1200, 6)
+        for _ in range(199):
+            train.allocate(6)
+        self.assertEqual(train.labels(train.allocate(4)), '200A 200B 200C 200D')
+        self.assertEqual(train.allocate(2), [1198, 1199])
+        self.assertIsNone(train.allocate(1))
+
+    def test_bookings_get_seat_numbers(self):
+        # The departure row is locked, then the map, seats and booking written.
+        with self.assertNumQueries(5):
+            first = reserve_seats(self.user, self.travel, 3)
+        second = reserve_seats(self.user, self.travel, 2)
+        self.assertEqual((first.seat_numbers, second.seat_numbers), ('1A 1B 1C', '2A 2B'))
+        self.travel.refresh_from_db()
+        self.assertEqual(self.travel.available_seats, 5)
+
+        first.cancel()
+        self.travel.refresh_from_db()
+        self.assertEqual(self.travel.available_seats, 8)
+        self.assertEqual(reserve_seats(self.user, self.travel, 4).seat_numbers,
+                         '1A 1B 1C 1D')
+        with self.assertRaises(SoldOut):
+            reserve_seats(self.user, self.travel, 5)
+
+        self.client.login(username='testuser', password='password')
+        response = self.client.get(f'/booking/{second.booking_id}/')
+        self.assertContains(response, '2A 2B')
+
+    def test_assign_seat_map_to_booked_departure(self):
+        self.travel.seats_per_row = 0
+        self.travel.seat_map = None
+        self.travel.save()
+        booking = reserve_seats(self.user, self.travel, 2)
+        self.assertEqual(booking.seat_numbers, '')
+
+        self.assertEqual(assign_seat_map(self.travel.pk, 4).available(), 8)
+        booking.refresh_from_db()
+        self.assertEqual(booking.seat_numbers, '1A 1B')
+        self.travel.refresh_from_db()
+        self.assertEqual(reserve_seats(self.user, self.travel, 2).seat_numbers, '1C 1D')
+        with self.assertRaises(ValueError):
+            shard_seat_counter(self.travel.pk, 4)
+
+    def test_departure_inserted_without_a_map_gets_one_on_first_use(self):
+        self.travel.seats_per_row = 0
+        self.travel.seat_map = None
+        self.travel.save()
+        booking = reserve_seats(self.user, self.travel, 2)
+        # What bulk_create or a raw insert leaves: seats_per_row but no map.
+        TravelOption.objects.filter(pk=self.travel.pk).update(seats_per_row=4)
+        self.travel.refresh_from_db()
+
+        self.assertEqual(reserve_seats(self.user, self.travel, 1).seat_numbers, '1C')
+        booking.refresh_from_db()
+        self.assertEqual(booking.seat_numbers, '1A 1B')
+        booking.cancel()
+        self.travel.refresh_from_db()
+        self.assertEqual(self.travel.available_seats, 9)
+
+        TravelOption.objects.filter(pk=self.travel.pk).update(seat_map=None)
+        bookings = [enqueue_booking(self.user, self.travel, n) for n in (2, 9)]
+        self.assertEqual(drain_booking_queue(self.travel.pk),
+                         {'confirmed': 1, 'rejected': 1, 'seats': 2})
+        # The rebuilt map seats the confirmed booking first.
+        self.assertEqual(Booking.objects.get(pk=bookings[0].pk).seat_numbers, '1B 1C')
+
+    def test_drain_queue_assigns_seats(self):
+        bookings = [enqueue_booking(self.user, self.travel, n) for n in (4, 7, 6)]
+        self.assertEqual(drain_booking_queue(self.travel.pk),
+                         {'confirmed': 2, 'rejected': 1, 'seats': 10})
+        self.assertEqual([Booking.objects.get(pk=b.pk).seat_numbers for b in bookings],
+                         ['1A 1B 1C 1D', '', '2A 2B 2C 2D 3A 3B'])
+        self.travel.refresh_from_db()
+        self.assertEqual(self.travel.available_seats, 0)
+
+    def test_edit_keeps_seats_booked_since_loading(self):
+        stale = TravelOption.objects.get(pk=self.travel.pk)
+        reserve_seats(self.user, self.travel, 3)
+        stale.price = 650
+        stale.save()
+        self.travel.refresh_from_db()
+        self.assertEqual((self.travel.price, self.travel.available_seats), (650, 7))
+        self.assertEqual(reserve_seats(self.user, self.travel, 1).seat_numbers, '1D')
+
+        # The admin form doesn't post the seat count of an existing departure.
+        TravelOption.objects.filter(pk=self.travel.pk).update(seats_per_row=0, seat_map=None)
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get(f'/admin/booking_app/traveloption/{self.travel.pk}/change/')
+        self.assertNotContains(response, 'name="available_seats"')
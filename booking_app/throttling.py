@@ -0,0 +1,299 @@
+import asyncio
+import math
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+POLL_INTERVAL = 0.05
+PRUNE_INTERVAL = 60
+
+
+def parse_rate(rate):
+    """'10/m' -> tokens per second."""
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period]
+
+
+class LocalThrottleStore:
+    """Token buckets and concurrency counters for this process only.
+
+    A bucket that has refilled is the same as no bucket, so every
+    PRUNE_INTERVAL seconds full ones are dropped; otherwise every client
+    address ever seen would stay in memory.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._active = Counter()
+        self._lock = threading.Lock()
+        self._prune_at = time.monotonic() + PRUNE_INTERVAL
+
+    def take(self, key, rate, burst):
+        """Take a token; return 0 if one was free, else seconds until the next one."""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._prune_at:
+                self.prune(now)
+            tokens, last, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            return wait
+
+    def prune(self, now):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        self._prune_at = now + PRUNE_INTERVAL
+
+    def acquire(self, key, limit):
+        with self._lock:
+            if self._active[key] >= limit:
+                return False
+            self._active[key] += 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            self._active[key] -= 1
+            if self._active[key] <= 0:
+                del self._active[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._active.clear()
+
+
+class CacheThrottleStore:
+    """Buckets and counters in a Django cache shared by all workers.
+
+    Bucket updates are read-modify-write without a lock, so a burst racing
+    across workers can get a few more tokens than configured; concurrency
+    slots use the cache's incr/decr (atomic on Redis and Memcached) and
+    expire after ``slot_timeout`` seconds in case a worker dies holding one.
+    """
+
+    def __init__(self, alias='shared', slot_timeout=60):
+        self.cache = caches[alias]
+        self.slot_timeout = slot_timeout
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        tokens, last = self.cache.get(f'throttle:bucket:{key}', (burst, now))
+        tokens = min(burst, tokens + (now - last) * rate)
+        wait = 0 if tokens >= 1 else (1 - tokens) / rate
+        if not wait:
+            tokens -= 1
+        self.cache.set(f'throttle:bucket:{key}', (tokens, now), math.ceil(burst / rate) + 1)
+        return wait
+
+    def acquire(self, key, limit):
+        key = f'throttle:active:{key}'
+        self.cache.add(key, 0, self.slot_timeout)
+        if self.cache.incr(key) > limit:
+            self.cache.decr(key)
+            return False
+        return True
+
+    def release(self, key):
+        try:
+            self.cache.decr(f'throttle:active:{key}')
+        except ValueError:
+            pass
+
+    def clear(self):
+        # Entries can't be listed in a shared cache; they expire on their own.
+        pass
+
+
+class Throttled(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+
+
+class Throttle:
+    """Applies ``settings.THROTTLE['RULES']`` (url name -> list of rules).
+
+    Each rule has a ``key`` ('ip', 'user', 'travel_id' or 'global'),
+    optional ``methods``, and either ``rate`` ('10/m') with ``burst`` for a
+    token bucket, or ``concurrency`` with ``wait`` (seconds a request may
+    queue for a free slot) for a concurrency limit.
+
+    Counters live in the configured store. With LocalThrottleStore every
+    key, 'global' included, is counted per process: N workers admit N times
+    a global concurrency limit. Use CacheThrottleStore over a shared cache
+    for one limit across workers.
+    """
+
+    def __init__(self):
+        self._store = None
+        self.counters = Counter()
+
+    @property
+    def config(self):
+        return getattr(settings, 'THROTTLE', {})
+
+    @property
+    def store(self):
+        if self._store is None:
+            store_class = import_string(
+                self.config.get('STORE', 'booking_app.throttling.LocalThrottleStore'))
+            self._store = store_class(**self.config.get('OPTIONS', {}))
+        return self._store
+
+    def rules_for(self, request):
+        if not self.config.get('ENABLED', True):
+            return None, []
+        try:
+            match = resolve(request.path_info, getattr(request, 'urlconf', None))
+        except Resolver404:
+            return None, []
+        rules = [rule for rule in self.config.get('RULES', {}).get(match.view_name, [])
+                 if request.method in rule.get('methods', (request.method,))]
+        return match, rules
+
+    def client_ip(self, request):
+        """The address the nearest trusted proxy saw; earlier entries are the client's to forge."""
+        header = self.config.get('IP_HEADER')
+        if header and request.META.get(header):
+            hops = [hop.strip() for hop in request.META[header].split(',')]
+            return hops[-min(self.config.get('TRUSTED_PROXIES', 1), len(hops))]
+        return request.META.get('REMOTE_ADDR', '')
+
+    def key(self, rule, view_name, request, match, user):
+        if rule['key'] == 'user' and user is not None and user.is_authenticated:
+            value = f'user:{user.pk}'
+        elif rule['key'] == 'travel_id':
+            value = f"travel:{match.kwargs.get('travel_id')}"
+        elif rule['key'] == 'global':
+            value = 'global'
+        else:
+            value = f'ip:{self.client_ip(request)}'
+        kind = 'rate' if 'rate' in rule else 'concurrency'
+        return f'{view_name}:{kind}:{value}', f"{view_name}:{rule['key']}:{kind}"
+
+    def check_rates(self, rules, keys):
+        for rule, (key, name) in zip(rules, keys):
+            if 'rate' in rule:
+                retry_after = self.store.take(key, parse_rate(rule['rate']), rule.get('burst', 1))
+                if retry_after:
+                    self.counters[f'{name}:throttled'] += 1
+                    raise Throttled(retry_after)
+                self.counters[f'{name}:allowed'] += 1
+
+    def try_acquire(self, rules, keys, held):
+        """Acquire every concurrency slot not yet held; return the first one that is full."""
+        for rule, (key, name) in zip(rules, keys):
+            if 'concurrency' in rule and key not in held:
+                if not self.store.acquire(key, rule['concurrency']):
+                    return rule, name
+                held.append(key)
+        return None
+
+    def release(self, held):
+        for key in held:
+            self.store.release(key)
+
+    def stats(self):
+        return dict(sorted(self.counters.items()))
+
+    def reset(self):
+        self.store.clear()
+        self.counters.clear()
+
+
+throttle = Throttle()
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse(
+        'Too many requests. Please try again shortly.', status=429, content_type='text/plain')
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+class ThrottleMiddleware:
+    """Rate and concurrency limits for expensive views, see Throttle.
+
+    Requests over a rate get a 429 with Retry-After. Requests over a
+    concurrency limit wait up to the rule's ``wait`` seconds for a slot,
+    then get a 429. Must come after AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        match, rules = throttle.rules_for(request)
+        if not rules:
+            return self.get_response(request)
+        keys = [throttle.key(rule, match.view_name, request, match, request.user)
+                for rule in rules]
+        held = []
+        try:
+            throttle.check_rates(rules, keys)
+            deadline = None
+            while (full := throttle.try_acquire(rules, keys, held)) is not None:
+                deadline = self.queue(full, deadline)
+                time.sleep(POLL_INTERVAL)
+            return self.get_response(request)
+        except Throttled as e:
+            return too_many_requests(e.retry_after)
+        finally:
+            throttle.release(held)
+
+    async def __acall__(self, request):
+        match, rules = throttle.rules_for(request)
+        if not rules:
+            return await self.get_response(request)
+        user = await request.auser()
+        keys = [throttle.key(rule, match.view_name, request, match, user) for rule in rules]
+        held = []
+        try:
+            await self.run(throttle.check_rates, rules, keys)
+            deadline = None
+            while (full := await self.run(throttle.try_acquire, rules, keys, held)) is not None:
+                deadline = self.queue(full, deadline)
+                await asyncio.sleep(POLL_INTERVAL)
+            return await self.get_response(request)
+        except Throttled as e:
+            return too_many_requests(e.retry_after)
+        finally:
+            await self.run(throttle.release, held)
+
+    @staticmethod
+    async def run(method, *args):
+        # Only LocalThrottleStore is safe on the event loop; a cache store
+        # waits on the network or the database.
+        if isinstance(throttle.store, LocalThrottleStore):
+            return method(*args)
+        return await sync_to_async(method)(*args)
+
+    @staticmethod
+    def queue(full, deadline):
+        rule, name = full
+        now = time.monotonic()
+        if deadline is None:
+            deadline = now + rule.get('wait', 0)
+            if rule.get('wait'):
+                throttle.counters[f'{name}:queued'] += 1
+        if now >= deadline:
+            throttle.counters[f'{name}:rejected'] += 1
+            raise Throttled(POLL_INTERVAL)
+        return deadline
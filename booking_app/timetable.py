@@ -0,0 +1,223 @@
+import csv
+import json
+import os
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .fare_calendar import refresh_after_commit
+from .models import City, Route, TravelOption
+from .search_index import invalidate_city_index, normalize_city_name
+
+FIELDS = [
+    'travel_id', 'travel_type', 'source', 'destination',
+    'departure_datetime', 'arrival_datetime', 'price', 'available_seats',
+]
+UPDATE_FIELDS = [
+    'travel_type', 'source', 'destination', 'departure_datetime',
+    'arrival_datetime', 'price', 'route', 'updated_at',
+]
+
+
+class InvalidRow(Exception):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) for each record in a CSV or JSONL stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line, text in enumerate(stream, start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError as e:
+                    yield line, InvalidRow(line, f"invalid JSON ({e})")
+
+
+def clean_row(line, row):
+    """Validate a raw record against the TravelOption fields and return clean values."""
+    if isinstance(row, InvalidRow):
+        raise row
+    values = {}
+    for name in FIELDS:
+        field = TravelOption._meta.get_field(name)
+        raw = row.get(name)
+        if isinstance(raw, str):
+            raw = raw.strip()
+        try:
+            values[name] = field.clean(raw, None)
+        except ValidationError as e:
+            raise InvalidRow(line, f"{name}: {' '.join(e.messages)}")
+    for name in ('departure_datetime', 'arrival_datetime'):
+        if timezone.is_naive(values[name]):
+            values[name] = timezone.make_aware(values[name])
+    if values['arrival_datetime'] <= values['departure_datetime']:
+        raise InvalidRow(line, "arrival_datetime must be after departure_datetime")
+    values['source'] = ' '.join(values['source'].split())
+    values['destination'] = ' '.join(values['destination'].split())
+    return values
+
+
+class RouteResolver:
+    """Map (source, destination) names to Route ids in bulk.
+
+    Cities and routes are loaded once and missing ones are inserted a batch
+    at a time, so the import never does a lookup per row. Memory grows with
+    the number of distinct routes, not rows.
+    """
+
+    def __init__(self):
+        self.cities = {normalize_city_name(name): city_id
+                       for city_id, name in City.objects.values_list('id', 'name')}
+        self.routes = {(origin_id, destination_id): route_id
+                       for route_id, origin_id, destination_id
+                       in Route.objects.values_list('id', 'origin_id', 'destination_id')}
+
+    def resolve(self, rows):
+        """Return the route id of every row, creating cities and routes as needed."""
+        names = {}
+        for row in rows:
+            for name in (row['source'], row['destination']):
+                names.setdefault(normalize_city_name(name), name)
+        missing = [name for key, name in names.items() if key not in self.cities]
+        if missing:
+            City.objects.bulk_create(
+                [City(name=name) for name in missing], ignore_conflicts=True)
+            for city_id, name in City.objects.filter(name__in=missing).values_list('id', 'name'):
+                self.cities[normalize_city_name(name)] = city_id
+
+        pairs = {(self.cities[normalize_city_name(row['source'])],
+                  self.cities[normalize_city_name(row['destination'])]) for row in rows}
+        missing = [pair for pair in pairs if pair not in self.routes]
+        if missing:
+            Route.objects.bulk_create(
+                [Route(origin_id=o, destination_id=d) for o, d in missing],
+                ignore_conflicts=True)
+            origin_ids = {o for o, _ in missing}
+            for route_id, o, d in Route.objects.filter(origin_id__in=origin_ids).values_list(
+                    'id', 'origin_id', 'destination_id'):
+                self.routes[(o, d)] = route_id
+            # bulk_create skips the post_save handler that does this.
+            transaction.on_commit(invalidate_city_index)
+
+        return [self.routes[(self.cities[normalize_city_name(row['source'])],
+                             self.cities[normalize_city_name(row['destination'])])]
+                for row in rows]
+
+
+def upsert_batch(rows, resolver, update_seats=False):
+    """Insert or update one batch of clean rows keyed on travel_id.
+
+    Returns the set of route ids the batch touched.
+    """
+    # Later rows win when a travel_id repeats inside the batch.
+    rows = list({row['travel_id']: row for row in rows}.values())
+    with transaction.atomic():
+        route_ids = resolver.resolve(rows)
+        existing = TravelOption.objects.filter(
+            travel_id__in=[row['travel_id'] for row in rows]
+        ).values_list('route_id', 'travel_type', 'departure_datetime',
+                      'travel_id', 'seats_per_row', 'seat_shards')
+        if update_seats:
+            existing = existing.select_for_update()
+        existing = list(existing)
+        # Where updated departures sat in the fare calendar before.
+        old_fare_keys = [row[:3] for row in existing]
+        options = [TravelOption(route_id=route_id, **row)
+                   for row, route_id in zip(rows, route_ids)]
+        batches = [(options, UPDATE_FIELDS)]
+        if update_seats:
+            # Seats of a departure with a seat map or split counter follow
+            # the map or the shards; leave them.
+            keep_seats = {row[3] for row in existing if row[4] or row[5]}
+            batches = [
+                ([option for option in options if option.travel_id not in keep_seats],
+                 UPDATE_FIELDS + ['available_seats']),
+                ([option for option in options if option.travel_id in keep_seats],
+                 UPDATE_FIELDS),
+            ]
+        # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target.
+        unique_fields = (['travel_id'] if connection.features.supports_update_conflicts_with_target
+                         else None)
+        for batch, update_fields in batches:
+            if batch:
+                TravelOption.objects.bulk_create(
+                    batch, update_conflicts=True, unique_fields=unique_fields,
+                    update_fields=update_fields)
+        refresh_after_commit(old_fare_keys + [option.fare_key() for option in options])
+    return set(route_ids)
+
+
+class Checkpoint:
+    """Number of input records already imported, persisted after every batch."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            return json.load(f)['records']
+
+    def save(self, records):
+        if not self.path:
+            return
+        temp = f"{self.path}.tmp"
+        with open(temp, 'w') as f:
+            json.dump({'records': records}, f)
+        os.replace(temp, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def import_timetable(stream, fmt='csv', batch_size=5000, checkpoint=None,
+                     update_seats=False, max_errors=100, on_batch=None, on_error=None):
+    """Stream a timetable into TravelOption in batches of ``batch_size`` records.
+
+    Records already covered by ``checkpoint`` are skipped, so rerunning the
+    same input after a failure picks up after the last committed batch.
+    Returns a dict of counters.
+    """
+    checkpoint = checkpoint or Checkpoint(None)
+    skip = checkpoint.load()
+    records = read_rows(stream, fmt)
+    for _ in islice(records, skip):
+        pass
+
+    stats = {'skipped': skip, 'records': skip, 'imported': 0, 'invalid': 0}
+    resolver = RouteResolver()
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        rows = []
+        for line, row in batch:
+            try:
+                rows.append(clean_row(line, row))
+            except InvalidRow as e:
+                stats['invalid'] += 1
+                if on_error:
+                    on_error(e)
+                if stats['invalid'] > max_errors:
+                    raise
+        if rows:
+            upsert_batch(rows, resolver, update_seats)
+        stats['records'] += len(batch)
+        stats['imported'] += len(rows)
+        checkpoint.save(stats['records'])
+        if on_batch:
+            on_batch(stats)
+
+    checkpoint.clear()
+    return stats
@@ -1,16 +1,33 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, views
+
+if settings.ASYNC_VIEWS:
+    from . import async_views as read_views
+else:
+    read_views = views
 
 urlpatterns = [
-    path('', views.home, name='home'),
+    path('', read_views.home, name='home'),
     path('register/', views.register, name='register'),
     path('login/', views.user_login, name='login'),
     path('logout/', views.user_logout, name='logout'),
     path('profile/', views.profile, name='profile'),
-    path('travel/', views.travel_list, name='travel_list'),
+    path('travel/', read_views.travel_list, name='travel_list'),
+    path('travel/connections/', views.connection_search, name='connection_search'),
+    path('api/cities/', views.city_autocomplete, name='city_autocomplete'),
+    path('api/fares/', views.fare_calendar_api, name='fare_calendar'),
+    path('api/v1/travel/', api.travel_search, name='api_travel_search'),
+    path('api/v1/travel/<str:travel_id>/', api.travel_detail, name='api_travel_detail'),
+    path('api/v1/bookings/', api.booking_list, name='api_booking_list'),
+    path('stats/search-cache/', views.search_cache_stats, name='search_cache_stats'),
+    path('stats/db-pool/', views.db_pool_stats, name='db_pool_stats'),
+    path('stats/throttle/', views.throttle_stats, name='throttle_stats'),
+    path('metrics', views.metrics, name='metrics'),
     path('book/<str:travel_id>/', views.book_travel, name='book_travel'),
-    path('bookings/', views.booking_list, name='booking_list'),
-    path('booking/<str:booking_id>/', views.booking_detail, name='booking_detail'),
+    path('bookings/', read_views.booking_list, name='booking_list'),
+    path('bookings/export/', views.export_bookings, name='export_bookings'),
+    path('booking/<str:booking_id>/', read_views.booking_detail, name='booking_detail'),
     path('booking/<str:booking_id>/cancel/',
          views.cancel_booking, name='cancel_booking'),
 ]
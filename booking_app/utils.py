@@ -1,15 +1,275 @@
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from datetime import datetime, time, timedelta
 
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils import timezone
 
-def paginate_objects(request, queryset, items_per_page):
-    paginator = Paginator(queryset, items_per_page)
-    page = request.GET.get('page')
+CURSOR_SALT = 'booking_app.utils.cursor'
 
+
+def estimated_row_count(model, using='default'):
+    """The table's row count from the database statistics, or None if unknown.
+
+    Reads ``information_schema.TABLES`` on MySQL, ``pg_class`` on
+    PostgreSQL and ``sqlite_stat1`` (after ANALYZE) on SQLite; these are
+    maintained by the database and can be off by a few percent.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'mysql': ('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                  'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'),
+        'postgresql': 'SELECT reltuples FROM pg_class WHERE relname = %s',
+        # Every row of a table starts with its row count.
+        'sqlite': 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+    }
+    if connection.vendor not in queries:
+        return None
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(queries[connection.vendor], [table])
+            row = cursor.fetchone()
+        except DatabaseError:
+            # No sqlite_stat1 table before the first ANALYZE.
+            return None
+    if row is None or row[0] is None:
+        return None
+    count = int(str(row[0]).split()[0]) if connection.vendor == 'sqlite' else int(row[0])
+    return count if count >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for admin changelists over very large tables.
+
+    An unfiltered list takes its count from the table statistics once the
+    table holds more than ``estimate_above`` rows; a filtered one counts at
+    most ``count_limit`` rows, so pages past that limit aren't offered.
+    Either way no ``COUNT(*)`` reads the whole table.
+    """
+
+    estimate_above = 100_000
+    count_limit = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.estimate_above:
+                return estimate
+        return queryset.order_by()[:self.count_limit].count()
+
+
+class CursorPage:
+    """A page of results from paginate_by_cursor.
+
+    Only knows its neighbours through opaque cursor tokens; ``count`` is
+    None unless the caller asked for it.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def _encode_cursor(obj, fields, direction):
+    values = [getattr(obj, name) for name, _ in fields]
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value
+              for value in values]
+    return signing.dumps([direction, values], salt=CURSOR_SALT, compress=True)
+
+
+def _decode_cursor(token, model, fields):
+    if not token:
+        return None
     try:
-        objects_page = paginator.page(page)
-    except PageNotAnInteger:
-        objects_page = paginator.page(1)
-    except EmptyPage:
-        objects_page = paginator.page(paginator.num_pages)
+        direction, values = signing.loads(token, salt=CURSOR_SALT)
+        values = [model._meta.get_field(name).to_python(value)
+                  for (name, _), value in zip(fields, values, strict=True)]
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    if direction not in ('next', 'prev'):
+        return None
+    return direction, values
+
+
+def _seek(queryset, fields, values, after):
+    """Filter to rows strictly after (or before) ``values`` in ``fields`` order.
+
+    Written as ``a >= x AND (a > x OR b > y)`` rather than a plain OR so the
+    leading column stays a range predicate an index can seek on.
+    """
+    (first, first_desc), first_value = fields[0], values[0]
+    (second, second_desc), second_value = fields[1], values[1]
+    forward = after != first_desc
+    seek = queryset.model._default_manager.filter(
+        Q(**{f"{first}__{'gte' if forward else 'lte'}": first_value}),
+        Q(**{f"{first}__{'gt' if forward else 'lt'}": first_value})
+        | Q(**{f"{second}__{'gt' if after != second_desc else 'lt'}": second_value}))
+    # The seek predicate goes first in the WHERE clause: given two range
+    # bounds on the same column (e.g. also departure_datetime >= now()),
+    # SQLite only seeks on the first one it sees.
+    combined = seek & queryset
+    # & keeps only the left-hand side's select_related() and only().
+    combined.query.select_related = queryset.query.select_related
+    combined.query.deferred_loading = queryset.query.deferred_loading
+    return combined
+
+
+def _cursor_query(request, queryset, items_per_page, ordering):
+    if len(ordering) != 2:
+        raise ValueError("paginate_by_cursor expects a two-field ordering.")
+    fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    cursor = _decode_cursor(request.GET.get('cursor'), queryset.model, fields)
+    backwards = cursor is not None and cursor[0] == 'prev'
+
+    page_queryset = queryset
+    if cursor is not None:
+        page_queryset = _seek(queryset, fields, cursor[1], after=not backwards)
+    if backwards:
+        reverse = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+        page_queryset = page_queryset.order_by(*reverse)
+    else:
+        page_queryset = page_queryset.order_by(*ordering)
+    return page_queryset[:items_per_page + 1], fields, cursor, backwards
+
+
+def _cursor_page(rows, items_per_page, fields, cursor, backwards, count):
+    has_more = len(rows) > items_per_page
+    rows = rows[:items_per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = _encode_cursor(rows[-1], fields, 'next')
+        if (has_more and backwards) or (cursor is not None and not backwards):
+            previous_cursor = _encode_cursor(rows[0], fields, 'prev')
+    return CursorPage(rows, next_cursor, previous_cursor, count)
+
+
+def paginate_by_cursor(request, queryset, items_per_page, ordering, with_count=False):
+    """Keyset pagination over a ``[column, unique column]`` ordering,
+    e.g. ``['departure_datetime', 'id']`` or ``['-booking_date', '-id']``.
+
+    Each page is one indexed seek plus ``LIMIT items_per_page + 1``, so deep
+    pages cost the same as the first one and no ``COUNT(*)`` is run unless
+    ``with_count`` is set.
+    """
+    page_queryset, fields, cursor, backwards = _cursor_query(
+        request, queryset, items_per_page, ordering)
+    rows = list(page_queryset)
+    count = queryset.count() if with_count else None
+    return _cursor_page(rows, items_per_page, fields, cursor, backwards, count)
+
+
+async def apaginate_by_cursor(request, queryset, items_per_page, ordering, with_count=False):
+    """Async counterpart of paginate_by_cursor for async views."""
+    page_queryset, fields, cursor, backwards = _cursor_query(
+        request, queryset, items_per_page, ordering)
+    rows = [obj async for obj in page_queryset]
+    count = await queryset.acount() if with_count else None
+    return _cursor_page(rows, items_per_page, fields, cursor, backwards, count)
+
+
+def keyset_chunks(queryset, ordering, chunk_size=2000, fields=None):
+    """Yield every row of ``queryset`` as lists of up to ``chunk_size`` rows.
+
+    Rows come in ``ordering``, a ``[column, unique column]`` keyset as for
+    paginate_by_cursor, and each chunk is one indexed seek past the last
+    row. Unlike QuerySet.iterator(), which mysqlclient buffers whole on the
+    client, memory stays at one chunk however many rows there are. With
+    ``fields`` the rows are named tuples of those fields, which must
+    include the ordering columns.
+    """
+    keys = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    values = None
+    while True:
+        chunk = queryset if values is None else _seek(queryset, keys, values, after=True)
+        chunk = chunk.order_by(*ordering)
+        if fields is not None:
+            chunk = chunk.values_list(*fields, named=True)
+        rows = list(chunk[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        values = [getattr(rows[-1], name) for name, _ in keys]
+
+
+def _merge_rows(row_lists, items_per_page, fields, backwards):
+    directions = {descending for _, descending in fields}
+    if len(directions) != 1:
+        raise ValueError("Merged cursor pagination expects both fields in the same direction.")
+    rows = sorted((row for rows in row_lists for row in rows),
+                  key=lambda row: tuple(getattr(row, name) for name, _ in fields),
+                  reverse=directions.pop() != backwards)
+    return rows[:items_per_page + 1]
+
+
+def paginate_merged_by_cursor(request, querysets, items_per_page, ordering, with_count=False):
+    """paginate_by_cursor over several querysets read as one, e.g. live and
+    archived bookings.
+
+    Rows must never share an ordering key across querysets. Each queryset
+    is one indexed seek per page, and their pages are merged in Python.
+    """
+    queries = [_cursor_query(request, queryset, items_per_page, ordering)
+               for queryset in querysets]
+    _, fields, cursor, backwards = queries[0]
+    rows = _merge_rows([list(query[0]) for query in queries], items_per_page, fields, backwards)
+    count = sum(queryset.count() for queryset in querysets) if with_count else None
+    return _cursor_page(rows, items_per_page, fields, cursor, backwards, count)
+
+
+async def apaginate_merged_by_cursor(request, querysets, items_per_page, ordering,
+                                     with_count=False):
+    """Async counterpart of paginate_merged_by_cursor for async views."""
+    queries = [_cursor_query(request, queryset, items_per_page, ordering)
+               for queryset in querysets]
+    _, fields, cursor, backwards = queries[0]
+    row_lists = [[row async for row in query[0]] for query in queries]
+    rows = _merge_rows(row_lists, items_per_page, fields, backwards)
+    count = None
+    if with_count:
+        count = sum([await queryset.acount() for queryset in querysets])
+    return _cursor_page(rows, items_per_page, fields, cursor, backwards, count)
+
+
+def day_range(date):
+    """Return the [start, end) datetimes of a calendar day in the current timezone.
 
-    return objects_page, paginator
+    Filtering on this range instead of ``__date`` keeps the predicate
+    sargable, so it can use the departure_datetime indexes.
+    """
+    start = timezone.make_aware(datetime.combine(date, time.min))
+    return start, start + timedelta(days=1)
@@ -1,20 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.db.models import Q
+from django.http import (HttpResponse, HttpResponseBadRequest, HttpResponseForbidden,
+                         JsonResponse)
 from django.utils import timezone
-
-from booking_app.utils import paginate_objects
-from .models import TravelOption, Booking
+from django.utils.crypto import constant_time_compare
+
+from booking_app.backends.pool import pool_stats
+from booking_app.utils import paginate_by_cursor, paginate_merged_by_cursor, day_range
+from .exports import export_response, FORMATS as EXPORT_FORMATS
+from .fare_calendar import fare_calendar, DEFAULT_DAYS, MAX_DAYS
+from .journeys import find_itineraries
+from .search_cache import first_departure, search_cache
+from .search_index import get_city_index
+from .telemetry import metrics as request_metrics, render_metrics, telemetry_settings
+from .throttling import throttle
+from .services import (reserve_seats, enqueue_booking, takes_queued_bookings, SoldOut,
+                       upcoming_travel_options, search_travel_options)
+from .models import TravelOption, Booking, ArchivedBooking
 from .forms import UserRegistrationForm, UserProfileForm, TravelSearchForm, BookingForm
 
 
 def home(request):
-    travel_options = TravelOption.objects.filter(
-        departure_datetime__gte=timezone.now(),
-        available_seats__gt=0
-    )[:6]
+    travel_options = search_cache.get_or_set(
+        'home', {}, None, lambda: list(upcoming_travel_options()[:6]), first_departure)
     return render(request, 'booking_app/home.html', {'travel_options': travel_options})
 
 
@@ -67,38 +79,108 @@ def profile(request):
 
 def travel_list(request):
     form = TravelSearchForm(request.GET or None)
-    travel_options = TravelOption.objects.filter(
-        departure_datetime__gte=timezone.now(),
-        available_seats__gt=0
-    ).order_by('departure_datetime')
-
-    if form.is_valid():
-        travel_type = form.cleaned_data.get('travel_type')
-        source = form.cleaned_data.get('source')
-        destination = form.cleaned_data.get('destination')
-        departure_date = form.cleaned_data.get('departure_date')
-
-        if travel_type:
-            travel_options = travel_options.filter(travel_type=travel_type)
-        if source:
-            travel_options = travel_options.filter(source__icontains=source)
-        if destination:
-            travel_options = travel_options.filter(
-                destination__icontains=destination)
-        if departure_date:
-            travel_options = travel_options.filter(
-                departure_datetime__date=departure_date)
-
-    travel_options_page, paginator = paginate_objects(
-        request, travel_options, 8)
+    criteria = form.search_criteria() if form.is_valid() else {}
+    cursor = request.GET.get('cursor')
+
+    travel_options_page, calendar = search_cache.get_or_set(
+        'travel_list', {**criteria, 'cursor': cursor}, criteria.get('route_ids'),
+        lambda: (
+            paginate_by_cursor(
+                request, search_travel_options(criteria), 8, ['departure_datetime', 'id']),
+            fare_calendar(criteria) if criteria.get('route_ids') is not None else None),
+        lambda result: first_departure(result[0]))
 
     return render(request, 'booking_app/travel_list.html', {
         'travel_options': travel_options_page,
-        'form': form,
-        'paginator': paginator
+        'fare_calendar': calendar,
+        'fare_calendar_query': calendar_query(request),
+        'form': form
     })
 
 
+def calendar_query(request):
+    """The search's query string without the day and page, for the calendar's day links."""
+    query = request.GET.copy()
+    query.pop('departure_date', None)
+    query.pop('cursor', None)
+    return query.urlencode()
+
+
+def connection_search(request):
+    form = TravelSearchForm(request.GET or None)
+    itineraries = None
+    if (form.is_valid() and form.cleaned_data['origin_ids']
+            and form.cleaned_data['destination_ids']):
+        earliest = timezone.now()
+        if form.cleaned_data['departure_date']:
+            earliest = max(earliest, day_range(form.cleaned_data['departure_date'])[0])
+        itineraries = find_itineraries(
+            form.cleaned_data['origin_ids'], form.cleaned_data['destination_ids'], earliest,
+            travel_type=form.cleaned_data['travel_type'] or None)
+    return render(request, 'booking_app/connections.html', {
+        'itineraries': itineraries,
+        'form': form
+    })
+
+
+def fare_calendar_api(request):
+    form = TravelSearchForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    criteria = form.search_criteria()
+    if criteria['route_ids'] is None:
+        return JsonResponse({'errors': {'__all__': ['Give a source or destination.']}},
+                            status=400)
+    try:
+        days = min(max(int(request.GET.get('days', DEFAULT_DAYS)), 1), MAX_DAYS)
+    except ValueError:
+        return JsonResponse({'errors': {'days': ['Enter a whole number.']}}, status=400)
+
+    calendar = search_cache.get_or_set(
+        'fare_calendar', {**criteria, 'departure_date': None, 'days': days},
+        criteria['route_ids'], lambda: fare_calendar(criteria, days))
+    return JsonResponse({'days': [
+        {**day, 'date': day['date'].isoformat(),
+         'min_price': str(day['min_price']) if day['min_price'] is not None else None}
+        for day in calendar
+    ]})
+
+
+def city_autocomplete(request):
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        results = [{'id': city_id, 'name': name}
+                   for city_id, name in get_city_index().complete(query)]
+    return JsonResponse({'results': results})
+
+
+@staff_member_required
+def search_cache_stats(request):
+    return JsonResponse(search_cache.stats())
+
+
+@staff_member_required
+def db_pool_stats(request):
+    return JsonResponse(pool_stats())
+
+
+@staff_member_required
+def throttle_stats(request):
+    return JsonResponse(throttle.stats())
+
+
+def metrics(request):
+    """Prometheus metrics for every worker; see booking_app.telemetry."""
+    token = telemetry_settings()['METRICS_TOKEN']
+    authorized = token and constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (authorized or request.user.is_staff):
+        return HttpResponseForbidden('Forbidden', content_type='text/plain')
+    return HttpResponse(render_metrics(request_metrics.collect()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @login_required
 def book_travel(request, travel_id):
     travel_option = get_object_or_404(TravelOption, travel_id=travel_id)
@@ -107,23 +189,23 @@ def book_travel(request, travel_id):
         form = BookingForm(request.POST, travel_option=travel_option)
         if form.is_valid():
             number_of_seats = form.cleaned_data['number_of_seats']
-            total_price = travel_option.price * number_of_seats
-
-            booking = Booking(
-                user=request.user,
-                travel_option=travel_option,
-                number_of_seats=number_of_seats,
-                total_price=total_price
-            )
-            booking.save()
-
-            # Update available seats
-            travel_option.available_seats -= number_of_seats
-            travel_option.save()
-
-            messages.success(
-                request, f'Booking confirmed! Your booking ID is {booking.booking_id}')
-            return redirect('booking_list')
+            book = enqueue_booking if takes_queued_bookings(travel_option) else reserve_seats
+            try:
+                booking = book(request.user, travel_option, number_of_seats)
+            except SoldOut:
+                travel_option.refresh_from_db(fields=['available_seats'])
+                form.add_error(
+                    'number_of_seats',
+                    f"Sold out. Only {travel_option.available_seats} seats available.")
+            else:
+                if booking.status == 'pending':
+                    messages.info(
+                        request, f'Booking {booking.booking_id} received. '
+                                 f'We will confirm your seats in a moment.')
+                    return redirect('booking_detail', booking_id=booking.booking_id)
+                messages.success(
+                    request, f'Booking confirmed! Your booking ID is {booking.booking_id}')
+                return redirect('booking_list')
     else:
         form = BookingForm(travel_option=travel_option)
 
@@ -136,34 +218,53 @@ def book_travel(request, travel_id):
 @login_required
 def booking_list(request):
     bookings = Booking.objects.filter(
-        user=request.user).order_by('-booking_date')
+        user=request.user).select_related('travel_option')
+    archived = ArchivedBooking.objects.filter(
+        user=request.user).select_related('travel_option')
 
-    bookings_page, paginator = paginate_objects(request, bookings, 8)
+    bookings_page = paginate_merged_by_cursor(
+        request, [bookings, archived], 8, ['-booking_date', '-id'])
 
     return render(request, 'booking_app/booking_list.html', {
-        'bookings': bookings_page,
-        'paginator': paginator
+        'bookings': bookings_page
     })
 
 
+@login_required
+def export_bookings(request):
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"Unknown format: {export_format}")
+    return export_response([
+        Booking.objects.filter(user=request.user),
+        ArchivedBooking.objects.filter(user=request.user),
+    ], export_format, 'bookings')
+
+
 @login_required
 def booking_detail(request, booking_id):
-    booking = get_object_or_404(
-        Booking, booking_id=booking_id, user=request.user)
+    booking = Booking.objects.select_related('travel_option').filter(
+        booking_id=booking_id, user=request.user).first()
+    if booking is None:
+        # Bookings of departures that were archived (booking_app.archive).
+        booking = get_object_or_404(
+            ArchivedBooking.objects.select_related('travel_option'),
+            booking_id=booking_id, user=request.user)
     return render(request, 'booking_app/booking_detail.html', {'booking': booking})
 
 
 @login_required
 def cancel_booking(request, booking_id):
     booking = get_object_or_404(
-        Booking, booking_id=booking_id, user=request.user)
+        Booking.objects.select_related('travel_option'),
+        booking_id=booking_id, user=request.user)
 
-    if booking.status == 'confirmed':
+    if booking.status in ('confirmed', 'pending'):
         if booking.cancel():
             messages.success(request, 'Booking cancelled successfully.')
         else:
             messages.error(request, 'Unable to cancel booking.')
     else:
-        messages.error(request, 'Booking is already cancelled.')
+        messages.error(request, f'Booking is already {booking.get_status_display().lower()}.')
 
     return redirect('booking_list')
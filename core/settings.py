@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -21,7 +23,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-bno-yu#$mrfqk5a7)vt6pg)^ioxk+u8ahfwng91&r05ah0lnbb'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY', 'django-insecure-bno-yu#$mrfqk5a7)vt6pg)^ioxk+u8ahfwng91&r05ah0lnbb')
 
 
 ALLOWED_HOSTS = []
@@ -40,21 +43,33 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'booking_app.telemetry.TelemetryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'booking_app.querybudget.QueryBudgetMiddleware',
+    'booking_app.db_routing.ReplicaRoutingMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'booking_app.telemetry.TimedSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'booking_app.throttling.ThrottleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Serve home, travel_list, booking_list and booking_detail from the async
+# views (booking_app.async_views) when running under an ASGI server. The
+# rest of the stack is async-capable except WhiteNoise, which would push
+# every request back onto a thread, so static files are left to nginx.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+if ASYNC_VIEWS:
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'booking_app.telemetry.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -75,7 +90,10 @@ WSGI_APPLICATION = 'core.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # django.db.backends.mysql plus a per-process connection pool; see
+        # booking_app.backends.pool. DB_POOL_SIZE=0 opens a connection per
+        # request as before.
+        'ENGINE': 'booking_app.backends.mysql',
         'NAME': os.environ.get('MYSQL_DATABASE', 'travel_booking'),
         'USER': os.environ.get('MYSQL_USER', 'travel_user'),
         'PASSWORD': os.environ.get('MYSQL_PASSWORD', 'travel_password'),
@@ -85,9 +103,49 @@ DATABASES = {
             'charset': 'utf8mb4',
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
         },
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_SIZE', '10')),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', '5')),
+            'MAX_LIFETIME': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+            'HEALTH_CHECK_AFTER': 1.0,
+        },
     }
 }
 
+# Read replicas: every host in MYSQL_REPLICA_HOSTS (comma separated) becomes
+# an alias replica_1, replica_2, ... with the primary's credentials. Only
+# the views in REPLICA_READ_VIEWS read from them, and a client that wrote
+# anything stays on the primary for REPLICA_LAG seconds afterwards; set it
+# above the replication lag you expect.
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+        filter(None, os.environ.get('MYSQL_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['booking_app.db_routing.PrimaryReplicaRouter']
+REPLICA_LAG = float(os.environ.get('DATABASE_REPLICA_LAG', '2'))
+REPLICA_READ_VIEWS = [
+    'home', 'travel_list', 'city_autocomplete', 'booking_list', 'booking_detail',
+    'export_bookings',
+]
+
+
+# Caches: 'default' is per process; 'shared' is seen by every worker on
+# every host, for state that must not go stale between them (search cache
+# versions). It is the database cache table (manage.py createcachetable)
+# unless SHARED_CACHE_BACKEND and SHARED_CACHE_LOCATION point it at Redis
+# or Memcached, e.g. django.core.cache.backends.redis.RedisCache and
+# redis://redis:6379/1.
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {
+        'BACKEND': os.environ.get(
+            'SHARED_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.environ.get('SHARED_CACHE_LOCATION', 'django_cache'),
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -107,6 +165,16 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The default PBKDF2 hasher, timed for Server-Timing; it takes the place of
+# django.contrib.auth.hashers.PBKDF2PasswordHasher (same algorithm name).
+PASSWORD_HASHERS = [
+    'booking_app.telemetry.TimedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -133,6 +201,169 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 LOGIN_URL = '/login/'
 
+# Per-view query budgets (url name -> max queries per request), enforced by
+# booking_app.querybudget.QueryBudgetMiddleware. Over-budget requests and
+# query shapes repeated more than QUERY_BUDGET_MAX_REPEATS times are logged,
+# or raised when QUERY_BUDGET_STRICT is on. Each budget is what the view runs
+# on a cold worker with the database 'shared' cache, on_commit work included
+# (QueryBudgetTest.test_settings_budgets_cover_commit_work): one read of the
+# search cache versions, one of the city index version when resolving city
+# names, and for bookings and cancellations the fare calendar refresh (2)
+# and the version bump (3 per route and 3 for the global version).
+QUERY_BUDGETS = {
+    'home': 4,
+    'travel_list': 8,
+    'city_autocomplete': 3,
+    'fare_calendar': 5,
+    'book_travel': 13,
+    # Live and archived bookings are one query each.
+    'booking_list': 4,
+    # One more for an archived booking, looked up after missing the live one.
+    'booking_detail': 4,
+    'cancel_booking': 16,
+    # Building the city index on a cold worker reads cities and routes.
+    'api_travel_search': 5,
+    'api_travel_detail': 1,
+    # Live and archived bookings, as for booking_list.
+    'api_booking_list': 4,
+    # Changelist POSTs run the bulk cancellation action.
+    'admin:booking_app_traveloption_changelist': 21,
+}
+QUERY_BUDGET_DEFAULT = 12
+QUERY_BUDGET_MAX_REPEATS = 2
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', '0') == '1'
+
+# Result cache for home and travel_list. LocalLRUBackend keeps entries per
+# process and the version counters in the 'shared' cache, so a booking in
+# one worker invalidates the results of all of them. Entries expire after
+# TIMEOUT seconds or when their first departure leaves, if that is sooner.
+# booking_app.search_cache.DjangoCacheBackend (OPTIONS: {'alias': ...})
+# keeps the entries in a shared cache as well.
+SEARCH_CACHE = {
+    'BACKEND': os.environ.get(
+        'SEARCH_CACHE_BACKEND', 'booking_app.search_cache.LocalLRUBackend'),
+    'OPTIONS': {'max_entries': 2000, 'versions_alias': 'shared'},
+    'TIMEOUT': 300,
+    'ENABLED': os.environ.get('SEARCH_CACHE_ENABLED', '1') == '1',
+}
+
+# JSON API (booking_app.api): seconds that anonymous search and travel
+# option responses may be reused by nginx's micro-cache and by clients,
+# which then revalidate with If-None-Match.
+API = {
+    'SEARCH_MAX_AGE': int(os.environ.get('API_SEARCH_MAX_AGE', '5')),
+    'DETAIL_MAX_AGE': 5,
+}
+
+# Sessions live in the django_session table, so logging out or changing the
+# password ends them everywhere. SESSION_STORAGE=cached_db and cache keep
+# them in the 'shared' cache as well or only. SESSION_STORAGE=signed_cookies
+# keeps them out of the server entirely, but then a session can't be revoked
+# before it expires; it needs DJANGO_SECRET_KEY set outside DEBUG. Flash
+# messages live in their own cookie.
+SESSION_STORAGE = os.environ.get('SESSION_STORAGE', 'db')
+SESSION_ENGINE = {
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'db': 'django.contrib.sessions.backends.db',
+}[SESSION_STORAGE]
+SESSION_CACHE_ALIAS = 'shared'
+MESSAGE_STORAGE = os.environ.get(
+    'MESSAGE_STORAGE', 'django.contrib.messages.storage.cookie.CookieStorage')
+
+# Set AUTH_USER_CACHE_ALIAS to a cache shared by all workers (Redis or
+# Memcached, see CACHES) to load request.user through it; entries are
+# dropped when the user is saved, so deactivations and password changes
+# apply at once everywhere. booking_app.auth_backends.CachedModelBackend
+# refuses a per-process cache.
+AUTH_USER_CACHE_ALIAS = os.environ.get('AUTH_USER_CACHE_ALIAS', '')
+AUTHENTICATION_BACKENDS = [
+    'booking_app.auth_backends.CachedModelBackend' if AUTH_USER_CACHE_ALIAS
+    else 'django.contrib.auth.backends.ModelBackend']
+AUTH_USER_CACHE_TIMEOUT = 60
+
+# Admission control for the views that can starve a worker: password
+# hashing on login/register, seat locking on book_travel and booking
+# exports. Rate rules answer 429 with Retry-After; concurrency rules queue a
+# request for up to "wait" seconds before answering 429. LocalThrottleStore
+# counts per process, so the 'global' concurrency limits below hold per
+# worker (WEB_CONCURRENCY workers admit that many times as many);
+# booking_app.throttling.CacheThrottleStore shares limits between workers
+# through the 'shared' cache. Set THROTTLE_IP_HEADER (e.g. HTTP_X_REAL_IP)
+# when running behind nginx, or every client shares the proxy's address.
+THROTTLE = {
+    'ENABLED': os.environ.get('THROTTLE_ENABLED', '1') == '1',
+    'STORE': os.environ.get('THROTTLE_STORE', 'booking_app.throttling.LocalThrottleStore'),
+    'OPTIONS': {},
+    'IP_HEADER': os.environ.get('THROTTLE_IP_HEADER') or None,
+    # Proxies that append to IP_HEADER; the client is the hop the outermost one added.
+    'TRUSTED_PROXIES': int(os.environ.get('THROTTLE_TRUSTED_PROXIES', 1)),
+    'RULES': {
+        'login': [
+            {'key': 'ip', 'rate': '10/m', 'burst': 10, 'methods': ['POST']},
+            {'key': 'global', 'concurrency': 4, 'wait': 2, 'methods': ['POST']},
+        ],
+        'register': [
+            {'key': 'ip', 'rate': '5/m', 'burst': 5, 'methods': ['POST']},
+            {'key': 'global', 'concurrency': 4, 'wait': 2, 'methods': ['POST']},
+        ],
+        'export_bookings': [
+            {'key': 'user', 'rate': '6/m', 'burst': 3},
+        ],
+        'book_travel': [
+            {'key': 'user', 'rate': '20/m', 'burst': 5, 'methods': ['POST']},
+            {'key': 'travel_id', 'concurrency': 8, 'wait': 3, 'methods': ['POST']},
+        ],
+    },
+}
+
+# Connection search (travel/connections/): itineraries with up to
+# MAX_CHANGES changes, MIN_LAYOVER minutes before boarding each travel type,
+# over departures within HORIZON_HOURS of the first. Each worker keeps the
+# timetable in memory and catches up on changes every REFRESH_INTERVAL
+# seconds; see booking_app.journeys.
+CONNECTION_SEARCH = {
+    'MAX_CHANGES': int(os.environ.get('CONNECTION_MAX_CHANGES', '2')),
+    'MIN_LAYOVER': {'flight': 60, 'train': 15, 'bus': 15},
+    'HORIZON_HOURS': 48,
+    'RESULTS': 5,
+    'REFRESH_INTERVAL': 5,
+}
+
+# Queue bookings for every departure, not just those with queue_bookings set.
+# Pending bookings are confirmed by the process_booking_queue command.
+BOOKING_QUEUE_ALL = os.environ.get('BOOKING_QUEUE_ALL', '0') == '1'
+
+# Shards the admin's "Split the seat counter" action spreads a departure's
+# seats over; bookings then update one shard row each instead of all the
+# same travel option row. Run rebalance_seat_shards alongside.
+SEAT_SHARDS = int(os.environ.get('SEAT_SHARDS', '8'))
+
+# Departures are moved to the archive tables this many days after they
+# leave, by the archive_travel command (run it daily). Booking history reads
+# both the live and the archive tables.
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '30'))
+
+# Request telemetry (booking_app.telemetry): a Server-Timing header with
+# SQL, template, password hashing and session time on every response, and
+# per-view latency and query-count histograms at /metrics (Prometheus text
+# format). Workers share their histograms through files in TELEMETRY_DIR;
+# without it /metrics only shows the worker that answers. Scrapers send
+# TELEMETRY_METRICS_TOKEN as a bearer token; staff users need none.
+TELEMETRY = {
+    'ENABLED': os.environ.get('TELEMETRY_ENABLED', '1') == '1',
+    'SERVER_TIMING': os.environ.get('TELEMETRY_SERVER_TIMING', '1') == '1',
+    'DIR': os.environ.get('TELEMETRY_DIR') or None,
+    'FLUSH_INTERVAL': 5,
+    'METRICS_TOKEN': os.environ.get('TELEMETRY_METRICS_TOKEN') or None,
+}
+
+# Booking ids are generated in-process, so every process that writes bookings
+# needs its own worker id (0-1023). Unset, each process leases a free one from
+# the BookingIdWorker table; only set it for a single process per id.
+BOOKING_ID_WORKER_ID = os.environ.get('BOOKING_ID_WORKER_ID')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -155,3 +386,9 @@ if os.environ.get('DJANGO_DEBUG', '1') == '0':
 else:
     DEBUG = True
     ALLOWED_HOSTS = ['*']
+
+if (SESSION_STORAGE == 'signed_cookies' and not DEBUG
+        and SECRET_KEY.startswith('django-insecure-')):
+    raise ImproperlyConfigured(
+        "SESSION_STORAGE=signed_cookies signs sessions with SECRET_KEY; "
+        "set DJANGO_SECRET_KEY to a secret of your own.")
@@ -0,0 +1,33 @@
+"""Settings for load-testing a local server on SQLite (see benchmarks/load.py):
+
+    export DJANGO_SETTINGS_MODULE=core.settings_bench
+    python manage.py migrate
+    python manage.py createcachetable
+    python -m benchmarks.dataset --tier 10k --seed 1 --reset
+    python -m benchmarks.load --serve
+
+Leave DJANGO_SETTINGS_MODULE unset to benchmark the MySQL from core.settings
+instead.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+
+# Write transactions take SQLite's lock when they begin and wait up to
+# `timeout` seconds for it. With the default deferred BEGIN, concurrent
+# bookings and cancellations fail with "database is locked" instead.
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCH_SQLITE_PATH', BASE_DIR / 'bench.sqlite3'),  # noqa: F405
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
+    },
+}
+DATABASE_REPLICAS = []
+
+# Every virtual user logs in from the same address.
+THROTTLE = {**THROTTLE, 'ENABLED': False}  # noqa: F405
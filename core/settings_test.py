@@ -0,0 +1,47 @@
+"""
+Settings for running the test suite without MySQL:
+
+    python manage.py test --settings=core.settings_test
+
+The ``replica`` alias mirrors ``default``, as a real replica would, so the
+read/write routing can be exercised locally.
+"""
+
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# Shared between processes like the production cache, but without adding
+# cache table queries to the ones the tests count.
+CACHES = {
+    **CACHES,  # noqa: F405
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='travel-booking-cache-'),
+    },
+}
+
+# Tests opt in to replica reads with override_settings.
+DATABASE_REPLICAS = []
+
+# Limits would carry over between tests; throttling tests enable them.
+THROTTLE = {**THROTTLE, 'ENABLED': False}  # noqa: F405
+
+# One test process; leasing would need a second connection to the test
+# database while a test holds it in a transaction.
+BOOKING_ID_WORKER_ID = 0
+
+# Any request over its QUERY_BUDGETS entry fails the test that made it.
+QUERY_BUDGET_STRICT = True
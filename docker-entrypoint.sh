@@ -9,6 +9,7 @@ echo "MySQL is ready!"
 # Run database migrations
 echo "Running database migrations..."
 python manage.py migrate --noinput
+python manage.py createcachetable
 
 # Populating dummy data
 echo "Creating superuser..."
@@ -18,7 +19,16 @@ python populate_data.py
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
+# Per-worker request metrics, added up by /metrics; start from zero
+export TELEMETRY_DIR="${TELEMETRY_DIR:-/tmp/telemetry}"
+mkdir -p "$TELEMETRY_DIR" && rm -f "$TELEMETRY_DIR"/metrics-*.json
+
 # Start application
+if [ "$APP_SERVER" = "asgi" ]; then
+  echo "Starting Django application with Uvicorn..."
+  export ASYNC_VIEWS=1
+  exec uvicorn core.asgi:application --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-2}"
+fi
 echo "Starting Django application with Gunicorn..."
 # exec gunicorn core.wsgi:application --bind 0.0.0.0:8000 --workers 2 --timeout 120 --preload
 exec python manage.py runserver 0.0.0.0:8000
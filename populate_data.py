@@ -10,6 +10,7 @@ django.setup()
 from django.utils import timezone
 from django.contrib.auth.models import User
 from booking_app.models import TravelOption, Booking  # Replace with your app name
+from booking_app.services import reserve_seats, SoldOut
 
 # India-specific cities and airports
 INDIAN_CITIES = [
@@ -141,24 +142,16 @@ def create_sample_bookings(num_bookings=20):
         if not travel_option.is_available(number_of_seats):
             continue
 
-        total_price = travel_option.price * number_of_seats
-
         try:
-            booking = Booking.objects.create(
-                user=user,
-                travel_option=travel_option,
-                number_of_seats=number_of_seats,
-                total_price=total_price
-            )
-
-            # Update available seats
+            reserve_seats(user, travel_option, number_of_seats)
             travel_option.available_seats -= number_of_seats
-            travel_option.save()
 
             bookings_created += 1
             print(
                 f"Created booking: {user.username} - {travel_option.travel_id} ({number_of_seats} seats)")
 
+        except SoldOut:
+            continue
         except Exception as e:
             print(f"Error creating booking: {e}")
 